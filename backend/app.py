@@ -12,6 +12,14 @@ from config import Config
 from diesel_api import diesel_api_bp
 from hydrogen_api import hydrogen_api_bp
 from auth_api import auth_api_bp
+from batch_api import batch_api_bp
+from fleet_api import fleet_api_bp
+from models_api import models_api_bp
+from route_stream import route_stream_bp
+from jobs_api import jobs_api_bp
+from metrics_api import metrics_api_bp
+from model_registry import model_registry
+import warmup
 
 app = Flask(__name__)
 app.config.from_object(Config)  
@@ -56,6 +64,18 @@ app.register_blueprint(diesel_api_bp)
 app.register_blueprint(hydrogen_api_bp)
 app.register_blueprint(auth_api_bp) 
 app.register_blueprint(electric_api_bp)
+app.register_blueprint(batch_api_bp)
+app.register_blueprint(fleet_api_bp)
+app.register_blueprint(models_api_bp)
+app.register_blueprint(route_stream_bp)
+app.register_blueprint(jobs_api_bp)
+app.register_blueprint(metrics_api_bp)
+
+if Config.MODEL_PRELOAD:
+    model_registry.warm_up()
+
+if Config.WARMUP_ON_START:
+    warmup.start_background()
   
 
 @app.errorhandler(404)
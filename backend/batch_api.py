@@ -0,0 +1,182 @@
+import contextvars
+import json
+import time
+import traceback
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Tuple
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from werkzeug.datastructures import MultiDict
+from config import Config
+from model_registry import model_registry
+from task_graph import AbortRequest, error_body, is_rate_limited
+from response_format import compact_payload
+from metrics import stage_timer
+from diesel_api import parse_diesel_request, build_diesel_context_graph, diesel_feature_values, build_diesel_response
+from hydrogen_api import (
+    parse_hydrogen_request, build_hydrogen_context_graph, hydrogen_feature_values, prefetch_station_route,
+    map_route, build_hydrogen_response
+)
+
+batch_api_bp = Blueprint('batch_api', __name__)
+
+# Runs whole O-D contexts (each of which fans out on the stage pool) and the per-job finishing work.
+_batch_executor = ThreadPoolExecutor(max_workers=Config.BATCH_WORKERS, thread_name_prefix='batch')
+
+# How one vehicle family is costed in a batch:
+#   parse(form) -> params
+#   context_graph(params) -> TaskGraph of the stages shared by jobs with the same context key
+#   feature_values(params, context) -> model input for one job
+#   finish(params, context, prediction) -> the same response body /api/<kind>/route returns
+BatchKind = namedtuple('BatchKind', 'name,model,parse,context_graph,feature_values,finish')
+
+
+def context_key(params: Dict[str, Any]) -> Hashable:
+    # Routing, traffic and weather only depend on where the job starts and ends and on the date.
+    if params["origin_lat"] is not None and params["origin_lon"] is not None:
+        origin = (params["origin_lat"], params["origin_lon"])
+    else:
+        origin = params["origin_depot_name"]
+    return origin, params["destination_depot"], params["target_date"]
+
+
+def finish_diesel(params: Dict[str, Any], context: Dict[str, Any], prediction: float) -> Dict[str, Any]:
+    return build_diesel_response(params, dict(context, prediction=prediction))
+
+
+def finish_hydrogen(params: Dict[str, Any], context: Dict[str, Any], prediction: float) -> Dict[str, Any]:
+    # The map route depends on the job's own fuel level and prediction, so it is resolved per job.
+    station_route = prefetch_station_route(params, context['origin'], context['map_destination'])
+    results = dict(context, prediction=prediction, station_route=station_route)
+    results['map_route'] = map_route(params, context['origin'], context['map_destination'], context['analysis'],
+                                     prediction, station_route)
+    return build_hydrogen_response(params, results)
+
+
+DIESEL_BATCH = BatchKind(
+    'diesel', 'fossil', parse_diesel_request, build_diesel_context_graph,
+    lambda params, context: diesel_feature_values(params, context['origin'][1], context['analysis'], context['weather']),
+    finish_diesel,
+)
+HYDROGEN_BATCH = BatchKind(
+    'hydrogen', 'hydrogen', parse_hydrogen_request, build_hydrogen_context_graph,
+    lambda params, context: hydrogen_feature_values(params, context['origin'][1], context['nearest_station'],
+                                                    context['analysis'], context['weather']),
+    finish_hydrogen,
+)
+
+
+def job_failure(index: int, exc: BaseException) -> Dict[str, Any]:
+    # Same error bodies as the single-route endpoints, tagged with the job's position.
+    if not isinstance(exc, AbortRequest) and not is_rate_limited(exc):
+        print(f"Error in batch job {index}: {exc}\n{''.join(traceback.format_exception(type(exc), exc, exc.__traceback__))}")
+    return dict({"index": index}, **error_body(exc))
+
+
+def ndjson(line: Dict[str, Any]) -> str:
+    with stage_timer('serialize'):
+        return json.dumps(line) + "\n"
+
+
+def _submit(fn: Callable, *args):
+    return _batch_executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _run_context(kind: BatchKind, params: Dict[str, Any]) -> Dict[str, Any]:
+    return kind.context_graph(params).run()
+
+
+def parse_jobs(kind: BatchKind, jobs: List[Any]) -> Tuple[List[Tuple[int, Dict[str, Any]]], List[Dict[str, Any]]]:
+    # Each job is the JSON form of a single-route request and goes through the same parser.
+    parsed, failures = [], []
+    for index, job in enumerate(jobs):
+        try:
+            if not isinstance(job, dict):
+                raise AbortRequest("Each job must be a JSON object")
+            parsed.append((index, kind.parse(MultiDict(job))))
+        except Exception as exc:
+            failures.append(job_failure(index, exc))
+    return parsed, failures
+
+
+def stream_batch(kind: BatchKind, jobs: List[Any], compact: bool = False) -> Iterator[str]:
+    # One NDJSON line per job, in completion order. Parse errors and failed contexts are
+    # reported as soon as they are known; all remaining jobs are predicted with one model call.
+    start = time.perf_counter()
+    parsed, failures = parse_jobs(kind, jobs)
+    failed = len(failures)
+    for failure in failures:
+        yield ndjson(failure)
+
+    groups: Dict[Hashable, List[Tuple[int, Dict[str, Any]]]] = OrderedDict()
+    for index, params in parsed:
+        groups.setdefault(context_key(params), []).append((index, params))
+
+    ready = []
+    futures, finishing = {}, {}
+    try:
+        futures = {_submit(_run_context, kind, group[0][1]): key for key, group in groups.items()}
+        for future in as_completed(futures):
+            group = groups[futures[future]]
+            try:
+                context = future.result()
+            except Exception as exc:
+                failed += len(group)
+                for index, _ in group:
+                    yield ndjson(job_failure(index, exc))
+                continue
+            for index, params in group:
+                try:
+                    ready.append((index, params, context, kind.feature_values(params, context)))
+                except Exception as exc:
+                    failed += 1
+                    yield ndjson(job_failure(index, exc))
+
+        predictions = []
+        try:
+            predictions = model_registry.get(kind.model).predict_many([values for _, _, _, values in ready])
+        except Exception as exc:
+            # Fail the jobs rather than the stream, so the client still gets every job and the summary.
+            failed += len(ready)
+            for index, _, _, _ in ready:
+                yield ndjson(job_failure(index, exc))
+        finishing = {_submit(kind.finish, params, context, float(prediction)): index
+                     for (index, params, context, _), prediction in zip(ready, predictions)}
+        for future in as_completed(finishing):
+            index = finishing[future]
+            try:
+                result = future.result()
+                yield ndjson(dict({"index": index}, **(compact_payload(result) if compact else result)))
+            except Exception as exc:
+                failed += 1
+                yield ndjson(job_failure(index, exc))
+    finally:
+        # A client that disconnects closes the generator; don't leave its work on the shared pool.
+        for future in list(futures) + list(finishing):
+            future.cancel()
+
+    elapsed = time.perf_counter() - start
+    print(f"[BATCH] {kind.name}: {len(jobs)} jobs, {len(groups)} contexts, {failed} failed in {elapsed:.3f}s")
+    yield ndjson({"done": True, "jobs": len(jobs), "contexts": len(groups), "succeeded": len(jobs) - failed, "failed": failed})
+
+
+def batch_response(kind: BatchKind):
+    jobs = request.get_json(silent=True)
+    if not isinstance(jobs, list):
+        return jsonify({"success": False, "error": "Request body must be a JSON array of jobs"}), 400
+    if not jobs:
+        return jsonify({"success": False, "error": "No jobs in batch"}), 400
+    if len(jobs) > Config.BATCH_MAX_JOBS:
+        return jsonify({"success": False, "error": f"Too many jobs in batch (max {Config.BATCH_MAX_JOBS})"}), 400
+    compact = request.args.get('format') == 'compact'
+    return Response(stream_with_context(stream_batch(kind, jobs, compact)), mimetype='application/x-ndjson')
+
+
+@batch_api_bp.route('/api/diesel/batch', methods=['POST'])
+def diesel_batch_api():
+    return batch_response(DIESEL_BATCH)
+
+
+@batch_api_bp.route('/api/hydrogen/batch', methods=['POST'])
+def hydrogen_batch_api():
+    return batch_response(HYDROGEN_BATCH)
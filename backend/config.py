@@ -17,6 +17,73 @@ class Config:
 
     DATABASE_PATH = os.environ.get("DATABASE_PATH", "users.db")
 
+    STATION_SEARCH_WORKERS = int(os.environ.get("STATION_SEARCH_WORKERS", "6"))
+    STATION_DB_PATH = os.environ.get("STATION_DB_PATH", "stations.db")
+    STATION_COVERAGE_KM = float(os.environ.get("STATION_COVERAGE_KM", "5"))
+    # Stations and discover queries older than this are searched for again; 0 keeps them forever
+    STATION_MAX_AGE_DAYS = float(os.environ.get("STATION_MAX_AGE_DAYS", "30"))
+
+    GEOCODE_CACHE_PATH = os.environ.get("GEOCODE_CACHE_PATH", "geocode_cache.db")
+    GEOCODE_CACHE_SIZE = int(os.environ.get("GEOCODE_CACHE_SIZE", "1024"))
+
+    ROUTE_CACHE_MAX_BYTES = int(os.environ.get("ROUTE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    ROUTE_CACHE_TTL = int(os.environ.get("ROUTE_CACHE_TTL", str(6 * 60 * 60)))
+    ROUTE_CACHE_PRECISION = int(os.environ.get("ROUTE_CACHE_PRECISION", "4"))
+
+    ROUTE_STORE_PATH = os.environ.get("ROUTE_STORE_PATH", "route_store.db")
+    ROUTE_STORE_TTL = int(os.environ.get("ROUTE_STORE_TTL", str(30 * 24 * 60 * 60)))
+    ROUTE_STORE_MEMORY_SIZE = int(os.environ.get("ROUTE_STORE_MEMORY_SIZE", "4096"))
+    ROUTE_STORE_MISS_TTL = int(os.environ.get("ROUTE_STORE_MISS_TTL", "300"))
+    WARMUP_ON_START = os.environ.get("WARMUP_ON_START", "False") == "True"
+    WARMUP_WORKERS = int(os.environ.get("WARMUP_WORKERS", "2"))
+
+    # Tolerance used for `zoom` requests, in screen pixels
+    SIMPLIFY_PIXELS = float(os.environ.get("SIMPLIFY_PIXELS", "1.0"))
+    SIMPLIFY_CACHE_SIZE = int(os.environ.get("SIMPLIFY_CACHE_SIZE", "256"))
+
+    # Responses smaller than this are sent uncompressed
+    COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+    GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+    BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "5"))
+
+    WEATHER_MAX_WORKERS = int(os.environ.get("WEATHER_MAX_WORKERS", "8"))
+    WEATHER_CELL_DEG = float(os.environ.get("WEATHER_CELL_DEG", "0.25"))
+    WEATHER_REFRESH_SECONDS = int(os.environ.get("WEATHER_REFRESH_SECONDS", "3600"))
+
+    STAGE_WORKERS = int(os.environ.get("STAGE_WORKERS", "16"))
+
+    HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", str(max(STAGE_WORKERS, STATION_SEARCH_WORKERS, WEATHER_MAX_WORKERS))))
+    HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "3.05"))
+    HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "15"))
+    HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "2"))
+    HTTP_BACKOFF_BASE = float(os.environ.get("HTTP_BACKOFF_BASE", "0.25"))
+    HTTP_MAX_RETRY_WAIT = float(os.environ.get("HTTP_MAX_RETRY_WAIT", "5"))
+
+    # "<requests per second>/<burst>" per provider; empty disables the limiter for it, except
+    # for providers with a usage policy (Nominatim), which stay at their policy limit
+    RATE_LIMIT_HERE = os.environ.get("RATE_LIMIT_HERE", "10/10")
+    RATE_LIMIT_MAPBOX = os.environ.get("RATE_LIMIT_MAPBOX", "5/10")
+    RATE_LIMIT_WEATHERAPI = os.environ.get("RATE_LIMIT_WEATHERAPI", "10/20")
+    RATE_LIMIT_MAPS_CO = os.environ.get("RATE_LIMIT_MAPS_CO", "1/2")
+    RATE_LIMIT_NOMINATIM = os.environ.get("RATE_LIMIT_NOMINATIM", "1/1")
+    RATE_LIMIT_MAX_WAIT = float(os.environ.get("RATE_LIMIT_MAX_WAIT", "3"))
+
+    FUEL_PRICES_SNAPSHOT_PATH = os.environ.get("FUEL_PRICES_SNAPSHOT_PATH", "fuel_prices_snapshot.json")
+    FUEL_PRICES_REFRESH_SECONDS = int(os.environ.get("FUEL_PRICES_REFRESH_SECONDS", str(60 * 60)))
+    FUEL_PRICE_SEARCH_KM = float(os.environ.get("FUEL_PRICE_SEARCH_KM", "25"))
+    FUEL_PRICE_CELL_DEG = float(os.environ.get("FUEL_PRICE_CELL_DEG", "0.1"))
+
+    BATCH_MAX_JOBS = int(os.environ.get("BATCH_MAX_JOBS", "100"))
+    BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "4"))
+
+    # Route requests made with mode=job run on this pool; finished results are kept JOB_RESULT_TTL seconds
+    JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+    JOB_QUEUE_MAX = int(os.environ.get("JOB_QUEUE_MAX", "200"))
+    JOB_RESULT_TTL = int(os.environ.get("JOB_RESULT_TTL", str(10 * 60)))
+
+    # Load every registered model when the app is imported (before a preforking server forks)
+    MODEL_PRELOAD = os.environ.get("MODEL_PRELOAD", "True") == "True"
+
     # Default values for prod; don't touch this
     # gets overwritten in app.py during dev
     DEBUG = os.environ.get("DEBUG", "False") == "True"
\ No newline at end of file
@@ -1,15 +1,21 @@
 from flask import Blueprint, request, jsonify
 from geopy.distance import geodesic
-from tracking import get_coordinates as geocode_maps_co, calculate_distances, get_route_traffic_data, get_weather_data
+from tracking import get_coordinates as geocode_maps_co, get_route_analysis, get_weather_data
 from diesel_routing_here import get_here_directions, get_coordinates as here_get_coordinates, get_fuel_station_coordinates, get_route_with_fuel_stations
-import joblib
-import pandas as pd
-import numpy as np
 import random
-import requests
 import traceback
+from typing import Any, Dict, List, Tuple
 from config import Config
 from requests.exceptions import HTTPError
+from task_graph import AbortRequest, TaskGraph
+from polyline_simplify import parse_simplify_params, simplify_route
+from response_format import json_response
+from jobs_api import submit_route_job, wants_job
+from single_flight import route_flight, route_request_key
+from fuel_prices import fuel_prices
+from model_registry import model_registry
+from metrics import stage_timer
+from route_geometry import RouteGeometry, nearest_index
 
 KNOWN_DEPOT_COORDS = {
     'London': (51.5074, -0.1278),
@@ -22,23 +28,6 @@ KNOWN_DEPOT_COORDS = {
     'Aberdeen': (57.1497, -2.0943)
 }
 
-model = joblib.load('Fossil_model.pkl')
-url = "https://fuel.motorfuelgroup.com/fuel_prices_data.json"
-try:
-    response = requests.get(url)
-    fuel_data = response.json() if response.status_code == 200 else None
-except Exception as e:
-    print(f"Warning: Failed to fetch fuel price data: {e}")
-    fuel_data = None
-def get_average_diesel_price_by_city(data, city):
-    if not data or not city: return 175.9
-    city_upper = city.upper()
-    prices = [
-        station["prices"].get("B7") for station in data.get("stations", [])
-        if city_upper in station.get("address", "").upper() and station.get("prices", {}).get("B7")
-    ]
-    return sum(prices) / len(prices) if prices else 175.9
-
 diesel_api_bp = Blueprint('diesel_api', __name__)
 
 vehicle_type_encoded = ['DAF XF 105.510', 'DAF XG 530', 'IVECO EuroCargo ml180e28', 'IVECO NP 460', 'MAN TGM 18.250', 'MAN TGX 18.400', 'SCANIA G 460', 'SCANIA R 450', 'VOLVO FH 520', 'VOLVO FL 420']
@@ -49,6 +38,13 @@ temp_encoded = {'low': 0, 'medium': 1, 'high': 2}
 precipitation_encoded = {'low': 0, 'medium': 1, 'high': 2}
 snow_encoded = {'low': 0, 'medium': 1, 'high': 2}
 
+DIESEL_FEATURES = [
+    "Vehicle_age", "Goods_weight", "Total_distance_miles", "Avg_traffic_congestion", "Avg_temp",
+    "Avg_Precipitation", "Avg_snow", "Origin_depot", "Destination_depot", "Avg_Speed_mph",
+    "Distance_highway", "Distance_city", "dispatch_time", "total_payload"
+] + vehicle_type_encoded
+model_registry.register('fossil', 'Fossil_model.pkl', DIESEL_FEATURES)
+
 def convert_time_to_window(time_str):
     try:
         hours = int(time_str.split(':')[0])
@@ -59,248 +55,330 @@ def convert_time_to_window(time_str):
         print(f"Warning: Invalid dispatchTime format '{time_str}'. Defaulting to 'noon'.")
         return "noon"
 
-@diesel_api_bp.route('/api/diesel/route', methods=['POST'])
-def diesel_route_api():
+def parse_diesel_request(form) -> Dict[str, Any]:
     try:
-        try:
-            pallets = request.form.get('pallets', type=float, default=20.0)
-            vehicle_type = request.form.get('vehicleModel', 'VOLVO FH 520')
-            destination_depot = request.form['destinationDepot']
-            vehicle_age = request.form.get('vehicleAge', type=float, default=3.0)
-            dispatch_time_str = request.form.get('dispatchTime', '12:00:00')
-            target_date = request.form['journeyDate']
-        except KeyError as e:
-            return jsonify({"success": False, "error": f"Missing required form field: {e}"}), 400
-        except ValueError as e:
-            return jsonify({"success": False, "error": f"Invalid numeric value in form field: {e}"}), 400
-
-        origin_lat = request.form.get('originLat', type=float)
-        origin_lon = request.form.get('originLon', type=float)
-        origin_depot_name = request.form.get('originDepot')
-
-        start_coords = None
-        origin_for_model = None
-        origin_display_name = None
-
-        if origin_lat is not None and origin_lon is not None:
-            start_coords = (origin_lat, origin_lon)
-            origin_display_name = "Current Location (GPS)"
-            print(f"Using GPS origin: {start_coords}")
-
-            min_distance = float('inf')
-            nearest_depot_name = None
-            input_gps_coords = start_coords
-
-            print("Calculating nearest known depot for model input...")
-            if not KNOWN_DEPOT_COORDS:
-                 print("Warning: KNOWN_DEPOT_COORDS is empty. Cannot find nearest depot.")
-            else:
-                for depot_name, depot_coords in KNOWN_DEPOT_COORDS.items():
-                    try:
-                        if isinstance(depot_coords, (list, tuple)) and len(depot_coords) == 2:
-                             distance = geodesic(input_gps_coords, depot_coords).miles
-                             if distance < min_distance:
-                                 min_distance = distance
-                                 nearest_depot_name = depot_name
-                        else:
-                             print(f"Warning: Invalid coordinate format for depot '{depot_name}': {depot_coords}")
-                    except ValueError as e:
-                         print(f"Warning: Could not calculate distance to depot '{depot_name}' (coords: {depot_coords}): {e}")
-                    except Exception as e:
-                         print(f"Warning: Unexpected error calculating distance to depot '{depot_name}': {e}")
-
-            origin_for_model = nearest_depot_name if nearest_depot_name else 'London'
-            if nearest_depot_name:
-                print(f"GPS Coordinates {input_gps_coords} mapped to nearest depot for model: '{origin_for_model}' (Distance: {min_distance:.2f} miles)")
-            else:
-                print(f"Could not determine nearest depot. Defaulting model origin to '{origin_for_model}'.")
-
-        elif origin_depot_name:
-            origin_for_model = origin_depot_name
-            origin_display_name = origin_depot_name
-            coords_result = here_get_coordinates(f"{origin_depot_name}, UK", Config.HERE_API_KEY)
-            if coords_result and coords_result[0] is not None:
-                 start_coords = coords_result
-                 print(f"Using Depot origin: {origin_depot_name}, Coords (HERE): {start_coords}")
-            else:
-                 print(f"Warning: HERE geocode failed for {origin_depot_name}, trying fallback (Geocode.maps.co).")
-                 start_coords = geocode_maps_co(f"{origin_depot_name}, UK")
-                 if not (start_coords and start_coords[0] is not None):
-                      return jsonify({"success": False, "error": f"Could not geocode origin depot: {origin_depot_name}"}), 400
-                 print(f"Using Depot origin (fallback geocode): {origin_depot_name}, Coords: {start_coords}")
-        else:
-            return jsonify({"success": False, "error": "Missing origin information (GPS coordinates or originDepot name)"}), 400
-
-        if not destination_depot: return jsonify({"success": False, "error": "Missing destination depot"}), 400
-        if not target_date: return jsonify({"success": False, "error": "Missing journey date"}), 400
-        dest_coords = here_get_coordinates(f"{destination_depot}, UK", Config.HERE_API_KEY)
-        if not dest_coords or dest_coords[0] is None:
-            print(f"Warning: HERE geocode failed for destination {destination_depot}, trying fallback.")
-            dest_coords = geocode_maps_co(f"{destination_depot}, UK")
-            if not (dest_coords and dest_coords[0] is not None):
-                return jsonify({"success": False, "error": f"Could not geocode destination depot: {destination_depot}"}), 400
-            print(f"Destination (fallback geocode): {destination_depot}, Coords: {dest_coords}")
-        else:
-             print(f"Destination: {destination_depot}, Coords (HERE): {dest_coords}")
-
-
-        dispatch_time = convert_time_to_window(dispatch_time_str)
-        total_payload = pallets * 0.88
-        goods_weight = total_payload
-        api_key = Config.HERE_API_KEY
-
-        try:
-            _, direct_polyline_points, fuel_station_coords = get_route_with_fuel_stations(
-                 api_key,
-                 origin_coords=start_coords,
-                 destination_coords=dest_coords
-            )
-        except ValueError as ve:
-             print(f"Error getting route/stations from HERE: {ve}")
-             return jsonify({"success": False, "error": f"Failed to calculate route: {ve}"}), 500
-        except Exception as e_route:
-             print(f"Unexpected error in get_route_with_fuel_stations: {e_route}")
-             return jsonify({"success": False, "error": f"Failed to calculate route: {str(e_route)}"}), 500
-
-
-        route_points_for_response = direct_polyline_points if direct_polyline_points else []
-        station_points = [{"name": f"Fuel Station {i+1}", "coordinates": coord} for i, coord in enumerate(fuel_station_coords)]
-
-        combined_route_points = []
-        if fuel_station_coords:
-             origin_coords_str = f"{start_coords[0]},{start_coords[1]}"
-             dest_coords_str = f"{dest_coords[0]},{dest_coords[1]}"
-             first_station_str = f"{fuel_station_coords[0][0]},{fuel_station_coords[0][1]}"
-             origin_to_first = get_here_directions(origin_coords_str, first_station_str, api_key)
-             if origin_to_first: combined_route_points.extend(origin_to_first)
-
-             for i in range(len(fuel_station_coords) - 1):
-                 current_str = f"{fuel_station_coords[i][0]},{fuel_station_coords[i][1]}"
-                 next_s_str = f"{fuel_station_coords[i+1][0]},{fuel_station_coords[i+1][1]}"
-                 station_to_station = get_here_directions(current_str, next_s_str, api_key)
-                 if station_to_station: combined_route_points.extend(station_to_station)
-
-             last_station_str = f"{fuel_station_coords[-1][0]},{fuel_station_coords[-1][1]}"
-             last_to_dest = get_here_directions(last_station_str, dest_coords_str, api_key)
-             if last_to_dest: combined_route_points.extend(last_to_dest)
-
-             if combined_route_points:
-                  route_points_for_response = combined_route_points
-             else:
-                  print("Warning: Failed to generate combined route through stations, using direct route.")
-
-
-        city_distance, highway_distance = calculate_distances(start_coords, dest_coords)
-
-        route_coordinates_for_weather, traffic_delay = get_route_traffic_data(start_coords, dest_coords)
-        traffic_severity = "high" if traffic_delay > 30 else "medium" if traffic_delay > 7 else "low"
-
-        weather_api_key = Config.WEATHER_API_KEY
-        average_temperature, snow_classification, rain_classification = get_weather_data(weather_api_key, route_coordinates_for_weather, target_date)
-
-
-        encoded_origin = origin_encoded.get(origin_for_model, origin_encoded['London'])
-        encoded_destination = origin_encoded.get(destination_depot, -1)
-        encoded_dispatch_time = dispatch_encoded.get(dispatch_time, -1)
-        encoded_avg_traffic_congestion = traffic_congestion_encoded.get(traffic_severity.lower(), -1)
-        temp_cat = "high" if average_temperature > 15 else "low" if average_temperature < 5 else "medium"
-        encoded_avg_temp = temp_encoded.get(temp_cat, 1)
-        encoded_avg_precipitation = precipitation_encoded.get(rain_classification.lower(), -1)
-        encoded_avg_snow = snow_encoded.get(snow_classification.lower(), -1)
-        dummy_variables = {vehicle: (1 if vehicle == vehicle_type else 0) for vehicle in vehicle_type_encoded}
-
-        input_data = {
-            "Vehicle_age": [vehicle_age], "Goods_weight": [goods_weight],
-            "Total_distance_miles": [city_distance + highway_distance],
-            "Avg_traffic_congestion": [encoded_avg_traffic_congestion],
-            "Avg_temp": [encoded_avg_temp], "Avg_Precipitation": [encoded_avg_precipitation],
-            "Avg_snow": [encoded_avg_snow],
-            "Origin_depot": [encoded_origin],
-            "Destination_depot": [encoded_destination], "Avg_Speed_mph": [65],
-            "Distance_highway": [highway_distance], "Distance_city": [city_distance],
-            "dispatch_time": [encoded_dispatch_time], "total_payload": [total_payload]
+        params = {
+            "pallets": form.get('pallets', type=float, default=20.0),
+            "vehicle_type": form.get('vehicleModel', 'VOLVO FH 520'),
+            "destination_depot": form['destinationDepot'],
+            "vehicle_age": form.get('vehicleAge', type=float, default=3.0),
+            "dispatch_time_str": form.get('dispatchTime', '12:00:00'),
+            "target_date": form['journeyDate'],
         }
-        input_data.update(dummy_variables)
-        raw_input_df = pd.DataFrame(input_data)
-
-        try:
-             prediction = model.predict(raw_input_df)
-        except AttributeError as e:
-             if hasattr(model, '_Booster'):
-                  prediction = model._Booster.predict(raw_input_df)
-             else:
-                  print(f"Error during prediction: Model object type is {type(model)}")
-                  raise
-        efficiency_prediction = prediction[0] if prediction else 0
-
-
-        total_dist = city_distance + highway_distance
-        total_required_fuel = total_dist / efficiency_prediction if efficiency_prediction else float('inf')
-        fuel_price = get_average_diesel_price_by_city(fuel_data, origin_for_model)
-        fuel_price_per_gallon = (fuel_price / 100) * 4.54
-        total_fuel_cost = total_required_fuel * fuel_price_per_gallon
-        cost_per_mile = total_fuel_cost / total_dist if total_dist > 0 else 0
-        overhead_cost = total_fuel_cost * 0.1
-        total_final_cost = total_fuel_cost + overhead_cost
-
-
-        feature_importance_data = []
-        if hasattr(model, 'feature_importances_'):
-            importances = model.feature_importances_
-            feature_names = list(raw_input_df.columns)
-            sorted_idx = np.argsort(importances)[::-1][:8]
-            top_8_idx = [i for i in sorted_idx if i < len(feature_names)]
-            feature_importance_data = [{"name": feature_names[i], "value": float(importances[i])} for i in top_8_idx]
-        elif hasattr(model, '_Booster') and hasattr(model._Booster, 'get_score'):
+    except KeyError as e:
+        raise AbortRequest(f"Missing required form field: {e}")
+    except ValueError as e:
+        raise AbortRequest(f"Invalid numeric value in form field: {e}")
+
+    params["origin_lat"] = form.get('originLat', type=float)
+    params["origin_lon"] = form.get('originLon', type=float)
+    params["origin_depot_name"] = form.get('originDepot')
+    params["feature_importance_version"] = form.get('featureImportanceVersion')
+    params.update(parse_simplify_params(form))
+
+    has_gps = params["origin_lat"] is not None and params["origin_lon"] is not None
+    if not has_gps and not params["origin_depot_name"]:
+        raise AbortRequest("Missing origin information (GPS coordinates or originDepot name)")
+    if not params["destination_depot"]: raise AbortRequest("Missing destination depot")
+    if not params["target_date"]: raise AbortRequest("Missing journey date")
+    return params
+
+
+def nearest_known_depot(input_gps_coords: Tuple[float, float]) -> str:
+    min_distance = float('inf')
+    nearest_depot_name = None
+
+    print("Calculating nearest known depot for model input...")
+    if not KNOWN_DEPOT_COORDS:
+         print("Warning: KNOWN_DEPOT_COORDS is empty. Cannot find nearest depot.")
+    else:
+        for depot_name, depot_coords in KNOWN_DEPOT_COORDS.items():
             try:
-                fscore = model._Booster.get_score(importance_type='weight')
-                if fscore:
-                    sorted_features = sorted(fscore.items(), key=lambda item: item[1], reverse=True)
-                    top_features = sorted_features[:8]
-                    feature_importance_data = [{"name": name, "value": float(score)} for name, score in top_features]
-                else: print("Warning: Model booster get_score returned empty.")
-            except Exception as fi_err: print(f"Warning: Could not get feature importance from model booster: {fi_err}")
-        else: print("Warning: Model does not have 'feature_importances_' or recognized booster method for importance.")
-
-
-        good_value_fuel = random.uniform(1.0, total_fuel_cost if total_fuel_cost > 1 else 10)
-        insurance_fuel_cost = random.uniform(1.0, good_value_fuel)
-        goods_loading_time = random.randint(10, 60)
-        is_goods_secured = random.choice(['✔️', '❌'])
-        check_safety = random.choice(['✔️', '❌'])
-
-        response = {
-            "success": True,
-            "route": {
-                "origin": origin_display_name,
-                "destination": destination_depot,
-                "coordinates": route_points_for_response,
-                "stations": station_points,
-                "total_distance": round(total_dist, 2)
-            },
-            "analytics": {
-                 "average_temperature": round(average_temperature, 2),
-                 "rain_classification": rain_classification,
-                 "snow_classification": snow_classification,
-                 "highway_distance": round(highway_distance, 2),
-                 "city_distance": round(city_distance, 2),
-                 "efficiency_prediction": round(efficiency_prediction, 2),
-                 "total_required_fuel": round(total_required_fuel, 2) if total_required_fuel != float('inf') else "Infinity",
-                 "total_fuel_cost": round(total_fuel_cost, 2) if total_required_fuel != float('inf') else "Infinity",
-                 "cost_per_mile": round(cost_per_mile, 2) if total_dist > 0 else 0,
-                 "overhead_cost": round(overhead_cost, 2) if total_required_fuel != float('inf') else "Infinity",
-                 "total_final_cost": round(total_final_cost, 2) if total_required_fuel != float('inf') else "Infinity",
-                 "fuel_price": round(fuel_price, 2),
-                 "good_value_fuel": round(good_value_fuel, 2),
-                 "insurance_fuel_cost": round(insurance_fuel_cost, 2),
-                 "goods_loading_time": goods_loading_time,
-                 "is_goods_secured": is_goods_secured,
-                 "check_safety": check_safety,
-                 "featureImportance": feature_importance_data
-            }
+                if isinstance(depot_coords, (list, tuple)) and len(depot_coords) == 2:
+                     distance = geodesic(input_gps_coords, depot_coords).miles
+                     if distance < min_distance:
+                         min_distance = distance
+                         nearest_depot_name = depot_name
+                else:
+                     print(f"Warning: Invalid coordinate format for depot '{depot_name}': {depot_coords}")
+            except ValueError as e:
+                 print(f"Warning: Could not calculate distance to depot '{depot_name}' (coords: {depot_coords}): {e}")
+            except Exception as e:
+                 print(f"Warning: Unexpected error calculating distance to depot '{depot_name}': {e}")
+
+    origin_for_model = nearest_depot_name if nearest_depot_name else 'London'
+    if nearest_depot_name:
+        print(f"GPS Coordinates {input_gps_coords} mapped to nearest depot for model: '{origin_for_model}' (Distance: {min_distance:.2f} miles)")
+    else:
+        print(f"Could not determine nearest depot. Defaulting model origin to '{origin_for_model}'.")
+    return origin_for_model
+
+
+def geocode_depot(depot_name: str, role: str) -> Tuple[float, float]:
+    coords = here_get_coordinates(f"{depot_name}, UK", Config.HERE_API_KEY)
+    if coords and coords[0] is not None:
+        print(f"Using {role} depot: {depot_name}, Coords (HERE): {coords}")
+        return coords
+    print(f"Warning: HERE geocode failed for {role} {depot_name}, trying fallback (Geocode.maps.co).")
+    coords = geocode_maps_co(f"{depot_name}, UK")
+    if not (coords and coords[0] is not None):
+        raise AbortRequest(f"Could not geocode {role} depot: {depot_name}")
+    print(f"Using {role} depot (fallback geocode): {depot_name}, Coords: {coords}")
+    return coords
+
+
+def resolve_origin(params: Dict[str, Any]) -> Tuple[Tuple[float, float], str, str]:
+    # (coordinates, depot name used as the model input, name shown to the user)
+    if params["origin_lat"] is not None and params["origin_lon"] is not None:
+        start_coords = (params["origin_lat"], params["origin_lon"])
+        print(f"Using GPS origin: {start_coords}")
+        return start_coords, nearest_known_depot(start_coords), "Current Location (GPS)"
+    origin_depot_name = params["origin_depot_name"]
+    return geocode_depot(origin_depot_name, "origin"), origin_depot_name, origin_depot_name
+
+
+@stage_timer('station_search')
+def find_route_stations(start_coords, dest_coords) -> Tuple[list, list]:
+    try:
+        _, direct_polyline_points, fuel_station_coords = get_route_with_fuel_stations(
+             Config.HERE_API_KEY,
+             origin_coords=start_coords,
+             destination_coords=dest_coords
+        )
+    except HTTPError:
+         raise
+    except ValueError as ve:
+         print(f"Error getting route/stations from HERE: {ve}")
+         raise AbortRequest(f"Failed to calculate route: {ve}", 500)
+    except Exception as e_route:
+         print(f"Unexpected error in get_route_with_fuel_stations: {e_route}")
+         raise AbortRequest(f"Failed to calculate route: {str(e_route)}", 500)
+    return direct_polyline_points, fuel_station_coords
+
+
+def route_through_stations(start_coords, dest_coords, direct_polyline_points, fuel_station_coords) -> list:
+    api_key = Config.HERE_API_KEY
+    route_points_for_response = direct_polyline_points if direct_polyline_points else []
+
+    combined_route_points = []
+    if fuel_station_coords:
+         origin_coords_str = f"{start_coords[0]},{start_coords[1]}"
+         dest_coords_str = f"{dest_coords[0]},{dest_coords[1]}"
+         first_station_str = f"{fuel_station_coords[0][0]},{fuel_station_coords[0][1]}"
+         origin_to_first = get_here_directions(origin_coords_str, first_station_str, api_key)
+         if origin_to_first: combined_route_points.extend(origin_to_first)
+
+         for i in range(len(fuel_station_coords) - 1):
+             current_str = f"{fuel_station_coords[i][0]},{fuel_station_coords[i][1]}"
+             next_s_str = f"{fuel_station_coords[i+1][0]},{fuel_station_coords[i+1][1]}"
+             station_to_station = get_here_directions(current_str, next_s_str, api_key)
+             if station_to_station: combined_route_points.extend(station_to_station)
+
+         last_station_str = f"{fuel_station_coords[-1][0]},{fuel_station_coords[-1][1]}"
+         last_to_dest = get_here_directions(last_station_str, dest_coords_str, api_key)
+         if last_to_dest: combined_route_points.extend(last_to_dest)
+
+         if combined_route_points:
+              route_points_for_response = combined_route_points
+         else:
+              print("Warning: Failed to generate combined route through stations, using direct route.")
+    return route_points_for_response
+
+
+def leg_shares(direct_polyline_points, fuel_station_coords) -> List[float]:
+    # Fraction of the route covered by each leg: origin -> stop 1, stop 1 -> stop 2, ..., last stop -> destination.
+    legs = len(fuel_station_coords) + 1
+    if legs == 1:
+        return [1.0]
+    if not direct_polyline_points or len(direct_polyline_points) < 2:
+        return [1.0 / legs] * legs
+    geometry = RouteGeometry(direct_polyline_points)
+    if geometry.total_km <= 0:
+        return [1.0 / legs] * legs
+    stop_indices = sorted(nearest_index(stop, geometry.points)[0] for stop in fuel_station_coords)
+    bounds = [0.0] + [float(geometry.cumulative_km[i]) for i in stop_indices] + [geometry.total_km]
+    return [(end - start) / geometry.total_km for start, end in zip(bounds, bounds[1:])]
+
+
+def price_fuel_stops(start_coords, origin_for_model: str, direct_polyline_points, fuel_station_coords) -> Tuple[float, List[Dict[str, Any]]]:
+    # The tank filled at the origin covers the first leg and each stop's fill covers the leg
+    # after it, each priced at the nearest station in the price feed; the city average is
+    # only used when no priced station is within range.
+    fallback_price = fuel_prices.average_price(origin_for_model, 'B7')
+    stops = [("Origin", start_coords)] + [(f"Fuel Station {i+1}", coord) for i, coord in enumerate(fuel_station_coords)]
+    shares = leg_shares(direct_polyline_points, fuel_station_coords)
+
+    stop_prices = []
+    for (name, coords), share in zip(stops, shares):
+        match = fuel_prices.nearest_station(coords, 'B7')
+        stop_prices.append({
+            "name": name,
+            "price": match[1].price if match else fallback_price,
+            "priced_at": match[1].address if match else None,
+            "priced_distance_km": round(match[0], 2) if match else None,
+            "distance_share": round(share, 4),
+        })
+    weighted_price = sum(stop["price"] * share for stop, share in zip(stop_prices, shares))
+    return weighted_price, stop_prices
+
+
+def price_per_gallon(pence_per_litre: float) -> float:
+    return (pence_per_litre / 100) * 4.54
+
+
+def traffic_severity_for(traffic_delay: float) -> str:
+    return "high" if traffic_delay > 30 else "medium" if traffic_delay > 7 else "low"
+
+
+@stage_timer('feature_build')
+def diesel_feature_values(params: Dict[str, Any], origin_for_model: str, route_analysis, weather) -> Dict[str, float]:
+    average_temperature, snow_classification, rain_classification = weather
+    city_distance, highway_distance = route_analysis.city_distance, route_analysis.highway_distance
+    total_payload = params["pallets"] * 0.88
+    goods_weight = total_payload
+    dispatch_time = convert_time_to_window(params["dispatch_time_str"])
+    traffic_severity = traffic_severity_for(route_analysis.traffic_delay)
+
+    encoded_origin = origin_encoded.get(origin_for_model, origin_encoded['London'])
+    encoded_destination = origin_encoded.get(params["destination_depot"], -1)
+    encoded_dispatch_time = dispatch_encoded.get(dispatch_time, -1)
+    encoded_avg_traffic_congestion = traffic_congestion_encoded.get(traffic_severity.lower(), -1)
+    temp_cat = "high" if average_temperature > 15 else "low" if average_temperature < 5 else "medium"
+    encoded_avg_temp = temp_encoded.get(temp_cat, 1)
+    encoded_avg_precipitation = precipitation_encoded.get(rain_classification.lower(), -1)
+    encoded_avg_snow = snow_encoded.get(snow_classification.lower(), -1)
+    dummy_variables = {vehicle: (1 if vehicle == params["vehicle_type"] else 0) for vehicle in vehicle_type_encoded}
+
+    input_data = {
+        "Vehicle_age": params["vehicle_age"], "Goods_weight": goods_weight,
+        "Total_distance_miles": city_distance + highway_distance,
+        "Avg_traffic_congestion": encoded_avg_traffic_congestion,
+        "Avg_temp": encoded_avg_temp, "Avg_Precipitation": encoded_avg_precipitation,
+        "Avg_snow": encoded_avg_snow,
+        "Origin_depot": encoded_origin,
+        "Destination_depot": encoded_destination, "Avg_Speed_mph": 65,
+        "Distance_highway": highway_distance, "Distance_city": city_distance,
+        "dispatch_time": encoded_dispatch_time, "total_payload": total_payload
+    }
+    input_data.update(dummy_variables)
+    return input_data
+
+
+def predict_efficiency(params: Dict[str, Any], origin_for_model: str, route_analysis, weather) -> float:
+    input_data = diesel_feature_values(params, origin_for_model, route_analysis, weather)
+    return model_registry.get('fossil').predict_values(input_data)
+
+
+def build_diesel_context_graph(params: Dict[str, Any]) -> TaskGraph:
+    # origin/destination geocoding run side by side; once both are known the station
+    # search + per-leg routing proceeds alongside the Mapbox analysis and weather fetch.
+    # These stages only depend on origin, destination and journey date.
+    graph = TaskGraph('diesel')
+    graph.add('origin', lambda: resolve_origin(params))
+    graph.add('destination', lambda: geocode_depot(params["destination_depot"], "destination"))
+    graph.add('stations', lambda origin, destination: find_route_stations(origin[0], destination), deps=('origin', 'destination'))
+    graph.add('route', lambda origin, destination, stations: route_through_stations(origin[0], destination, *stations),
+              deps=('origin', 'destination', 'stations'))
+    graph.add('fuel_pricing', lambda origin, stations: price_fuel_stops(origin[0], origin[1], *stations), deps=('origin', 'stations'))
+    graph.add('analysis', lambda origin, destination: get_route_analysis(origin[0], destination), deps=('origin', 'destination'))
+    graph.add('weather', lambda analysis: get_weather_data(Config.WEATHER_API_KEY, analysis.weather_coordinates, params["target_date"]),
+              deps=('analysis',))
+    return graph
+
+
+def build_diesel_graph(params: Dict[str, Any]) -> TaskGraph:
+    graph = build_diesel_context_graph(params)
+    graph.add('prediction', lambda origin, analysis, weather: predict_efficiency(params, origin[1], analysis, weather),
+              deps=('origin', 'analysis', 'weather'))
+    return graph
+
+
+def fuel_station_points(fuel_station_coords, stop_prices) -> List[Dict[str, Any]]:
+    # stop_prices[0] is the origin's price; the rest line up with the stations.
+    return [{"name": f"Fuel Station {i+1}", "coordinates": coord, "fuel_price": round(stop["price"], 2)}
+            for i, (coord, stop) in enumerate(zip(fuel_station_coords, stop_prices[1:]))]
+
+
+def build_diesel_response(params: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
+    _, _, origin_display_name = results['origin']
+    _, fuel_station_coords = results['stations']
+    fuel_price, stop_prices = results['fuel_pricing']
+    route_points_for_response = results['route']
+    route_analysis = results['analysis']
+    city_distance, highway_distance = route_analysis.city_distance, route_analysis.highway_distance
+    average_temperature, snow_classification, rain_classification = results['weather']
+    efficiency_prediction = results['prediction']
+
+    station_points = fuel_station_points(fuel_station_coords, stop_prices)
+
+    total_dist = city_distance + highway_distance
+    total_required_fuel = total_dist / efficiency_prediction if efficiency_prediction else float('inf')
+    fuel_price_per_gallon = price_per_gallon(fuel_price)
+    total_fuel_cost = total_required_fuel * fuel_price_per_gallon
+    cost_per_mile = total_fuel_cost / total_dist if total_dist > 0 else 0
+    overhead_cost = total_fuel_cost * 0.1
+    total_final_cost = total_fuel_cost + overhead_cost
+
+    good_value_fuel = random.uniform(1.0, total_fuel_cost if total_fuel_cost > 1 else 10)
+    insurance_fuel_cost = random.uniform(1.0, good_value_fuel)
+    goods_loading_time = random.randint(10, 60)
+    is_goods_secured = random.choice(['✔️', '❌'])
+    check_safety = random.choice(['✔️', '❌'])
+
+    return {
+        "success": True,
+        "route": {
+            "origin": origin_display_name,
+            "destination": params["destination_depot"],
+            "coordinates": simplify_route(params, route_points_for_response),
+            "stations": station_points,
+            "total_distance": round(total_dist, 2)
+        },
+        "analytics": {
+             "average_temperature": round(average_temperature, 2),
+             "rain_classification": rain_classification,
+             "snow_classification": snow_classification,
+             "highway_distance": round(highway_distance, 2),
+             "city_distance": round(city_distance, 2),
+             "efficiency_prediction": round(efficiency_prediction, 2),
+             "total_required_fuel": round(total_required_fuel, 2) if total_required_fuel != float('inf') else "Infinity",
+             "total_fuel_cost": round(total_fuel_cost, 2) if total_required_fuel != float('inf') else "Infinity",
+             "cost_per_mile": round(cost_per_mile, 2) if total_dist > 0 else 0,
+             "overhead_cost": round(overhead_cost, 2) if total_required_fuel != float('inf') else "Infinity",
+             "total_final_cost": round(total_final_cost, 2) if total_required_fuel != float('inf') else "Infinity",
+             "fuel_price": round(fuel_price, 2),
+             "fuel_stop_prices": stop_prices,
+             "good_value_fuel": round(good_value_fuel, 2),
+             "insurance_fuel_cost": round(insurance_fuel_cost, 2),
+             "goods_loading_time": goods_loading_time,
+             "is_goods_secured": is_goods_secured,
+             "check_safety": check_safety,
+             **model_registry.importance_fields('fossil', params.get("feature_importance_version"))
         }
-        return jsonify(response)
+    }
+
+
+def compute_diesel_route(params: Dict[str, Any]) -> Dict[str, Any]:
+    # Identical requests in flight at the same time (several dispatchers opening the same
+    # plan, client retries) wait for the first one and share its response.
+    key = route_request_key('diesel', params, convert_time_to_window(params["dispatch_time_str"]))
+    return route_flight.do(key, lambda: run_diesel_graph(params))
+
+
+def run_diesel_graph(params: Dict[str, Any]) -> Dict[str, Any]:
+    return build_diesel_response(params, build_diesel_graph(params).run())
+
+
+@diesel_api_bp.route('/api/diesel/route', methods=['POST'])
+def diesel_route_api():
+    try:
+        params = parse_diesel_request(request.form)
+        if wants_job():
+            return submit_route_job('diesel', lambda: compute_diesel_route(params))
+        return json_response(compute_diesel_route(params))
 
+    except AbortRequest as abort:
+        return jsonify({"success": False, "error": abort.message}), abort.status
     except HTTPError as http_err:
         err_url = http_err.request.url if http_err.request else "Unknown URL"
         if http_err.response is not None and http_err.response.status_code == 429:
@@ -319,4 +397,4 @@ def diesel_route_api():
         return jsonify({
             "success": False,
             "error": f"An unexpected error occurred: {str(e)}",
-        }), 500
\ No newline at end of file
+        }), 500
@@ -3,10 +3,18 @@ import random
 import pandas as pd
 import numpy as np
 import traceback
-from tracking import get_coordinates as geocode_maps_co, calculate_distances, get_route_traffic_data, get_weather_data
+from typing import Any, Dict, List, Tuple
+from tracking import get_coordinates as geocode_maps_co, get_route_analysis, get_weather_data
 from electric_routing_here import get_here_directions, get_coordinates as here_get_coordinates, get_charging_station_coordinates, get_route_with_charging_stations
 from config import Config
 from requests.exceptions import HTTPError
+from task_graph import AbortRequest, TaskGraph
+from polyline_simplify import parse_simplify_params, simplify_route
+from response_format import json_response
+from jobs_api import submit_route_job, wants_job
+from single_flight import route_flight, route_request_key
+from model_registry import model_registry
+from metrics import stage_timer
 
 electric_api_bp = Blueprint('electric_api', __name__)
 vehicle_type_encoded = ['Volvo FE Electric', 'DAF CF Electric', 'Mercedes eActros', 'MAN eTGM', 'Renault E-Tech D', 'Scania BEV', 'Volvo FL Electric', 'FUSO eCanter', 'Freightliner eCascadia', 'BYD ETM6']
@@ -19,6 +27,13 @@ snow_encoded = {'low': 0, 'medium': 1, 'high': 2}
 battery_capacity = { 'Volvo FE Electric': 200, 'DAF CF Electric': 222, 'Mercedes eActros': 240, 'MAN eTGM': 185, 'Renault E-Tech D': 200, 'Scania BEV': 230, 'Volvo FL Electric': 165, 'FUSO eCanter': 120, 'Freightliner eCascadia': 475, 'BYD ETM6': 210 }
 vehicle_range = { 'Volvo FE Electric': 120, 'DAF CF Electric': 140, 'Mercedes eActros': 160, 'MAN eTGM': 120, 'Renault E-Tech D': 125, 'Scania BEV': 155, 'Volvo FL Electric': 110, 'FUSO eCanter': 90, 'Freightliner eCascadia': 230, 'BYD ETM6': 135 }
 base_efficiency = { 'Volvo FE Electric': 1800, 'DAF CF Electric': 1750, 'Mercedes eActros': 1650, 'MAN eTGM': 1700, 'Renault E-Tech D': 1750, 'Scania BEV': 1650, 'Volvo FL Electric': 1650, 'FUSO eCanter': 1400, 'Freightliner eCascadia': 2100, 'BYD ETM6': 1700 } # Wh/mile
+ENERGY_PRICE_PER_KWH = 0.70
+model_registry.register_static_importance('electric', [
+    {"name": "Distance_highway", "value": 25}, {"name": "Avg_temp", "value": 21},
+    {"name": "Vehicle_age", "value": 15}, {"name": "Avg_traffic_congestion", "value": 12},
+    {"name": "Avg_Speed_mph", "value": 10}, {"name": "Distance_city", "value": 8},
+    {"name": "Goods_weight", "value": 5}, {"name": "Avg_Precipitation", "value": 4}
+])
 
 def convert_time_to_window(time_str):
     try:
@@ -28,164 +43,217 @@ def convert_time_to_window(time_str):
         else: return "night"
     except: return "noon"
 
-@electric_api_bp.route('/api/electric/route', methods=['POST'])
-def electric_route_api():
+def parse_electric_request(form) -> Dict[str, Any]:
+    params = {
+        "pallets": form.get('pallets', type=float, default=20.0),
+        "vehicle_model": form.get('vehicleModel', 'Volvo FE Electric'),
+        "destination_depot": form.get('destinationDepot'),
+        "vehicle_age": form.get('vehicleAge', type=float, default=3.0),
+        "dispatch_time_str": form.get('dispatchTime', '12:00:00'),
+        "target_date": form.get('journeyDate'),
+        "origin_lat": form.get('originLat', type=float),
+        "origin_lon": form.get('originLon', type=float),
+        "origin_depot_name": form.get('originDepot'),
+        "feature_importance_version": form.get('featureImportanceVersion'),
+    }
+    params.update(parse_simplify_params(form))
+    has_gps = params["origin_lat"] is not None and params["origin_lon"] is not None
+    if not has_gps and not params["origin_depot_name"]: raise AbortRequest("Missing origin information")
+    if not params["destination_depot"]: raise AbortRequest("Missing destination depot")
+    if not params["target_date"]: raise AbortRequest("Missing journey date")
+    return params
+
+
+def resolve_origin(params: Dict[str, Any]) -> Tuple[Tuple[float, float], str]:
+    if params["origin_lat"] is not None and params["origin_lon"] is not None:
+        start_coords = (params["origin_lat"], params["origin_lon"])
+        print(f"Using GPS origin: {start_coords}")
+        return start_coords, "Current Location (GPS)"
+
+    origin_depot_name = params["origin_depot_name"]
+    coords_result = here_get_coordinates(f"{origin_depot_name}, UK", Config.HERE_API_KEY)
+    if coords_result and coords_result[0] is not None:
+         print(f"Using Depot origin: {origin_depot_name}, Coords: {coords_result}")
+         return coords_result, origin_depot_name
+    print(f"Warning: HERE geocode failed for {origin_depot_name}, trying fallback.")
+    start_coords = geocode_maps_co(f"{origin_depot_name}, UK")
+    if not (start_coords and start_coords[0] is not None):
+         raise AbortRequest(f"Could not geocode origin depot: {origin_depot_name}")
+    print(f"Using Depot origin (fallback geocode): {origin_depot_name}, Coords: {start_coords}")
+    return start_coords, origin_depot_name
+
+
+def resolve_destination(destination_depot: str) -> Tuple[float, float]:
+    dest_coords = here_get_coordinates(f"{destination_depot}, UK", Config.HERE_API_KEY)
+    if not dest_coords or dest_coords[0] is None: raise AbortRequest(f"Could not geocode destination depot: {destination_depot}")
+    print(f"Destination: {destination_depot}, Coords: {dest_coords}")
+    return dest_coords
+
+
+@stage_timer('station_search')
+def find_route_stations(start_coords, dest_coords) -> Tuple[list, list]:
     try:
-        pallets = request.form.get('pallets', type=float, default=20.0)
-        vehicle_model = request.form.get('vehicleModel', 'Volvo FE Electric')
-        destination_depot = request.form.get('destinationDepot')
-        vehicle_age = request.form.get('vehicleAge', type=float, default=3.0)
-        dispatch_time_str = request.form.get('dispatchTime', '12:00:00')
-        target_date = request.form.get('journeyDate')
-
-        origin_lat = request.form.get('originLat', type=float)
-        origin_lon = request.form.get('originLon', type=float)
-        origin_depot_name = request.form.get('originDepot')
-
-        start_coords = None
-        origin_display_name = None
-
-        if origin_lat is not None and origin_lon is not None:
-            start_coords = (origin_lat, origin_lon)
-            origin_display_name = "Current Location (GPS)"
-            print(f"Using GPS origin: {start_coords}")
-        elif origin_depot_name:
-            origin_display_name = origin_depot_name
-            coords_result = here_get_coordinates(f"{origin_depot_name}, UK", Config.HERE_API_KEY)
-            if coords_result and coords_result[0] is not None:
-                 start_coords = coords_result
-                 print(f"Using Depot origin: {origin_depot_name}, Coords: {start_coords}")
-            else:
-                 print(f"Warning: HERE geocode failed for {origin_depot_name}, trying fallback.")
-                 start_coords = geocode_maps_co(f"{origin_depot_name}, UK")
-                 if not (start_coords and start_coords[0] is not None):
-                      return jsonify({"success": False, "error": f"Could not geocode origin depot: {origin_depot_name}"}), 400
-                 print(f"Using Depot origin (fallback geocode): {origin_depot_name}, Coords: {start_coords}")
+        _, direct_polyline_points, charging_station_coords = get_route_with_charging_stations(
+             Config.HERE_API_KEY,
+             origin_coords=start_coords,
+             destination_coords=dest_coords
+        )
+    except ValueError as ve:
+         print(f"Error getting EV route/stations from HERE: {ve}")
+         raise AbortRequest(f"Failed to calculate EV route: {ve}", 500)
+    print(f"Found {len(charging_station_coords)} charging stations along the route")
+    return direct_polyline_points, charging_station_coords
+
+
+def route_through_stations(start_coords, dest_coords, direct_polyline_points, charging_station_coords) -> list:
+    api_key = Config.HERE_API_KEY
+    route_points_for_response = direct_polyline_points if direct_polyline_points else []
+
+    origin_coords_str = f"{start_coords[0]},{start_coords[1]}"
+    dest_coords_str = f"{dest_coords[0]},{dest_coords[1]}"
+
+    combined_route_points = []
+    if charging_station_coords:
+        first_station_str = f"{charging_station_coords[0][0]},{charging_station_coords[0][1]}"
+        origin_to_first = get_here_directions(origin_coords_str, first_station_str, api_key)
+        if origin_to_first: combined_route_points.extend(origin_to_first)
+
+        for i in range(len(charging_station_coords) - 1):
+             current_str = f"{charging_station_coords[i][0]},{charging_station_coords[i][1]}"
+             next_s_str = f"{charging_station_coords[i+1][0]},{charging_station_coords[i+1][1]}"
+             station_to_station = get_here_directions(current_str, next_s_str, api_key)
+             if station_to_station: combined_route_points.extend(station_to_station)
+
+        last_station_str = f"{charging_station_coords[-1][0]},{charging_station_coords[-1][1]}"
+        last_to_dest = get_here_directions(last_station_str, dest_coords_str, api_key)
+        if last_to_dest: combined_route_points.extend(last_to_dest)
+
+        if combined_route_points:
+            route_points_for_response = combined_route_points
         else:
-            return jsonify({"success": False, "error": "Missing origin information"}), 400
-
-        if not destination_depot: return jsonify({"success": False, "error": "Missing destination depot"}), 400
-        if not target_date: return jsonify({"success": False, "error": "Missing journey date"}), 400
-        dest_coords = here_get_coordinates(f"{destination_depot}, UK", Config.HERE_API_KEY)
-        if not dest_coords or dest_coords[0] is None: return jsonify({"success": False, "error": f"Could not geocode destination depot: {destination_depot}"}), 400
-        print(f"Destination: {destination_depot}, Coords: {dest_coords}")
-
-        dispatch_time = convert_time_to_window(dispatch_time_str)
-        total_payload = pallets * 0.88
-        goods_weight = total_payload
-        api_key = Config.HERE_API_KEY
-
-
-        try:
-            _, direct_polyline_points, charging_station_coords = get_route_with_charging_stations(
-                 api_key,
-                 origin_coords=start_coords,
-                 destination_coords=dest_coords
-            )
-        except ValueError as ve:
-             print(f"Error getting EV route/stations from HERE: {ve}")
-             return jsonify({"success": False, "error": f"Failed to calculate EV route: {ve}"}), 500
-
-        route_points_for_response = direct_polyline_points if direct_polyline_points else []
-
-        print(f"Found {len(charging_station_coords)} charging stations along the route")
-        station_points = [{"name": f"Charging Station {i+1}", "coordinates": coord} for i, coord in enumerate(charging_station_coords)]
-
-        origin_coords_str = f"{start_coords[0]},{start_coords[1]}"
-        dest_coords_str = f"{dest_coords[0]},{dest_coords[1]}"
-
-        combined_route_points = []
-        if charging_station_coords:
-            first_station_str = f"{charging_station_coords[0][0]},{charging_station_coords[0][1]}"
-            origin_to_first = get_here_directions(origin_coords_str, first_station_str, api_key)
-            if origin_to_first: combined_route_points.extend(origin_to_first)
-
-            for i in range(len(charging_station_coords) - 1):
-                 current_str = f"{charging_station_coords[i][0]},{charging_station_coords[i][1]}"
-                 next_s_str = f"{charging_station_coords[i+1][0]},{charging_station_coords[i+1][1]}"
-                 station_to_station = get_here_directions(current_str, next_s_str, api_key)
-                 if station_to_station: combined_route_points.extend(station_to_station)
-
-            last_station_str = f"{charging_station_coords[-1][0]},{charging_station_coords[-1][1]}"
-            last_to_dest = get_here_directions(last_station_str, dest_coords_str, api_key)
-            if last_to_dest: combined_route_points.extend(last_to_dest)
-
-            if combined_route_points:
-                route_points_for_response = combined_route_points
-            else:
-                print("Warning: Failed to generate combined EV route through stations, using direct route.")
-
-        city_distance, highway_distance = calculate_distances(start_coords, dest_coords)
-        route_coordinates_for_weather, traffic_delay = get_route_traffic_data(start_coords, dest_coords)
-        traffic_severity = "high" if traffic_delay > 30 else "medium" if traffic_delay > 7 else "low"
-        weather_api_key = Config.WEATHER_API_KEY
-        average_temperature, snow_classification, rain_classification = get_weather_data(weather_api_key, route_coordinates_for_weather, target_date)
-
-        total_dist = city_distance + highway_distance
-        efficiency_wh_per_mile = base_efficiency.get(vehicle_model, 1700)
-        if average_temperature < 5: efficiency_wh_per_mile *= 1.30
-        elif average_temperature < 10: efficiency_wh_per_mile *= 1.15
-        if traffic_severity == "high": efficiency_wh_per_mile *= 1.20
-        elif traffic_severity == "medium": efficiency_wh_per_mile *= 1.10
-        if rain_classification.lower() == "heavy" or snow_classification.lower() == "heavy": efficiency_wh_per_mile *= 1.15
-        elif rain_classification.lower() == "medium" or snow_classification.lower() == "medium": efficiency_wh_per_mile *= 1.05
-        if pallets > 15: efficiency_wh_per_mile *= 1.10
-        if vehicle_age > 2: efficiency_wh_per_mile *= (1 + (vehicle_age * 0.02))
-        efficiency_prediction = 1000 / efficiency_wh_per_mile if efficiency_wh_per_mile else 0
-        total_required_energy = total_dist / efficiency_prediction if efficiency_prediction else float('inf')
-
-        energy_price_per_kwh = 0.70
-        total_energy_cost = total_required_energy * energy_price_per_kwh
-        cost_per_mile = total_energy_cost / total_dist if total_dist else 0
-        overhead_cost = total_energy_cost * 0.1
-        total_final_cost = total_energy_cost + overhead_cost
-
-        feature_importance_data = [
-            {"name": "Distance_highway", "value": 25}, {"name": "Avg_temp", "value": 21},
-            {"name": "Vehicle_age", "value": 15}, {"name": "Avg_traffic_congestion", "value": 12},
-            {"name": "Avg_Speed_mph", "value": 10}, {"name": "Distance_city", "value": 8},
-            {"name": "Goods_weight", "value": 5}, {"name": "Avg_Precipitation", "value": 4}
-        ]
-        feature_importance_data.sort(key=lambda x: x['value'], reverse=True)
-
-        good_value_energy = random.uniform(total_energy_cost * 0.4, total_energy_cost * 0.8) if total_energy_cost > 0 else 0
-        insurance_energy_cost = random.uniform(good_value_energy * 0.5, good_value_energy) if good_value_energy > 0 else 0
-        goods_loading_time = random.randint(10, 60)
-        is_goods_secured = random.choice(['✔️', '❌'])
-        check_safety = random.choice(['✔️', '❌'])
-
-        response = {
-            "success": True,
-            "route": {
-                "origin": origin_display_name,
-                "destination": destination_depot,
-                "coordinates": route_points_for_response,
-                "stations": station_points,
-                "total_distance": round(total_dist, 2)
-            },
-            "analytics": {
-                 "average_temperature": round(average_temperature, 2),
-                 "rain_classification": rain_classification,
-                 "snow_classification": snow_classification,
-                 "highway_distance": round(highway_distance, 2),
-                 "city_distance": round(city_distance, 2),
-                 "efficiency_prediction": round(efficiency_prediction, 2),
-                 "total_required_fuel": round(total_required_energy, 2),
-                 "total_fuel_cost": round(total_energy_cost, 2),
-                 "cost_per_mile": round(cost_per_mile, 2),
-                 "overhead_cost": round(overhead_cost, 2),
-                 "total_final_cost": round(total_final_cost, 2),
-                 "fuel_price": energy_price_per_kwh,
-                 "good_value_fuel": round(good_value_energy, 2),
-                 "insurance_fuel_cost": round(insurance_energy_cost, 2),
-                 "goods_loading_time": goods_loading_time,
-                 "is_goods_secured": is_goods_secured,
-                 "check_safety": check_safety,
-                 "featureImportance": feature_importance_data
-            }
+            print("Warning: Failed to generate combined EV route through stations, using direct route.")
+    return route_points_for_response
+
+
+def build_electric_graph(params: Dict[str, Any]) -> TaskGraph:
+    graph = TaskGraph('electric')
+    graph.add('origin', lambda: resolve_origin(params))
+    graph.add('destination', lambda: resolve_destination(params["destination_depot"]))
+    graph.add('stations', lambda origin, destination: find_route_stations(origin[0], destination), deps=('origin', 'destination'))
+    graph.add('route', lambda origin, destination, stations: route_through_stations(origin[0], destination, *stations),
+              deps=('origin', 'destination', 'stations'))
+    graph.add('analysis', lambda origin, destination: get_route_analysis(origin[0], destination), deps=('origin', 'destination'))
+    graph.add('weather', lambda analysis: get_weather_data(Config.WEATHER_API_KEY, analysis.weather_coordinates, params["target_date"]),
+              deps=('analysis',))
+    return graph
+
+
+def traffic_severity_for(traffic_delay: float) -> str:
+    return "high" if traffic_delay > 30 else "medium" if traffic_delay > 7 else "low"
+
+
+@stage_timer('predict')
+def estimate_efficiency(vehicle_model: str, pallets: float, vehicle_age: float, average_temperature: float,
+                        traffic_severity: str, rain_classification: str, snow_classification: str) -> float:
+    # Miles per kWh from the vehicle's base consumption and the route conditions.
+    efficiency_wh_per_mile = base_efficiency.get(vehicle_model, 1700)
+    if average_temperature < 5: efficiency_wh_per_mile *= 1.30
+    elif average_temperature < 10: efficiency_wh_per_mile *= 1.15
+    if traffic_severity == "high": efficiency_wh_per_mile *= 1.20
+    elif traffic_severity == "medium": efficiency_wh_per_mile *= 1.10
+    if rain_classification.lower() == "heavy" or snow_classification.lower() == "heavy": efficiency_wh_per_mile *= 1.15
+    elif rain_classification.lower() == "medium" or snow_classification.lower() == "medium": efficiency_wh_per_mile *= 1.05
+    if pallets > 15: efficiency_wh_per_mile *= 1.10
+    if vehicle_age > 2: efficiency_wh_per_mile *= (1 + (vehicle_age * 0.02))
+    return 1000 / efficiency_wh_per_mile if efficiency_wh_per_mile else 0
+
+
+def charging_station_points(charging_station_coords) -> List[Dict[str, Any]]:
+    return [{"name": f"Charging Station {i+1}", "coordinates": coord} for i, coord in enumerate(charging_station_coords)]
+
+
+def build_electric_response(params: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
+    _, origin_display_name = results['origin']
+    _, charging_station_coords = results['stations']
+    route_points_for_response = results['route']
+    route_analysis = results['analysis']
+    city_distance, highway_distance = route_analysis.city_distance, route_analysis.highway_distance
+    traffic_severity = traffic_severity_for(route_analysis.traffic_delay)
+    average_temperature, snow_classification, rain_classification = results['weather']
+    vehicle_model, pallets, vehicle_age = params["vehicle_model"], params["pallets"], params["vehicle_age"]
+
+    station_points = charging_station_points(charging_station_coords)
+
+    total_dist = city_distance + highway_distance
+    efficiency_prediction = estimate_efficiency(vehicle_model, pallets, vehicle_age, average_temperature, traffic_severity,
+                                                rain_classification, snow_classification)
+    total_required_energy = total_dist / efficiency_prediction if efficiency_prediction else float('inf')
+
+    energy_price_per_kwh = ENERGY_PRICE_PER_KWH
+    total_energy_cost = total_required_energy * energy_price_per_kwh
+    cost_per_mile = total_energy_cost / total_dist if total_dist else 0
+    overhead_cost = total_energy_cost * 0.1
+    total_final_cost = total_energy_cost + overhead_cost
+
+    good_value_energy = random.uniform(total_energy_cost * 0.4, total_energy_cost * 0.8) if total_energy_cost > 0 else 0
+    insurance_energy_cost = random.uniform(good_value_energy * 0.5, good_value_energy) if good_value_energy > 0 else 0
+    goods_loading_time = random.randint(10, 60)
+    is_goods_secured = random.choice(['✔️', '❌'])
+    check_safety = random.choice(['✔️', '❌'])
+
+    return {
+        "success": True,
+        "route": {
+            "origin": origin_display_name,
+            "destination": params["destination_depot"],
+            "coordinates": simplify_route(params, route_points_for_response),
+            "stations": station_points,
+            "total_distance": round(total_dist, 2)
+        },
+        "analytics": {
+             "average_temperature": round(average_temperature, 2),
+             "rain_classification": rain_classification,
+             "snow_classification": snow_classification,
+             "highway_distance": round(highway_distance, 2),
+             "city_distance": round(city_distance, 2),
+             "efficiency_prediction": round(efficiency_prediction, 2),
+             "total_required_fuel": round(total_required_energy, 2),
+             "total_fuel_cost": round(total_energy_cost, 2),
+             "cost_per_mile": round(cost_per_mile, 2),
+             "overhead_cost": round(overhead_cost, 2),
+             "total_final_cost": round(total_final_cost, 2),
+             "fuel_price": energy_price_per_kwh,
+             "good_value_fuel": round(good_value_energy, 2),
+             "insurance_fuel_cost": round(insurance_energy_cost, 2),
+             "goods_loading_time": goods_loading_time,
+             "is_goods_secured": is_goods_secured,
+             "check_safety": check_safety,
+             **model_registry.importance_fields('electric', params.get("feature_importance_version"))
         }
-        return jsonify(response)
+    }
+
+
+def compute_electric_route(params: Dict[str, Any]) -> Dict[str, Any]:
+    # Identical requests in flight at the same time (several dispatchers opening the same
+    # plan, client retries) wait for the first one and share its response.
+    key = route_request_key('electric', params, convert_time_to_window(params["dispatch_time_str"]))
+    return route_flight.do(key, lambda: run_electric_graph(params))
+
+
+def run_electric_graph(params: Dict[str, Any]) -> Dict[str, Any]:
+    return build_electric_response(params, build_electric_graph(params).run())
+
+
+@electric_api_bp.route('/api/electric/route', methods=['POST'])
+def electric_route_api():
+    try:
+        params = parse_electric_request(request.form)
+        if wants_job():
+            return submit_route_job('electric', lambda: compute_electric_route(params))
+        return json_response(compute_electric_route(params))
 
+    except AbortRequest as abort:
+        return jsonify({"success": False, "error": abort.message}), abort.status
     except HTTPError as http_err:
         err_url = http_err.request.url if http_err.request else "Unknown URL"
         if http_err.response is not None and http_err.response.status_code == 429:
@@ -201,4 +269,4 @@ def electric_route_api():
         error_traceback = traceback.format_exc()
         print(f"Error in electric route API: {str(e)}")
         print(f"Traceback: {error_traceback}")
-        return jsonify({"success": False, "error": str(e), "traceback": error_traceback}), 500
\ No newline at end of file
+        return jsonify({"success": False, "error": str(e), "traceback": error_traceback}), 500
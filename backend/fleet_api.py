@@ -0,0 +1,152 @@
+import traceback
+from typing import Any, Dict, List
+from flask import Blueprint, request, jsonify
+from requests.exceptions import HTTPError
+from config import Config
+from model_registry import model_registry
+from task_graph import AbortRequest, TaskGraph
+from tracking import get_route_analysis, get_weather_data
+import diesel_api
+import electric_api
+import hydrogen_api
+from hydrogen import find_nearest_station
+
+fleet_api_bp = Blueprint('fleet_api', __name__)
+
+
+def parse_fleet_request(form) -> Dict[str, Any]:
+    # Same fields as a diesel route request; vehicleAge may be repeated to sweep several ages.
+    params = diesel_api.parse_diesel_request(form)
+    params["vehicle_ages"] = form.getlist('vehicleAge', type=float) or [params["vehicle_age"]]
+    return params
+
+
+def build_fleet_graph(params: Dict[str, Any]) -> TaskGraph:
+    # One route context for every vehicle: geocoding, diesel pump prices along the route,
+    # the Mapbox analysis, weather and the nearest hydrogen station.
+    graph = TaskGraph('fleet')
+    graph.add('origin', lambda: diesel_api.resolve_origin(params))
+    graph.add('destination', lambda: diesel_api.geocode_depot(params["destination_depot"], "destination"))
+    graph.add('stations', lambda origin, destination: diesel_api.find_route_stations(origin[0], destination), deps=('origin', 'destination'))
+    graph.add('fuel_pricing', lambda origin, stations: diesel_api.price_fuel_stops(origin[0], origin[1], *stations), deps=('origin', 'stations'))
+    graph.add('analysis', lambda origin, destination: get_route_analysis(origin[0], destination), deps=('origin', 'destination'))
+    graph.add('weather', lambda analysis: get_weather_data(Config.WEATHER_API_KEY, analysis.weather_coordinates, params["target_date"]),
+              deps=('analysis',))
+    graph.add('nearest_station', lambda origin: find_nearest_station(f"{origin[1]}, UK", hydrogen_api.STATION_POSTAL_CODES, Config.MAPBOX_TOKEN),
+              deps=('origin',))
+    return graph
+
+
+def model_rows(params: Dict[str, Any], vehicles: List[str], feature_values) -> List[Dict[str, float]]:
+    # One row per (vehicle, age): the route features are built once per vehicle and only the
+    # vehicle-dependent columns and Vehicle_age change between rows.
+    rows = []
+    for vehicle in vehicles:
+        base = feature_values(dict(params, vehicle_type=vehicle))
+        rows.extend(dict(base, Vehicle_age=age) for age in params["vehicle_ages"])
+    return rows
+
+
+def sweep_model(model_name: str, params: Dict[str, Any], vehicles: List[str], feature_values) -> List[tuple]:
+    # All rows of one model go through a single vectorized predict call.
+    predictions = model_registry.get(model_name).predict_many(model_rows(params, vehicles, feature_values))
+    pairs = [(vehicle, age) for vehicle in vehicles for age in params["vehicle_ages"]]
+    return [(vehicle, age, float(prediction)) for (vehicle, age), prediction in zip(pairs, predictions)]
+
+
+def cost_row(fuel_type: str, vehicle: str, age: float, efficiency: float, total_dist: float,
+             unit_price: float, fuel_unit: str) -> Dict[str, Any]:
+    total_required_fuel = total_dist / efficiency if efficiency else float('inf')
+    total_fuel_cost = total_required_fuel * unit_price
+    total_final_cost = total_fuel_cost * 1.1
+    finite = total_required_fuel != float('inf')
+    return {
+        "fuel_type": fuel_type,
+        "vehicle": vehicle,
+        "vehicle_age": age,
+        "efficiency_prediction": round(efficiency, 2),
+        "fuel_unit": fuel_unit,
+        "total_required_fuel": round(total_required_fuel, 2) if finite else "Infinity",
+        "total_fuel_cost": round(total_fuel_cost, 2) if finite else "Infinity",
+        "cost_per_mile": round(total_fuel_cost / total_dist, 2) if finite and total_dist > 0 else 0,
+        "total_final_cost": round(total_final_cost, 2) if finite else "Infinity",
+        "_sort": total_final_cost,
+    }
+
+
+def build_fleet_response(params: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
+    _, origin_for_model, origin_display_name = results['origin']
+    route_analysis = results['analysis']
+    average_temperature, snow_classification, rain_classification = results['weather']
+    diesel_price, _ = results['fuel_pricing']
+    total_dist = route_analysis.city_distance + route_analysis.highway_distance
+
+    rows = []
+    diesel_values = lambda p: diesel_api.diesel_feature_values(p, origin_for_model, route_analysis, results['weather'])
+    for vehicle, age, efficiency in sweep_model('fossil', params, diesel_api.vehicle_type_encoded, diesel_values):
+        rows.append(cost_row("diesel", vehicle, age, efficiency, total_dist, diesel_api.price_per_gallon(diesel_price), "gallons"))
+
+    hydrogen_values = lambda p: hydrogen_api.hydrogen_feature_values(p, origin_for_model, results['nearest_station'],
+                                                                     route_analysis, results['weather'])
+    for vehicle, age, efficiency in sweep_model('hydrogen', params, hydrogen_api.vehicle_type_encoded, hydrogen_values):
+        rows.append(cost_row("hydrogen", vehicle, age, efficiency, total_dist, hydrogen_api.HYDROGEN_PRICE_PER_KG, "kg"))
+
+    traffic_severity = electric_api.traffic_severity_for(route_analysis.traffic_delay)
+    for vehicle in electric_api.vehicle_type_encoded:
+        for age in params["vehicle_ages"]:
+            efficiency = electric_api.estimate_efficiency(vehicle, params["pallets"], age, average_temperature, traffic_severity,
+                                                          rain_classification, snow_classification)
+            rows.append(cost_row("electric", vehicle, age, efficiency, total_dist, electric_api.ENERGY_PRICE_PER_KWH, "kWh"))
+
+    rows.sort(key=lambda row: row["_sort"])
+    for rank, row in enumerate(rows, 1):
+        del row["_sort"]
+        row["rank"] = rank
+
+    return {
+        "success": True,
+        "route": {
+            "origin": origin_display_name,
+            "destination": params["destination_depot"],
+            "total_distance": round(total_dist, 2)
+        },
+        "analytics": {
+            "average_temperature": round(average_temperature, 2),
+            "rain_classification": rain_classification,
+            "snow_classification": snow_classification,
+            "highway_distance": round(route_analysis.highway_distance, 2),
+            "city_distance": round(route_analysis.city_distance, 2),
+            "diesel_fuel_price": round(diesel_price, 2),
+            "hydrogen_fuel_price": hydrogen_api.HYDROGEN_PRICE_PER_KG,
+            "electric_fuel_price": electric_api.ENERGY_PRICE_PER_KWH,
+        },
+        "vehicles": rows
+    }
+
+
+@fleet_api_bp.route('/api/fleet/sweep', methods=['POST'])
+def fleet_sweep_api():
+    try:
+        params = parse_fleet_request(request.form)
+        results = build_fleet_graph(params).run()
+        return jsonify(build_fleet_response(params, results))
+
+    except AbortRequest as abort:
+        return jsonify({"success": False, "error": abort.message}), abort.status
+    except HTTPError as http_err:
+        err_url = http_err.request.url if http_err.request else "Unknown URL"
+        if http_err.response is not None and http_err.response.status_code == 429:
+            print(f"External API rate limit (429) hit for URL: {err_url}. Notifying frontend.")
+            return jsonify({
+                "success": False,
+                "error_type": "RATE_LIMIT_EXCEEDED",
+                "message": "Too many API requests"
+            }), 429
+        else:
+            raise http_err
+    except Exception as e:
+        print(f"Error in fleet sweep API: {str(e)}\n{traceback.format_exc()}")
+        return jsonify({
+            "success": False,
+            "error": f"An unexpected error occurred: {str(e)}",
+        }), 500
@@ -0,0 +1,181 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict, namedtuple
+from typing import Dict, Optional, Tuple
+import http_client
+from config import Config
+from requests.exceptions import RequestException
+from station_index import GridIndex
+
+FUEL_PRICES_URL = "https://fuel.motorfuelgroup.com/fuel_prices_data.json"
+DEFAULT_DIESEL_PRICE = 175.9
+
+PricedStation = namedtuple('PricedStation', 'address,lat,lng,price')
+
+_WORD = re.compile(r"[A-Z][A-Z'\-]*(?: [A-Z][A-Z'\-]*)*")
+
+
+def address_keys(address: str) -> set:
+    # Every comma-separated part of the address and every word in it, upper-cased, so that
+    # "12 High St, Milton Keynes, MK9 1AA" is found under "MILTON KEYNES" and "KEYNES" alike.
+    keys = set()
+    for part in address.upper().split(','):
+        part = part.strip()
+        if not part:
+            continue
+        keys.add(part)
+        for phrase in _WORD.findall(part):
+            keys.add(phrase)
+            keys.update(phrase.split())
+    return keys
+
+
+class FuelPriceTable:
+    # Immutable once built; the service swaps whole tables so readers never see a half update.
+    def __init__(self, data: Optional[dict], fetched_at: float = 0.0):
+        self.fetched_at = fetched_at
+        self.stations = []
+        self.grids: Dict[str, GridIndex] = defaultdict(lambda: GridIndex(Config.FUEL_PRICE_CELL_DEG))
+        sums = defaultdict(lambda: [0.0, 0])
+        grade_sums = defaultdict(lambda: [0.0, 0])
+
+        for station in (data or {}).get("stations", []):
+            prices = {grade: price for grade, price in (station.get("prices") or {}).items() if price}
+            if not prices:
+                continue
+            address = station.get("address", "")
+            self.stations.append(station)
+            keys = address_keys(address)
+            location = station.get("location") or {}
+            lat, lng = location.get("latitude"), location.get("longitude")
+            if lat is not None and lng is not None:
+                lat, lng = float(lat), float(lng)
+                for grade, price in prices.items():
+                    self.grids[grade].add(lat, lng, PricedStation(address, lat, lng, price))
+            for grade, price in prices.items():
+                grade_sums[grade][0] += price
+                grade_sums[grade][1] += 1
+                for key in keys:
+                    entry = sums[(key, grade)]
+                    entry[0] += price
+                    entry[1] += 1
+
+        self.city_averages: Dict[tuple, float] = {key: total / count for key, (total, count) in sums.items()}
+        self.grade_averages: Dict[str, float] = {grade: total / count for grade, (total, count) in grade_sums.items()}
+
+    def average_price(self, city: Optional[str], grade: str = 'B7', default: float = DEFAULT_DIESEL_PRICE) -> float:
+        if not city:
+            return default
+        return self.city_averages.get((city.strip().upper(), grade), default)
+
+    def nearest_station(self, point: Tuple[float, float], grade: str = 'B7',
+                        max_km: float = Config.FUEL_PRICE_SEARCH_KM) -> Optional[Tuple[float, PricedStation]]:
+        grid = self.grids.get(grade)
+        return grid.nearest(point, max_km) if grid is not None else None
+
+    def __len__(self):
+        return len(self.stations)
+
+
+class FuelPriceService:
+    def __init__(self, url: str, snapshot_path: str, refresh_seconds: float):
+        self.url = url
+        self.snapshot_path = snapshot_path
+        self.refresh_seconds = refresh_seconds
+        self.table = FuelPriceTable(None)
+        self.refreshes = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._load_snapshot()
+
+    def _load_snapshot(self) -> None:
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.table = FuelPriceTable(data, os.path.getmtime(self.snapshot_path))
+            print(f"Loaded fuel price snapshot with {len(self.table)} stations from {self.snapshot_path}")
+        except FileNotFoundError:
+            pass
+        except (OSError, TypeError, ValueError, AttributeError) as e:
+            print(f"Warning: Could not read fuel price snapshot {self.snapshot_path}: {e}")
+
+    def _save_snapshot(self, data: dict) -> None:
+        tmp_path = f"{self.snapshot_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            print(f"Warning: Could not write fuel price snapshot {self.snapshot_path}: {e}")
+
+    def refresh(self) -> bool:
+        try:
+            response = http_client.get(self.url, timeout=20)
+            response.raise_for_status()
+            data = response.json()
+            table = FuelPriceTable(data, time.time())
+        except RequestException as e:
+            self.failures += 1
+            print(f"Warning: Failed to fetch fuel price data: {e}")
+            return False
+        except (TypeError, ValueError, AttributeError) as e:
+            # Undecodable body or a malformed station entry (non-numeric price or coordinates).
+            self.failures += 1
+            print(f"Warning: Could not parse fuel price data: {e}")
+            return False
+
+        if not len(table):
+            self.failures += 1
+            print("Warning: Fuel price feed returned no priced stations; keeping previous table.")
+            return False
+        self.table = table
+        self.refreshes += 1
+        self._save_snapshot(data)
+        return True
+
+    def _run(self, first_delay: float) -> None:
+        time.sleep(first_delay)
+        while True:
+            # One bad refresh must not kill the thread; ensure_started won't restart it.
+            try:
+                self.refresh()
+            except Exception as e:
+                self.failures += 1
+                print(f"Warning: Fuel price refresh failed: {e}")
+            time.sleep(self.refresh_seconds)
+
+    def ensure_started(self) -> None:
+        # Started lazily so each forked worker gets its own refresh thread.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                # With no snapshot loaded, fetch before answering so the first requests get real
+                # prices rather than DEFAULT_DIESEL_PRICE; callers arriving meanwhile wait on the lock.
+                first_delay = 0.0
+                if not len(self.table) and self.refresh():
+                    first_delay = self.refresh_seconds
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, args=(first_delay,), name='fuel-prices', daemon=True)
+                self._thread.start()
+
+    def average_price(self, city: Optional[str], grade: str = 'B7', default: float = DEFAULT_DIESEL_PRICE) -> float:
+        self.ensure_started()
+        return self.table.average_price(city, grade, default)
+
+    def nearest_station(self, point: Tuple[float, float], grade: str = 'B7',
+                        max_km: float = Config.FUEL_PRICE_SEARCH_KM) -> Optional[Tuple[float, PricedStation]]:
+        self.ensure_started()
+        return self.table.nearest_station(point, grade, max_km)
+
+    def stats(self) -> Dict[str, float]:
+        table = self.table
+        return {"stations": len(table), "fetched_at": table.fetched_at, "refreshes": self.refreshes, "failures": self.failures}
+
+
+fuel_prices = FuelPriceService(FUEL_PRICES_URL, Config.FUEL_PRICES_SNAPSHOT_PATH, Config.FUEL_PRICES_REFRESH_SECONDS)
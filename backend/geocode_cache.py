@@ -0,0 +1,162 @@
+import functools
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional, Tuple
+from config import Config
+from metrics import stage_timer
+from single_flight import geocode_flight
+
+DAY = 24 * 60 * 60
+
+PROVIDER_TTLS = {
+    'here': 30 * DAY,
+    'maps_co': 30 * DAY,
+    'nominatim': 30 * DAY,
+    # Mapbox temporary geocoding results are not meant to be stored long term
+    'mapbox': 1 * DAY,
+}
+DEFAULT_TTL = 7 * DAY
+NEGATIVE_TTL = 60 * 60
+
+_MISSING = object()
+
+
+class GeocodeNotFound(Exception):
+    pass
+
+
+def normalize_query(query: str) -> str:
+    query = re.sub(r'\s+', ' ', str(query).strip().lower())
+    query = re.sub(r'\s*,\s*', ', ', query)
+    return query.strip(', ')
+
+
+class GeocodeCache:
+    def __init__(self, db_path: Optional[str], max_entries: int = 1024):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[Tuple[str, str], Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._db_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        if not self._db_ready:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS geocode_cache (
+                provider TEXT NOT NULL,
+                query TEXT NOT NULL,
+                value TEXT,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (provider, query)
+            )
+            ''')
+            conn.commit()
+            self._db_ready = True
+        return conn
+
+    def _remember(self, key: Tuple[str, str], value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (value, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _count(self, provider: str, counter: str) -> None:
+        with self._lock:
+            self._counters[provider][counter] += 1
+
+    def get(self, provider: str, query: str) -> Any:
+        key = (provider, normalize_query(query))
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+            else:
+                entry = None
+        if entry is not None:
+            self._count(provider, 'memory_hits' if entry[0] is not None else 'negative_hits')
+            return entry[0]
+
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        'SELECT value, expires_at FROM geocode_cache WHERE provider = ? AND query = ? AND expires_at > ?',
+                        (provider, key[1], now)
+                    ).fetchone()
+                if row is not None:
+                    value = tuple(json.loads(row[0])) if row[0] is not None else None
+                    self._remember(key, value, row[1])
+                    self._count(provider, 'disk_hits' if value is not None else 'negative_hits')
+                    return value
+            except sqlite3.Error as e:
+                print(f"Warning: Geocode cache read failed ({self.db_path}): {e}")
+
+        self._count(provider, 'misses')
+        return _MISSING
+
+    def put(self, provider: str, query: str, value: Optional[Tuple[float, ...]]) -> None:
+        key = (provider, normalize_query(query))
+        ttl = PROVIDER_TTLS.get(provider, DEFAULT_TTL) if value is not None else NEGATIVE_TTL
+        expires_at = time.time() + ttl
+        value = tuple(float(v) for v in value) if value is not None else None
+        self._remember(key, value, expires_at)
+        self._count(provider, 'stores' if value is not None else 'negative_stores')
+
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        'INSERT OR REPLACE INTO geocode_cache VALUES (?, ?, ?, ?)',
+                        (provider, key[1], json.dumps(value) if value is not None else None, expires_at)
+                    )
+                    conn.commit()
+            except sqlite3.Error as e:
+                print(f"Warning: Geocode cache write failed ({self.db_path}): {e}")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {provider: dict(counters) for provider, counters in self._counters.items()}
+
+
+geocode_cache = GeocodeCache(Config.GEOCODE_CACHE_PATH, Config.GEOCODE_CACHE_SIZE)
+
+
+def cached_geocode(provider: str, empty: Any = None):
+    # The wrapped function takes the place name as its first argument and returns the
+    # coordinates, raises GeocodeNotFound when the provider has no match (cached as a
+    # negative result), or returns `empty` on transport errors (not cached).
+    def decorator(func):
+        @functools.wraps(func)
+        @stage_timer('geocode')
+        def wrapper(query, *args, **kwargs):
+            if not query:
+                return func(query, *args, **kwargs)
+
+            cached = geocode_cache.get(provider, query)
+            if cached is not _MISSING:
+                return cached if cached is not None else empty
+
+            def fetch():
+                try:
+                    result = func(query, *args, **kwargs)
+                except GeocodeNotFound:
+                    geocode_cache.put(provider, query, None)
+                    return empty
+
+                if result is not None and result != empty and None not in tuple(result):
+                    geocode_cache.put(provider, query, result)
+                return result
+
+            # Concurrent misses for the same place share one provider call.
+            return geocode_flight.do((provider, normalize_query(query)), fetch)
+        return wrapper
+    return decorator
@@ -0,0 +1,144 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+from config import Config
+from rate_limit import rate_limiter
+
+PROVIDER_HOSTS = {
+    'router.hereapi.com': 'here',
+    'geocode.search.hereapi.com': 'here',
+    'discover.search.hereapi.com': 'here',
+    'api.mapbox.com': 'mapbox',
+    'api.weatherapi.com': 'weatherapi',
+    'geocode.maps.co': 'maps_co',
+    'nominatim.openstreetmap.org': 'nominatim',
+    'fuel.motorfuelgroup.com': 'motorfuelgroup',
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DEFAULT_TIMEOUT = (Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_READ_TIMEOUT)
+
+
+def provider_for(url: str) -> str:
+    host = urlsplit(url).hostname or ''
+    return PROVIDER_HOSTS.get(host, host)
+
+
+def backoff_delay(attempt: int, base: float = Config.HTTP_BACKOFF_BASE, cap: float = Config.HTTP_MAX_RETRY_WAIT) -> float:
+    # "Full jitter": spreads retries from concurrent workers instead of having them collide again.
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_after_seconds(response: requests.Response) -> Optional[float]:
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ProviderStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {"requests": 0, "errors": 0, "retries": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+
+    def record(self, provider: str, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            entry = self._stats[provider]
+            entry["requests"] += 1
+            entry["total_seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            if error:
+                entry["errors"] += 1
+
+    def record_retry(self, provider: str) -> None:
+        with self._lock:
+            self._stats[provider]["retries"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            result = {}
+            for provider, entry in self._stats.items():
+                result[provider] = dict(entry)
+                result[provider]["avg_seconds"] = entry["total_seconds"] / entry["requests"] if entry["requests"] else 0.0
+            return result
+
+
+class HttpClient:
+    # One keep-alive Session per host so TLS connections to each provider are reused across
+    # requests and worker threads. Sessions are only used for GETs with per-call parameters.
+    def __init__(self, pool_size: int = Config.HTTP_POOL_SIZE, retries: int = Config.HTTP_RETRIES):
+        self.pool_size = pool_size
+        self.retries = retries
+        self.stats = ProviderStats()
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def session_for(self, url: str) -> requests.Session:
+        host = urlsplit(url).netloc
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[host] = session
+            return session
+
+    def get(self, url: str, params=None, timeout=None, retries: Optional[int] = None, **kwargs) -> requests.Response:
+        # GETs are idempotent, so connection errors, timeouts, 429 and 5xx are retried with
+        # jittered backoff (or the server's Retry-After). The last response is returned as-is
+        # so callers keep using raise_for_status() and their existing 429 handling. Each attempt
+        # first waits for the provider's rate limiter, which raises a 429-style error instead
+        # of queueing past RATE_LIMIT_MAX_WAIT.
+        provider = provider_for(url)
+        session = self.session_for(url)
+        timeout = timeout if timeout is not None else DEFAULT_TIMEOUT
+        retries = self.retries if retries is None else retries
+
+        attempt = 0
+        while True:
+            rate_limiter.acquire(provider)
+            start = time.perf_counter()
+            try:
+                response = session.get(url, params=params, timeout=timeout, **kwargs)
+            except (ConnectionError, Timeout):
+                self.stats.record(provider, time.perf_counter() - start, error=True)
+                if attempt >= retries:
+                    raise
+                delay = backoff_delay(attempt)
+            else:
+                failed = response.status_code in RETRY_STATUSES
+                self.stats.record(provider, time.perf_counter() - start, error=failed)
+                if not failed or attempt >= retries:
+                    return response
+                delay = retry_after_seconds(response)
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                elif delay > Config.HTTP_MAX_RETRY_WAIT:
+                    return response
+
+            self.stats.record_retry(provider)
+            print(f"Retrying {provider} request in {delay:.2f}s (attempt {attempt + 2}/{retries + 1})")
+            time.sleep(delay)
+            attempt += 1
+
+
+http_client = HttpClient()
+
+
+def get(url: str, params=None, timeout=None, **kwargs) -> requests.Response:
+    return http_client.get(url, params=params, timeout=timeout, **kwargs)
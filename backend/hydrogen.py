@@ -1,27 +1,28 @@
 from typing import Tuple, List
-import requests
+import http_client
 import re
 from geopy.distance import geodesic
-import joblib
 import time
 from datetime import datetime
-import pandas as pd
 import numpy as np
 from config import Config
+from weather import get_forecast_days
+from geocode_cache import cached_geocode, GeocodeNotFound
 from requests.exceptions import HTTPError, RequestException
+from model_registry import model_registry
+from metrics import stage_timer
 
 GEOCODING_API_URL = "https://geocode.maps.co/search"
 MAPBOX_DIRECTIONS_API_URL = "https://api.mapbox.com/directions/v5/mapbox/driving-traffic/"
 MAPBOX_GEOCODING_API_URL = "https://api.mapbox.com/geocoding/v5/mapbox.places/"
-WEATHER_API_URL = "http://api.weatherapi.com/v1/forecast.json"
 DATE_FORMAT = "%Y-%m-%d"
 
 mapbox_token = Config.MAPBOX_TOKEN
 weather_api_key = Config.WEATHER_API_KEY
 geocoding_api = Config.GEOCODING_API_KEY
 
-model = joblib.load('Hydrogen_model.pkl')
 
+@cached_geocode('maps_co', empty=(None, None))
 def get_coordinates(place_name: str) -> Tuple[float, float]:
     start_time = time.time()
     params = {
@@ -29,12 +30,12 @@ def get_coordinates(place_name: str) -> Tuple[float, float]:
         "api_key": geocoding_api
     }
     try:
-        response = requests.get(GEOCODING_API_URL, params=params)
+        response = http_client.get(GEOCODING_API_URL, params=params)
         response.raise_for_status()
         data = response.json()
         if not data:
              print(f"Warning: No data received from geocoding API for {place_name}")
-             return None, None
+             raise GeocodeNotFound(place_name)
         if isinstance(data, list) and data:
              max_importance_place = max(data, key=lambda place: place.get('importance', 0))
              coords = (float(max_importance_place['lat']), float(max_importance_place['lon']))
@@ -67,7 +68,7 @@ def get_traffic_data(origin_coordinates, destination_coordinates, fuelstation_co
     try:
         start_time = time.time()
         url = f"{MAPBOX_DIRECTIONS_API_URL}{origin_coordinates[1]},{origin_coordinates[0]};{fuelstation_coordinates[1]},{fuelstation_coordinates[0]};{destination_coordinates[1]},{destination_coordinates[0]}?annotations=congestion_numeric&overview=full&waypoints=0;2&access_token={mapbox_token}"
-        response = requests.get(url)
+        response = http_client.get(url)
         response.raise_for_status()
         data = response.json()
 
@@ -104,76 +105,62 @@ def get_traffic_data(origin_coordinates, destination_coordinates, fuelstation_co
          print(f"Error processing traffic data: {e}")
          return "Low"
 
+@cached_geocode('mapbox')
+def geocode_mapbox(place_name, mapbox_token):
+    url = f'{MAPBOX_GEOCODING_API_URL}{place_name}.json?access_token={mapbox_token}'
+    try:
+        response = http_client.get(url)
+        response.raise_for_status()
+        data = response.json()
+        features = data.get('features', [])
+        if not features:
+            print(f"Warning: No features found for {place_name}")
+            raise GeocodeNotFound(place_name)
+        coords = features[0].get('geometry', {}).get('coordinates')
+        if not coords or len(coords) < 2:
+             print(f"Warning: Could not extract coordinates for {place_name}")
+             return None
+        return float(coords[0]), float(coords[1])
+    except HTTPError as http_err:
+        if http_err.response is not None and http_err.response.status_code == 429:
+            raise
+        else:
+            print(f"Error geocoding {place_name} with Mapbox (HTTPError): {http_err}")
+            return None
+    except RequestException as e:
+        print(f"Error geocoding {place_name} with Mapbox (RequestException): {e}")
+        return None
+    except (IndexError, KeyError, TypeError, ValueError) as e:
+        print(f"Error processing Mapbox geocoding data for {place_name}: {e}")
+        return None
+
+@stage_timer('station_search')
 def find_nearest_station(given_location, station_postal_codes, mapbox_token):
     if not all([given_location, station_postal_codes, mapbox_token]):
         print("Warning: Missing input for find_nearest_station")
         return None
 
     start_time = time.time()
-    given_location_url = f'{MAPBOX_GEOCODING_API_URL}{given_location}.json?access_token={mapbox_token}'
-    try:
-        given_location_response = requests.get(given_location_url)
-        given_location_response.raise_for_status()
-        given_location_data = given_location_response.json()
-        features = given_location_data.get('features', [])
-        if not features:
-            print(f"Warning: No features found for given location {given_location}")
-            return None
-        given_location_coords = features[0].get('geometry', {}).get('coordinates')
-        if not given_location_coords or len(given_location_coords) < 2:
-             print(f"Warning: Could not extract coordinates for {given_location}")
-             return None
+    given_location_coords = geocode_mapbox(given_location, mapbox_token)
+    if not given_location_coords:
+        return None
 
-        nearest_station = None
-        min_distance = float('inf')
-
-        for postal_code in station_postal_codes:
-            postal_code_url = f'{MAPBOX_GEOCODING_API_URL}{postal_code}.json?access_token={mapbox_token}'
-            try:
-                postal_code_response = requests.get(postal_code_url)
-                postal_code_response.raise_for_status()
-                postal_code_data = postal_code_response.json()
-                pc_features = postal_code_data.get('features', [])
-                if not pc_features:
-                    print(f"Warning: No features found for postal code {postal_code}")
-                    continue
-                postal_code_coords = pc_features[0].get('geometry', {}).get('coordinates')
-                if not postal_code_coords or len(postal_code_coords) < 2:
-                     print(f"Warning: Could not extract coordinates for {postal_code}")
-                     continue
-
-                distance = ((given_location_coords[0] - postal_code_coords[0]) ** 2 + (given_location_coords[1] - postal_code_coords[1]) ** 2) ** 0.5
-
-                if distance < min_distance:
-                    min_distance = distance
-                    nearest_station = postal_code
-            except HTTPError as http_err_inner:
-                if http_err_inner.response is not None and http_err_inner.response.status_code == 429:
-                    raise
-                else:
-                    print(f"Error geocoding postal code {postal_code} (HTTPError): {http_err_inner}")
-                    continue
-            except RequestException as e_inner:
-                 print(f"Error geocoding postal code {postal_code} (RequestException): {e_inner}")
-                 continue
-            except (IndexError, KeyError, TypeError) as e_inner:
-                 print(f"Error processing postal code data {postal_code}: {e_inner}")
-                 continue
+    nearest_station = None
+    min_distance = float('inf')
 
-        end_time = time.time()
-        return nearest_station
-    except HTTPError as http_err_outer:
-        if http_err_outer.response is not None and http_err_outer.response.status_code == 429:
-            raise
-        else:
-            print(f"Error retrieving coordinates for given location {given_location} (HTTPError): {http_err_outer}")
-            return None
-    except RequestException as e_outer:
-        print(f"Error retrieving coordinates for given location {given_location} (RequestException): {e_outer}")
-        return None
-    except (IndexError, KeyError, TypeError) as e_outer:
-         print(f"Error processing given location data {given_location}: {e_outer}")
-         return None
+    for postal_code in station_postal_codes:
+        postal_code_coords = geocode_mapbox(postal_code, mapbox_token)
+        if not postal_code_coords:
+            continue
+
+        distance = ((given_location_coords[0] - postal_code_coords[0]) ** 2 + (given_location_coords[1] - postal_code_coords[1]) ** 2) ** 0.5
+
+        if distance < min_distance:
+            min_distance = distance
+            nearest_station = postal_code
+
+    end_time = time.time()
+    return nearest_station
 
 def calculate_distances(start_coords: Tuple[float, float], end_coords: Tuple[float, float]) -> Tuple[float, float]:
     if start_coords is None or end_coords is None or start_coords[0] is None or start_coords[1] is None or end_coords[0] is None or end_coords[1] is None:
@@ -200,7 +187,7 @@ def calculate_distances(start_coords: Tuple[float, float], end_coords: Tuple[flo
     url = f"{MAPBOX_DIRECTIONS_API_URL}{start_lon},{start_lat};{end_lon},{end_lat}"
 
     try:
-        response = requests.get(url, params=params)
+        response = http_client.get(url, params=params)
         response.raise_for_status()
         route_data = response.json()
 
@@ -264,7 +251,7 @@ def get_route_coordinates(start_coords, end_coords, steps=50):
 
     try:
         url = f"{MAPBOX_DIRECTIONS_API_URL}{start_coords[1]},{start_coords[0]};{end_coords[1]},{end_coords[0]}"
-        response = requests.get(url, params=params)
+        response = http_client.get(url, params=params)
         response.raise_for_status()
         data = response.json()
 
@@ -317,67 +304,41 @@ def get_weather_data(api_key: str, coordinates_list: List[Tuple[float, float]],
         print(f"Error: Invalid target date format: {target_date}. Use YYYY-MM-DD.")
         return 0.0, "Low", "Low"
 
+    valid_pairs = []
     for coord_pair in coordinates_list:
          if coord_pair is None or len(coord_pair) < 2:
              print("Warning: Skipping invalid coordinate pair (None or <2 elements) for weather check.")
              continue
          lon, lat = coord_pair[0], coord_pair[1]
+         valid_pairs.append((lat, lon))
 
-         params = {
-            "key": api_key,
-            "q": f"{lat},{lon}",
-            "days": 4,
-            "aqi": "no",
-            "alerts": "no"
-         }
-
-         try:
-            response = requests.get(WEATHER_API_URL.strip(), params=params)
-            response.raise_for_status()
-            weather_data = response.json()
-
-            if not weather_data.get('forecast', {}).get('forecastday'):
-                print(f"Warning: No forecast data found for {lat}, {lon}")
-                continue
-
-            forecast_days = weather_data['forecast']['forecastday']
-            found_date = False
-            for day in forecast_days:
-                 date_str = day.get('date')
-                 if not date_str: continue
-                 try:
-                     date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-                 except ValueError: continue
-
-                 if date_obj == target_date_obj:
-                     day_data = day.get('day', {})
-                     if not day_data: continue
-
-                     temperature = day_data.get('avgtemp_c', 0.0)
-                     snow_cm = day_data.get('totalsnow_cm', 0.0)
-                     rain_mm = day_data.get('totalprecip_mm', 0.0)
-                     visibility = day_data.get('avgvis_km', 0.0)
-
-                     if isinstance(temperature, (int, float)): temperature_sum += temperature
-                     if isinstance(snow_cm, (int, float)): snow_sum += snow_cm
-                     if isinstance(rain_mm, (int, float)): rain_sum += rain_mm
-                     if isinstance(visibility, (int, float)): visibility_sum += visibility
-
-                     valid_coordinates += 1
-                     found_date = True
-                     break
-         except HTTPError as http_err_inner:
-            if http_err_inner.response is not None and http_err_inner.response.status_code == 429:
-                raise
-            else:
-                print(f"Error retrieving weather data for {lat}, {lon} (HTTPError): {http_err_inner}")
-                continue
-         except RequestException as e_inner:
-            print(f"Error retrieving weather data for {lat}, {lon} (RequestException): {e_inner}")
-            continue
-         except (KeyError, ValueError, TypeError) as e_inner:
-            print(f"Error processing weather data for {lat}, {lon}: {e_inner}")
+    for forecast_days in get_forecast_days(api_key, valid_pairs):
+        if not forecast_days:
             continue
+        for day in forecast_days:
+             date_str = day.get('date')
+             if not date_str: continue
+             try:
+                 date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
+             except ValueError:
+                 continue
+
+             if date_obj == target_date_obj:
+                 day_data = day.get('day', {})
+                 if not day_data: continue
+
+                 temperature = day_data.get('avgtemp_c', 0.0)
+                 snow_cm = day_data.get('totalsnow_cm', 0.0)
+                 rain_mm = day_data.get('totalprecip_mm', 0.0)
+                 visibility = day_data.get('avgvis_km', 0.0)
+
+                 if isinstance(temperature, (int, float)): temperature_sum += temperature
+                 if isinstance(snow_cm, (int, float)): snow_sum += snow_cm
+                 if isinstance(rain_mm, (int, float)): rain_sum += rain_mm
+                 if isinstance(visibility, (int, float)): visibility_sum += visibility
+
+                 valid_coordinates += 1
+                 break
 
     if valid_coordinates > 0:
         average_temperature = temperature_sum / valid_coordinates
@@ -420,8 +381,16 @@ traffic_congestion_encoded = {'low': 0, 'medium': 1, 'high': 2}
 rain_encoded = {'low': 0, 'medium': 1, 'high': 2}
 snow_encoded = {'low': 0, 'medium': 1, 'high': 2}
 
+HYDROGEN_FEATURES = [
+    "Vehicle_age", "Goods_weight", "Avg_traffic_congestion", "Avg_temp", "Avg_Precipitation",
+    "Avg_snow", "Origin_depot", "Destination_depot", "Avg_Speed_mph", "Distance_highway",
+    "Distance_city", "dispatch_time", "total_payload", "tank_capacity", "range",
+    "Closest_station", "Total_distance_miles"
+] + vehicle_type_encoded
+model_registry.register('hydrogen', 'Hydrogen_model.pkl', HYDROGEN_FEATURES)
+
 
-def get_raw_input(Origin_depot, Destination_depot, nearest_fuel_station, total_highway_distance,
+def get_feature_values(Origin_depot, Destination_depot, nearest_fuel_station, total_highway_distance,
                   total_city_distance, traffic_congestion_level, average_temperature, rain_classification,
                   snow_classification, pallets, Vehicle_age, Goods_weight, Avg_Speed_mph, dispatch_time, vehicle_type,
                   vehicle_range, Tank_capacity, total_payload):
@@ -441,26 +410,26 @@ def get_raw_input(Origin_depot, Destination_depot, nearest_fuel_station, total_h
     Avg_Speed_mph = 65
 
     input_data = {
-        "Vehicle_age": [Vehicle_age],
-        "Goods_weight": [Goods_weight],
-        "Avg_traffic_congestion": [encoded_avg_traffic_congestion],
-        "Avg_temp": [average_temperature],
-        "Avg_Precipitation": [encoded_avg_rain],
-        "Avg_snow": [encoded_avg_snow],
-        "Origin_depot": [encoded_origin],
-        "Destination_depot": [encoded_destination],
-        "Avg_Speed_mph": [Avg_Speed_mph],
-        "Distance_highway": [total_highway_distance],
-        "Distance_city": [total_city_distance],
-        "dispatch_time": [encoded_dispatch_time],
-        "total_payload": [total_payload],
-        "tank_capacity": [Tank_capacity],
-        "range": [vehicle_range],
-        "Closest_station": [encoded_nearest_station],
-        "Total_distance_miles": [total_city_distance + total_highway_distance]
+        "Vehicle_age": Vehicle_age,
+        "Goods_weight": Goods_weight,
+        "Avg_traffic_congestion": encoded_avg_traffic_congestion,
+        "Avg_temp": average_temperature,
+        "Avg_Precipitation": encoded_avg_rain,
+        "Avg_snow": encoded_avg_snow,
+        "Origin_depot": encoded_origin,
+        "Destination_depot": encoded_destination,
+        "Avg_Speed_mph": Avg_Speed_mph,
+        "Distance_highway": total_highway_distance,
+        "Distance_city": total_city_distance,
+        "dispatch_time": encoded_dispatch_time,
+        "total_payload": total_payload,
+        "tank_capacity": Tank_capacity,
+        "range": vehicle_range,
+        "Closest_station": encoded_nearest_station,
+        "Total_distance_miles": total_city_distance + total_highway_distance
     }
 
     input_data.update(dummy_variables)
     end_time = time.time()
 
-    return pd.DataFrame(input_data)
\ No newline at end of file
+    return input_data
\ No newline at end of file
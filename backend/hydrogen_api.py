@@ -1,17 +1,20 @@
 from flask import Blueprint, request, jsonify
-from tracking import get_route_traffic_data, get_weather_data, calculate_distances as calculate_distances_tracking, get_coordinates as get_coordinates_tracking
-from hydrogen import find_nearest_station, get_raw_input
+from tracking import get_route_analysis, get_weather_data, get_coordinates as get_coordinates_tracking
+from hydrogen import find_nearest_station, get_feature_values
+from model_registry import model_registry
+from metrics import stage_timer
 from hydrogen_here_map import get_here_directions, get_coordinates as here_get_coordinates_nominatim
 from geopy.distance import geodesic
 from typing import Dict, Any, List, Tuple, Optional
-import joblib
-import pandas as pd
-import numpy as np
 import random
-import time
 import traceback
 from config import Config
 from requests.exceptions import HTTPError
+from task_graph import AbortRequest, TaskGraph
+from polyline_simplify import parse_simplify_params, simplify_route
+from response_format import json_response
+from jobs_api import submit_route_job, wants_job
+from single_flight import route_flight, route_request_key
 
 DEFINITIVE_H2_STATIONS: List[Dict[str, Any]] = [
     {'postal_code': 'AB12 3FU', 'name': 'Aberdeen H2 Station', 'coords': (57.10741937854072, -2.0904684228947445)},
@@ -28,12 +31,13 @@ KNOWN_DEPOT_COORDS = {
     'Cardiff': (51.4816, -3.1791), 'Aberdeen': (57.1497, -2.0943)
 }
 
-model = joblib.load('Hydrogen_model.pkl')
 hydrogen_api_bp = Blueprint('hydrogen_api', __name__)
+HYDROGEN_PRICE_PER_KG = 12
 
 vehicle_type_encoded = ['HVS HGV', 'HVS MCV', 'Hymax Series']
 origin_encoded = {'Aberdeen': 0, 'Birmingham': 1, 'Cardiff': 2, 'Glasgow': 3, 'Leeds': 4, 'Liverpool': 5, 'London': 6, 'Manchester': 7}
 nearest_station_encoded = {'AB12 3SH': 0, 'B25 8DW': 1, 'S60 5WG': 2, 'SN3 4QS': 3, 'TW6 2GE': 4}
+STATION_POSTAL_CODES = ['AB12 3SH', 'S60 5WG', 'B25 8DW', 'SN3 4QS', 'TW6 2GE']
 dispatch_encoded = {'morning': 0, 'night': 1, 'noon': 2}
 traffic_congestion_encoded = {'low': 0, 'medium': 1, 'high': 2}
 rain_encoded = {'low': 0, 'medium': 1, 'high': 2}
@@ -48,260 +52,277 @@ def convert_time_to_window(time_str):
     else: return "night"
 
 
+def parse_hydrogen_request(form) -> Dict[str, Any]:
+    try:
+        params = {
+            "pallets": float(form['pallets']),
+            "vehicle_type": form['vehicleModel'],
+            "destination_depot": form['destinationDepot'],
+            "vehicle_age": float(form['vehicleAge']),
+            "dispatch_time_str": form['dispatchTime'],
+            "target_date": form['journeyDate'],
+        }
+    except KeyError as e: raise AbortRequest(f"Missing field: {e}")
+    except ValueError as e: raise AbortRequest(f"Invalid value: {e}")
+
+    params["fuel_origin"] = float(form.get('fuelAtOrigin', 0))
+    params["origin_lat"] = form.get('originLat', type=float)
+    params["origin_lon"] = form.get('originLon', type=float)
+    params["origin_depot_name"] = form.get('originDepot')
+    params["feature_importance_version"] = form.get('featureImportanceVersion')
+    params.update(parse_simplify_params(form))
+    if (params["origin_lat"] is None or params["origin_lon"] is None) and not params["origin_depot_name"]:
+        raise AbortRequest("Missing origin info")
+    return params
+
+
+def vehicle_specs(vehicle_type: str) -> Tuple[int, int]:
+    if vehicle_type == 'HVS HGV': return 300, 51
+    elif vehicle_type == 'HVS MCV': return 370, 51
+    elif vehicle_type == 'Hymax Series': return 422, 60
+    print(f"Warn: Unknown vehicle {vehicle_type}")
+    return 300, 51
+
+
+def resolve_origin(params: Dict[str, Any]) -> Tuple[Tuple[float, float], str, str]:
+    origin_lat, origin_lon, origin_depot_name = params["origin_lat"], params["origin_lon"], params["origin_depot_name"]
+    if origin_lat is not None and origin_lon is not None:
+        origin_coordinates = (origin_lat, origin_lon); origin_display_name = "Current Location (GPS)"
+        print(f"Using GPS origin: {origin_coordinates}")
+        min_distance = float('inf'); nearest_depot_name = None
+        input_gps_coords = origin_coordinates; print("Calculating nearest known depot for model input...")
+        if KNOWN_DEPOT_COORDS:
+            for name, coords in KNOWN_DEPOT_COORDS.items():
+                try:
+                     if isinstance(coords, (list, tuple)) and len(coords) == 2:
+                          dist = geodesic(input_gps_coords, coords).miles
+                          if dist < min_distance: min_distance = dist; nearest_depot_name = name
+                     else: print(f"Warn: Invalid depot coords {name}")
+                except Exception as e: print(f"Warn: Dist calc error {name}: {e}")
+        origin_for_model = nearest_depot_name if nearest_depot_name else 'London'
+        if nearest_depot_name: print(f"GPS mapped to model origin: '{origin_for_model}'")
+        else: print(f"Defaulting model origin to '{origin_for_model}'.")
+        return origin_coordinates, origin_for_model, origin_display_name
+
+    print(f"Using Depot origin: {origin_depot_name}. Geocoding...")
+    origin_coordinates = get_coordinates_tracking(f"{origin_depot_name}, UK")
+    if not (origin_coordinates and origin_coordinates[0] is not None):
+          raise AbortRequest(f"Could not geocode origin depot: {origin_depot_name}")
+    print(f"Geocoded Depot origin: {origin_coordinates}")
+    return origin_coordinates, origin_depot_name, origin_depot_name
+
+
+def resolve_destination(destination_depot: str) -> Tuple[float, float]:
+    print(f"Geocoding destination: {destination_depot}...")
+    destination_coordinates = get_coordinates_tracking(f"{destination_depot}, UK")
+    if not (destination_coordinates and destination_coordinates[0] is not None):
+        raise AbortRequest(f"Could not geocode dest depot: {destination_depot}")
+    print(f"Geocoded Destination: {destination_coordinates}")
+    return destination_coordinates
+
+
+def resolve_map_destination(destination_depot: str) -> Optional[Tuple[float, float]]:
+    dest_coords_here_tuple = here_get_coordinates_nominatim(destination_depot)
+    if dest_coords_here_tuple and dest_coords_here_tuple[0] is not None:
+        return dest_coords_here_tuple
+    print("Warning: Skipping HERE routing, failed to geocode destination with Nominatim.")
+    return None
+
+
+def fetch_weather(target_date: str, route_analysis) -> Tuple[float, str, str]:
+    if route_analysis.weather_coordinates:
+         return get_weather_data(Config.WEATHER_API_KEY, route_analysis.weather_coordinates, target_date)
+    print("Warning: Skipping weather data fetch.")
+    return 0.0, "Low", "Low"
+
+
+@stage_timer('feature_build')
+def hydrogen_feature_values(params: Dict[str, Any], origin_for_model: str, nearest_station_postal_code, route_analysis, weather) -> Dict[str, float]:
+    average_temperature, snow_classification, rain_classification = weather
+    vehicle_range, Tank_capacity = vehicle_specs(params["vehicle_type"])
+    total_payload = params["pallets"] * 0.88; goods_weight = total_payload
+    traffic_severity = "high" if route_analysis.traffic_delay > 30 else "medium" if route_analysis.traffic_delay > 7 else "low"
+    print(f"Traffic Severity: {traffic_severity} (Delay: {route_analysis.traffic_delay:.2f} mins)")
+
+    input_data = get_feature_values(
+        Origin_depot=origin_for_model, Destination_depot=params["destination_depot"],
+        nearest_fuel_station=nearest_station_postal_code,
+        total_highway_distance=route_analysis.highway_distance, total_city_distance=route_analysis.city_distance,
+        traffic_congestion_level=traffic_severity,
+        average_temperature=average_temperature,
+        rain_classification=rain_classification, snow_classification=snow_classification,
+        pallets=params["pallets"], Vehicle_age=params["vehicle_age"], Goods_weight=goods_weight,
+        Avg_Speed_mph=65, dispatch_time=convert_time_to_window(params["dispatch_time_str"]), vehicle_type=params["vehicle_type"],
+        vehicle_range=vehicle_range, Tank_capacity=Tank_capacity, total_payload=total_payload
+    )
+    return input_data
+
+
+def predict_efficiency(params: Dict[str, Any], origin_for_model: str, nearest_station_postal_code, route_analysis, weather) -> float:
+    input_data = hydrogen_feature_values(params, origin_for_model, nearest_station_postal_code, route_analysis, weather)
+    return model_registry.get('hydrogen').predict_values(input_data)
+
+
+def best_refuelling_station(origin_coords, dest_coords) -> Optional[Dict[str, Any]]:
+    min_total_deviation_distance = float('inf'); best_station = None
+    if DEFINITIVE_H2_STATIONS:
+        for station in DEFINITIVE_H2_STATIONS:
+            station_coords = station.get('coords')
+            if not (isinstance(station_coords, tuple) and len(station_coords) == 2): continue
+            try:
+                deviation_dist = (geodesic(origin_coords, station_coords).miles +
+                                  geodesic(station_coords, dest_coords).miles)
+                if deviation_dist < min_total_deviation_distance:
+                    min_total_deviation_distance = deviation_dist; best_station = station
+            except Exception as e: print(f"Warn: Dist calc error station {station.get('name')}: {e}")
+    else: print("Warn: Definitive station list empty.")
+    return best_station
+
+
+def route_via_best_station(origin_coords, dest_coords) -> Optional[Tuple[list, list]]:
+    # (route points, station points) through the least-deviation station, or None when
+    # no station is usable and the caller should fall back to the direct route.
+    best_station = best_refuelling_station(origin_coords, dest_coords)
+    if not best_station:
+        print("[MAP ROUTE] No suitable station found. Calculating direct route.")
+        return None
+    best_station_name = best_station.get('name', 'H2 Station')
+    best_station_coords = best_station.get('coords')
+    print(f"[MAP ROUTE] Best station: '{best_station_name}'")
+    here_api_key = Config.HERE_API_KEY
+    origin_to_station_route = get_here_directions(origin_coords, best_station_coords, here_api_key)
+    station_to_dest_route = get_here_directions(best_station_coords, dest_coords, here_api_key)
+    if origin_to_station_route and station_to_dest_route:
+        return origin_to_station_route + station_to_dest_route, [{"name": best_station_name, "coordinates": best_station_coords}]
+    print("Warn: Failed route via station. Falling back direct.")
+    return None
+
+
+def direct_route(origin_coords, dest_coords) -> list:
+    route = get_here_directions(origin_coords, dest_coords, Config.HERE_API_KEY)
+    if not route: print("Warning: Failed to get direct route polyline from HERE.")
+    return route or []
+
+
+def needs_refuelling(params: Dict[str, Any], route_analysis, efficiency_prediction: float) -> bool:
+    total_dist = route_analysis.city_distance + route_analysis.highway_distance
+    total_required_fuel = total_dist / efficiency_prediction if efficiency_prediction else float('inf')
+    return not params["fuel_origin"] > total_required_fuel
+
+
+def map_route(params, origin, map_destination, analysis, prediction, station_route) -> Tuple[list, list]:
+    if map_destination is None:
+        return [], []
+    origin_coords = origin[0]
+    if not needs_refuelling(params, analysis, prediction):
+        print("[MAP ROUTE] Fuel sufficient. Calculating direct HERE Route.")
+        return direct_route(origin_coords, map_destination), []
+    print("[MAP ROUTE] Fuel needed. Finding best station from definitive list...")
+    if station_route is None and params["fuel_origin"] > 0:
+        station_route = route_via_best_station(origin_coords, map_destination)
+    if station_route is None:
+        return direct_route(origin_coords, map_destination), []
+    return station_route
+
+
+def build_hydrogen_context_graph(params: Dict[str, Any]) -> TaskGraph:
+    # Stages that only depend on origin, destination and journey date.
+    graph = TaskGraph('hydrogen')
+    graph.add('origin', lambda: resolve_origin(params))
+    graph.add('destination', lambda: resolve_destination(params["destination_depot"]))
+    graph.add('map_destination', lambda: resolve_map_destination(params["destination_depot"]))
+    graph.add('nearest_station', lambda origin: find_nearest_station(f"{origin[1]}, UK", STATION_POSTAL_CODES, Config.MAPBOX_TOKEN),
+              deps=('origin',))
+    graph.add('analysis', lambda origin, destination: get_route_analysis(origin[0], destination), deps=('origin', 'destination'))
+    graph.add('weather', lambda analysis: fetch_weather(params["target_date"], analysis), deps=('analysis',))
+    return graph
+
+
+def prefetch_station_route(params: Dict[str, Any], origin, map_destination) -> Optional[Tuple[list, list]]:
+    # With no fuel at origin a refuelling stop is always needed, so the via-station legs
+    # can be fetched before the prediction is known.
+    if map_destination and params["fuel_origin"] <= 0:
+        return route_via_best_station(origin[0], map_destination)
+    return None
+
+
+def build_hydrogen_graph(params: Dict[str, Any]) -> TaskGraph:
+    graph = build_hydrogen_context_graph(params)
+    graph.add('prediction', lambda origin, nearest_station, analysis, weather: predict_efficiency(params, origin[1], nearest_station, analysis, weather),
+              deps=('origin', 'nearest_station', 'analysis', 'weather'))
+    graph.add('station_route', lambda origin, map_destination: prefetch_station_route(params, origin, map_destination),
+              deps=('origin', 'map_destination'))
+    graph.add('map_route', lambda **stages: map_route(params, **stages),
+              deps=('origin', 'map_destination', 'analysis', 'prediction', 'station_route'))
+    return graph
+
+
+def build_hydrogen_response(params: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
+    _, _, origin_display_name = results['origin']
+    route_analysis = results['analysis']
+    total_city_distance, total_highway_distance = route_analysis.city_distance, route_analysis.highway_distance
+    average_temperature, snow_classification, rain_classification = results['weather']
+    efficiency_prediction = results['prediction']
+    route_points, station_points = results['map_route']
+
+    Total_dist_analytics = total_city_distance + total_highway_distance
+    if efficiency_prediction == 0: Total_Required_Fuel = float('inf')
+    else: Total_Required_Fuel = Total_dist_analytics / efficiency_prediction
+    Total_cost_hydrogen = Total_Required_Fuel * HYDROGEN_PRICE_PER_KG
+    Cost_per_mile = Total_cost_hydrogen / Total_dist_analytics if Total_dist_analytics > 0 else 0
+    overhead_cost = Total_cost_hydrogen * 0.1
+    total_cost = Total_cost_hydrogen + overhead_cost; total_final_cost = total_cost
+
+    good_value_fuel = random.uniform(1.0, Total_cost_hydrogen if Total_cost_hydrogen > 1 else 10)
+    insurance_fuel_cost = random.uniform(1.0, good_value_fuel)
+    goods_loading_time = random.randint(10, 60)
+    is_goods_secured = random.choice(['✔️', '❌'])
+    check_safety = random.choice(['✔️', '❌'])
+
+    return {
+        "success": True,
+        "route": { "origin": origin_display_name, "destination": params["destination_depot"], "coordinates": simplify_route(params, route_points), "stations": station_points, "total_distance": round(Total_dist_analytics, 2)},
+        "analytics": {
+             "average_temperature": round(average_temperature, 2),"rain_classification": rain_classification,"snow_classification": snow_classification,
+             "highway_distance": round(total_highway_distance, 2),"city_distance": round(total_city_distance, 2), "efficiency_prediction": round(efficiency_prediction, 2),
+             "total_required_fuel": round(Total_Required_Fuel, 2) if Total_Required_Fuel != float('inf') else "Infinity",
+             "total_fuel_cost": round(Total_cost_hydrogen, 2) if Total_Required_Fuel != float('inf') else "Infinity",
+             "total_cost": round(total_cost, 2) if Total_Required_Fuel != float('inf') else "Infinity",
+             "cost_per_mile": round(Cost_per_mile, 2) if Total_dist_analytics > 0 else 0,
+             "overhead_cost": round(overhead_cost, 2) if Total_Required_Fuel != float('inf') else "Infinity",
+             "total_final_cost": round(total_final_cost, 2) if Total_Required_Fuel != float('inf') else "Infinity",
+             "fuel_price": HYDROGEN_PRICE_PER_KG, "good_value_fuel": round(good_value_fuel, 2), "insurance_fuel_cost": round(insurance_fuel_cost, 2),
+             "goods_loading_time": goods_loading_time, "is_goods_secured": is_goods_secured, "check_safety": check_safety,
+             **model_registry.importance_fields('hydrogen', params.get("feature_importance_version"))
+        }
+    }
+
+
+def compute_hydrogen_route(params: Dict[str, Any]) -> Dict[str, Any]:
+    # Identical requests in flight at the same time (several dispatchers opening the same
+    # plan, client retries) wait for the first one and share its response.
+    key = route_request_key('hydrogen', params, convert_time_to_window(params["dispatch_time_str"]))
+    return route_flight.do(key, lambda: run_hydrogen_graph(params))
+
+
+def run_hydrogen_graph(params: Dict[str, Any]) -> Dict[str, Any]:
+    return build_hydrogen_response(params, build_hydrogen_graph(params).run())
+
+
 @hydrogen_api_bp.route('/api/hydrogen/route', methods=['POST'])
 def hydrogen_route_api():
-    overall_start_time = time.perf_counter()
-    print("\n--- [HYDROGEN API START] ---")
-
     try:
-        t_start = time.perf_counter()
-        station_postal_codes = ['AB12 3SH', 'S60 5WG', 'B25 8DW', 'SN3 4QS', 'TW6 2GE']
-
-        try:
-            pallets = float(request.form['pallets'])
-            vehicle_type = request.form['vehicleModel']
-            destination_depot = request.form['destinationDepot']
-            vehicle_age = float(request.form['vehicleAge'])
-            dispatch_time_str = request.form['dispatchTime']
-            target_date = request.form['journeyDate']
-        except KeyError as e: return jsonify({"success": False, "error": f"Missing field: {e}"}), 400
-        except ValueError as e: return jsonify({"success": False, "error": f"Invalid value: {e}"}), 400
-
-        fuel_origin = float(request.form.get('fuelAtOrigin', 0))
-        dispatch_time = convert_time_to_window(dispatch_time_str)
-        total_payload = pallets * 0.88; goods_weight = total_payload
-        if vehicle_type == 'HVS HGV': vehicle_range = 300; Tank_capacity = 51
-        elif vehicle_type == 'HVS MCV': vehicle_range = 370; Tank_capacity = 51
-        elif vehicle_type == 'Hymax Series': vehicle_range = 422; Tank_capacity = 60
-        else: vehicle_range = 300; Tank_capacity = 51; print(f"Warn: Unknown vehicle {vehicle_type}")
-
-        origin_lat = request.form.get('originLat', type=float)
-        origin_lon = request.form.get('originLon', type=float)
-        origin_depot_name = request.form.get('originDepot')
-        origin_coordinates: Optional[Tuple[float, float]] = None
-        origin_for_model: Optional[str] = None
-        origin_display_name: Optional[str] = None
-
-        if origin_lat is not None and origin_lon is not None:
-            origin_coordinates = (origin_lat, origin_lon); origin_display_name = "Current Location (GPS)"
-            print(f"Using GPS origin: {origin_coordinates}")
-            min_distance = float('inf'); nearest_depot_name = None
-            input_gps_coords = origin_coordinates; print("Calculating nearest known depot for model input...")
-            if KNOWN_DEPOT_COORDS:
-                for name, coords in KNOWN_DEPOT_COORDS.items():
-                    try:
-                         if isinstance(coords, (list, tuple)) and len(coords) == 2:
-                              dist = geodesic(input_gps_coords, coords).miles
-                              if dist < min_distance: min_distance = dist; nearest_depot_name = name
-                         else: print(f"Warn: Invalid depot coords {name}")
-                    except Exception as e: print(f"Warn: Dist calc error {name}: {e}")
-            origin_for_model = nearest_depot_name if nearest_depot_name else 'London'
-            if nearest_depot_name: print(f"GPS mapped to model origin: '{origin_for_model}'")
-            else: print(f"Defaulting model origin to '{origin_for_model}'.")
-        elif origin_depot_name:
-            origin_for_model = origin_depot_name; origin_display_name = origin_depot_name
-            print(f"Using Depot origin: {origin_depot_name}. Geocoding...")
-            origin_coordinates = get_coordinates_tracking(f"{origin_depot_name}, UK")
-            if not (origin_coordinates and origin_coordinates[0] is not None):
-                  return jsonify({"success": False, "error": f"Could not geocode origin depot: {origin_depot_name}"}), 400
-            print(f"Geocoded Depot origin: {origin_coordinates}")
-        else: return jsonify({"success": False, "error": "Missing origin info"}), 400
-
-        print(f"Geocoding destination: {destination_depot}...")
-        destination_coordinates = get_coordinates_tracking(f"{destination_depot}, UK")
-        if not (destination_coordinates and destination_coordinates[0] is not None):
-            return jsonify({"success": False, "error": f"Could not geocode dest depot: {destination_depot}"}), 400
-        print(f"Geocoded Destination: {destination_coordinates}")
-
-        print(f"[TIMER] Setup & Geocoding: {time.perf_counter() - t_start:.4f}s")
-
-        t_start = time.perf_counter()
-        mapbox_token = Config.MAPBOX_TOKEN
-
-        origin_name_for_station_find = f"{origin_for_model}, UK"
-        nearest_station_postal_code = find_nearest_station(origin_name_for_station_find, station_postal_codes, mapbox_token)
-        t_find_station = time.perf_counter()
-        print(f"[TIMER] -> find_nearest_station (Mapbox): {t_find_station - t_start:.4f}s")
-
-        total_city_distance, total_highway_distance = 0.0, 0.0
-        if origin_coordinates and destination_coordinates:
-             total_city_distance, total_highway_distance = calculate_distances_tracking(origin_coordinates, destination_coordinates)
-        else: return jsonify({"success": False, "error": "Internal error: Missing coords for dist calc."}), 500
-        t_distances = time.perf_counter()
-        print(f"[TIMER] -> calculate_distances (Mapbox O->D): {t_distances - t_find_station:.4f}s")
-
-        route_coords_for_weather = []
-        traffic_delay = 0.0
-        if origin_coordinates and destination_coordinates:
-            route_coords_for_weather, traffic_delay = get_route_traffic_data(origin_coordinates, destination_coordinates)
-        else: print("Error: Missing coordinates for traffic/weather route fetch.")
-        t_traffic_weather_coords = time.perf_counter()
-        print(f"[TIMER] -> get_route_traffic_data (Coords+Delay): {t_traffic_weather_coords - t_distances:.4f}s")
-
-        traffic_severity = "high" if traffic_delay > 30 else "medium" if traffic_delay > 7 else "low"
-        print(f"Traffic Severity: {traffic_severity} (Delay: {traffic_delay:.2f} mins)")
-
-        weather_api_key = Config.WEATHER_API_KEY
-        average_temperature, snow_classification, rain_classification = 0.0, "Low", "Low"
-        if route_coords_for_weather:
-             average_temperature, snow_classification, rain_classification = get_weather_data(weather_api_key, route_coords_for_weather, target_date)
-        else: print("Warning: Skipping weather data fetch.")
-        t_weather = time.perf_counter()
-        print(f"[TIMER] -> get_weather_data (WeatherAPI Loop): {t_weather - t_traffic_weather_coords:.4f}s")
-        print(f"[TIMER] TOTAL Analytics Data Fetching: {t_weather - t_start:.4f}s")
-
-        t_start = time.perf_counter()
-        raw_input_df = get_raw_input(
-            Origin_depot=origin_for_model, Destination_depot=destination_depot,
-            nearest_fuel_station=nearest_station_postal_code,
-            total_highway_distance=total_highway_distance, total_city_distance=total_city_distance,
-            traffic_congestion_level=traffic_severity,
-            average_temperature=average_temperature,
-            rain_classification=rain_classification, snow_classification=snow_classification,
-            pallets=pallets, Vehicle_age=vehicle_age, Goods_weight=goods_weight,
-            Avg_Speed_mph=65, dispatch_time=dispatch_time, vehicle_type=vehicle_type,
-            vehicle_range=vehicle_range, Tank_capacity=Tank_capacity, total_payload=total_payload
-        )
-        t_prep = time.perf_counter()
-        print(f"[TIMER] -> get_raw_input (Prep): {t_prep - t_start:.4f}s")
-        try: prediction = model.predict(raw_input_df)
-        except AttributeError: prediction = model._Booster.predict(raw_input_df)
-        efficiency_prediction = prediction[0] if prediction else 0
-        t_predict = time.perf_counter(); print(f"[TIMER] -> model.predict: {t_predict - t_prep:.4f}s")
-        print(f"[TIMER] TOTAL Prediction: {t_predict - t_start:.4f}s")
-
-        t_start = time.perf_counter()
-        Total_dist_analytics = total_city_distance + total_highway_distance
-        if efficiency_prediction == 0: Total_Required_Fuel = float('inf')
-        else: Total_Required_Fuel = Total_dist_analytics / efficiency_prediction
-        Total_cost_hydrogen = Total_Required_Fuel * 12
-        Cost_per_mile = Total_cost_hydrogen / Total_dist_analytics if Total_dist_analytics > 0 else 0
-        overhead_cost = Total_cost_hydrogen * 0.1
-        total_cost = Total_cost_hydrogen + overhead_cost; total_final_cost = total_cost
-        print(f"[TIMER] Cost Calculation: {time.perf_counter() - t_start:.4f}s")
-
-        t_start = time.perf_counter()
-        here_api_key = Config.HERE_API_KEY
-        route_points = []; station_points = []
-        actual_route_distance = Total_dist_analytics
-
-        if origin_coordinates and destination_coordinates:
-            origin_coords_tuple_for_here = origin_coordinates
-            dest_coords_here_tuple = here_get_coordinates_nominatim(destination_depot)
-
-            if dest_coords_here_tuple and dest_coords_here_tuple[0] is not None:
-                dest_coords_tuple_for_here = dest_coords_here_tuple
-                t_here_dest_coords = time.perf_counter()
-                print(f"[TIMER] -> here_get_coordinates_nominatim (Dest): {t_here_dest_coords - t_start:.4f}s")
-
-                if fuel_origin > Total_Required_Fuel:
-                    print("[MAP ROUTE] Fuel sufficient. Calculating direct HERE Route.")
-                    t_route_start = time.perf_counter()
-                    direct_route = get_here_directions(origin_coords_tuple_for_here, dest_coords_tuple_for_here, here_api_key)
-                    print(f"[TIMER] -> HERE Direct Route API Call: {time.perf_counter() - t_route_start:.4f}s")
-                    if direct_route: route_points = direct_route
-                    else: print("Warning: Failed to get direct route polyline from HERE.")
-                    station_points = []
-                else:
-                    print("[MAP ROUTE] Fuel needed. Finding best station from definitive list...")
-                    min_total_deviation_distance = float('inf'); best_station = None
-                    if DEFINITIVE_H2_STATIONS:
-                        for station in DEFINITIVE_H2_STATIONS:
-                            station_coords = station.get('coords')
-                            if not (isinstance(station_coords, tuple) and len(station_coords) == 2): continue
-                            try:
-                                deviation_dist = (geodesic(origin_coords_tuple_for_here, station_coords).miles +
-                                                  geodesic(station_coords, dest_coords_tuple_for_here).miles)
-                                if deviation_dist < min_total_deviation_distance:
-                                    min_total_deviation_distance = deviation_dist; best_station = station
-                            except Exception as e: print(f"Warn: Dist calc error station {station.get('name')}: {e}")
-                    else: print("Warn: Definitive station list empty.")
-
-                    if best_station:
-                        best_station_name = best_station.get('name', 'H2 Station')
-                        best_station_coords = best_station.get('coords')
-                        print(f"[MAP ROUTE] Best station: '{best_station_name}'")
-                        t_route_start = time.perf_counter()
-                        origin_to_station_route = get_here_directions(origin_coords_tuple_for_here, best_station_coords, here_api_key)
-                        station_to_dest_route = get_here_directions(best_station_coords, dest_coords_tuple_for_here, here_api_key)
-                        print(f"[TIMER] -> HERE Route API Calls (O->S, S->D): {time.perf_counter() - t_route_start:.4f}s")
-                        if origin_to_station_route and station_to_dest_route:
-                            route_points = origin_to_station_route + station_to_dest_route
-                            station_points = [{"name": best_station_name, "coordinates": best_station_coords}]
-                        else:
-                            print("Warn: Failed route via station. Falling back direct.")
-                            t_route_start = time.perf_counter()
-                            direct_route = get_here_directions(origin_coords_tuple_for_here, dest_coords_tuple_for_here, here_api_key)
-                            print(f"[TIMER] -> HERE Direct Route (Fallback): {time.perf_counter() - t_route_start:.4f}s")
-                            if direct_route: route_points = direct_route
-                            station_points = []
-                    else:
-                        print("[MAP ROUTE] No suitable station found. Calculating direct route.")
-                        t_route_start = time.perf_counter()
-                        direct_route = get_here_directions(origin_coords_tuple_for_here, dest_coords_tuple_for_here, here_api_key)
-                        print(f"[TIMER] -> HERE Direct Route (No Station): {time.perf_counter() - t_route_start:.4f}s")
-                        if direct_route: route_points = direct_route
-                        station_points = []
-            else:
-                print("Warning: Skipping HERE routing, failed to geocode destination with Nominatim.")
-        else:
-            print("Warning: Skipping HERE routing due to missing origin/destination coordinates.")
-
-        print(f"[TIMER] TOTAL Map Route Generation: {time.perf_counter() - t_start:.4f}s")
-
-        t_start = time.perf_counter(); feature_importance_data = []
-        if hasattr(model, 'feature_importances_'):
-             feature_importance = model.feature_importances_
-             if raw_input_df is not None and not raw_input_df.empty:
-                  sorted_idx = np.argsort(feature_importance)[::-1]; top_8_idx = sorted_idx[:8]
-                  feature_names = list(raw_input_df.columns); top_8_idx = [i for i in top_8_idx if i < len(feature_names)]
-                  top_feature_names = [feature_names[i] for i in top_8_idx]; top_feature_values = [float(feature_importance[i]) for i in top_8_idx]
-                  feature_importance_data = [{"name": name, "value": value} for name, value in zip(top_feature_names, top_feature_values)]
-             else: print("Warn: Cannot calc FI, input df empty.")
-        elif hasattr(model, '_Booster') and hasattr(model._Booster, 'get_score'):
-             try:
-                  fscore = model._Booster.get_score(importance_type='weight')
-                  if fscore:
-                       sorted_features = sorted(fscore.items(), key=lambda item: item[1], reverse=True); top_features = sorted_features[:8]
-                       feature_importance_data = [{"name": name, "value": float(score)} for name, score in top_features]
-                  else: print("Warn: Booster get_score empty.")
-             except Exception as fi_err: print(f"Warn: FI error: {fi_err}")
-        else: print("Warn: Model has no FI attribute.")
-
-        good_value_fuel = random.uniform(1.0, Total_cost_hydrogen if Total_cost_hydrogen > 1 else 10)
-        insurance_fuel_cost = random.uniform(1.0, good_value_fuel)
-        goods_loading_time = random.randint(10, 60)
-        is_goods_secured = random.choice(['✔️', '❌'])
-        check_safety = random.choice(['✔️', '❌'])
-        print(f"[TIMER] Feature Imp & Final Prep: {time.perf_counter() - t_start:.4f}s")
-
-        t_start = time.perf_counter()
-        response = {
-            "success": True,
-            "route": { "origin": origin_display_name, "destination": destination_depot, "coordinates": route_points, "stations": station_points, "total_distance": round(Total_dist_analytics, 2)},
-            "analytics": {
-                 "average_temperature": round(average_temperature, 2),"rain_classification": rain_classification,"snow_classification": snow_classification,
-                 "highway_distance": round(total_highway_distance, 2),"city_distance": round(total_city_distance, 2), "efficiency_prediction": round(efficiency_prediction, 2),
-                 "total_required_fuel": round(Total_Required_Fuel, 2) if Total_Required_Fuel != float('inf') else "Infinity",
-                 "total_fuel_cost": round(Total_cost_hydrogen, 2) if Total_Required_Fuel != float('inf') else "Infinity",
-                 "total_cost": round(total_cost, 2) if Total_Required_Fuel != float('inf') else "Infinity",
-                 "cost_per_mile": round(Cost_per_mile, 2) if Total_dist_analytics > 0 else 0,
-                 "overhead_cost": round(overhead_cost, 2) if Total_Required_Fuel != float('inf') else "Infinity",
-                 "total_final_cost": round(total_final_cost, 2) if Total_Required_Fuel != float('inf') else "Infinity",
-                 "fuel_price": 12, "good_value_fuel": round(good_value_fuel, 2), "insurance_fuel_cost": round(insurance_fuel_cost, 2),
-                 "goods_loading_time": goods_loading_time, "is_goods_secured": is_goods_secured, "check_safety": check_safety,
-                 "featureImportance": feature_importance_data
-            }
-        }
-        print(f"[TIMER] Response Construction: {time.perf_counter() - t_start:.4f}s")
-        print(f"--- [HYDROGEN API END] TOTAL TIME: {time.perf_counter() - overall_start_time:.4f}s ---")
-        return jsonify(response)
+        params = parse_hydrogen_request(request.form)
+        if wants_job():
+            return submit_route_job('hydrogen', lambda: compute_hydrogen_route(params))
+        return json_response(compute_hydrogen_route(params))
 
+    except AbortRequest as abort:
+        return jsonify({"success": False, "error": abort.message}), abort.status
     except HTTPError as http_err:
         err_url = http_err.request.url if http_err.request else "Unknown URL"
         if http_err.response is not None and http_err.response.status_code == 429:
             print(f"External API rate limit (429) hit for URL: {err_url}. Notifying frontend.")
-            print(f"--- [HYDROGEN API END - RATE LIMIT ERROR] TOTAL TIME: {time.perf_counter() - overall_start_time:.4f}s ---")
             return jsonify({
                 "success": False,
                 "error_type": "RATE_LIMIT_EXCEEDED",
@@ -311,5 +332,4 @@ def hydrogen_route_api():
             raise http_err
     except Exception as e:
         error_traceback = traceback.format_exc(); print(f"Error in hydrogen route API: {str(e)}\n{error_traceback}")
-        print(f"--- [HYDROGEN API END - ERROR] TOTAL TIME: {time.perf_counter() - overall_start_time:.4f}s ---")
-        return jsonify({"success": False,"error": f"An unexpected error occurred: {str(e)}",}), 500
\ No newline at end of file
+        return jsonify({"success": False,"error": f"An unexpected error occurred: {str(e)}",}), 500
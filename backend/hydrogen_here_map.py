@@ -1,113 +1,18 @@
 from geopy.distance import geodesic
 import requests
-from geopy.geocoders import Nominatim
-from collections import namedtuple
+import http_client
 import time
 from config import Config
+from geocode_cache import cached_geocode, GeocodeNotFound
+from route_cache import cached_route
+from flexpolyline import decode as decode_polyline
 from requests.exceptions import HTTPError, RequestException
 
 here_api_key = Config.HERE_API_KEY
+NOMINATIM_SEARCH_URL = "https://nominatim.openstreetmap.org/search"
 
-FORMAT_VERSION = 1
-DECODING_TABLE = [62, -1, -1, 52, 53, 54, 55, 56, 57, 58, 59, 60, 61, -1, -1, -1, -1, -1, -1, -1,
-                  0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21,
-                  22, 23, 24, 25, -1, -1, -1, -1, 63, -1, 26, 27, 28, 29, 30, 31, 32, 33, 34, 35,
-                  36, 37, 38, 39, 40, 41, 42, 43, 44, 45, 46, 47, 48, 49, 50, 51]
-
-PolylineHeader = namedtuple('PolylineHeader', 'precision,third_dim,third_dim_precision')
-
-def decode_header(decoder):
-    try:
-        version = next(decoder)
-        if version != FORMAT_VERSION:
-            raise ValueError('Invalid format version')
-        value = next(decoder)
-        precision = value & 15
-        value >>= 4
-        third_dim = value & 7
-        third_dim_precision = (value >> 3) & 15
-        return PolylineHeader(precision, third_dim, third_dim_precision)
-    except StopIteration:
-        raise ValueError("Invalid encoding. Empty string or missing header.")
-
-
-def decode_char(char):
-    char_value = ord(char)
-    try:
-        value = DECODING_TABLE[char_value - 45]
-    except IndexError:
-        raise ValueError('Invalid encoding character')
-    if value < 0:
-        raise ValueError('Invalid encoding character')
-    return value
-
-def to_signed(value):
-    if value & 1:
-        value = ~value
-    value >>= 1
-    return value
-
-def decode_unsigned_values(encoded):
-    result = shift = 0
-    for char in encoded:
-        value = decode_char(char)
-        result |= (value & 0x1F) << shift
-        if (value & 0x20) == 0:
-            yield result
-            result = shift = 0
-        else:
-            shift += 5
-            if shift > 30:
-                 raise ValueError("Invalid encoding. Possible corruption detected.")
-    if shift > 0:
-        raise ValueError('Invalid encoding. Unfinished sequence.')
-
-def iter_decode(encoded):
-    if not encoded:
-         return iter([])
-
-    last_lat = last_lng = last_z = 0
-    decoder = decode_unsigned_values(encoded)
-    try:
-        header = decode_header(decoder)
-    except ValueError as e:
-         print(f"Error decoding polyline header: {e}")
-         return iter([])
-    except StopIteration:
-         print("Error decoding polyline: No data after header.")
-         return iter([])
-
-    factor_degree = 10.0 ** header.precision
-    factor_z = 10.0 ** header.third_dim_precision
-    third_dim = header.third_dim
-    while True:
-        try:
-            last_lat += to_signed(next(decoder))
-        except StopIteration:
-            return
-        except ValueError as e:
-             print(f"Error decoding latitude delta: {e}")
-             return iter([])
-
-        try:
-            last_lng += to_signed(next(decoder))
-            if third_dim:
-                try:
-                    last_z += to_signed(next(decoder))
-                    yield (last_lat / factor_degree, last_lng / factor_degree, last_z / factor_z)
-                except StopIteration:
-                     print("Error decoding polyline: Premature ending before Z delta.")
-                     raise ValueError("Invalid encoding. Premature ending before Z delta.")
-            else:
-                yield (last_lat / factor_degree, last_lng / factor_degree)
-        except StopIteration:
-             print("Error decoding polyline: Premature ending after latitude delta.")
-             raise ValueError("Invalid encoding. Premature ending reached after latitude delta.")
-        except ValueError as e:
-             print(f"Error decoding longitude/z delta: {e}")
-             return iter([])
-
-def get_here_directions(origin, destination, api_key):
+@cached_route('car')
+def get_here_polyline(origin, destination, api_key):
     if not all([origin, destination, api_key]):
         print("Warning: Missing input for get_here_directions")
         return None
@@ -117,7 +22,7 @@ def get_here_directions(origin, destination, api_key):
 
     url = f"https://router.hereapi.com/v8/routes?transportMode=car&origin={origin[0]},{origin[1]}&destination={destination[0]},{destination[1]}&return=polyline&apikey={api_key}"
     try:
-        response = requests.get(url, timeout=20)
+        response = http_client.get(url, timeout=20)
         response.raise_for_status()
         data = response.json()
 
@@ -127,8 +32,8 @@ def get_here_directions(origin, destination, api_key):
             if sections:
                 polyline_str = sections[0].get('polyline')
                 if polyline_str:
-                    decoded_route = list(iter_decode(polyline_str))
-                    if not decoded_route:
+                    decoded_route = decode_polyline(polyline_str)
+                    if not len(decoded_route):
                          print("Warning: Polyline decoding resulted in empty list.")
                          return None
                     return decoded_route
@@ -150,18 +55,27 @@ def get_here_directions(origin, destination, api_key):
          print(f"Error processing HERE directions data: {e}")
          return None
 
+def get_here_directions(origin, destination, api_key):
+    route = get_here_polyline(origin, destination, api_key)
+    return route.tolist() if route is not None else None
+
+@cached_geocode('nominatim', empty=(None, None))
 def get_coordinates(city):
     if not city: return None, None
     try:
         user_agent = getattr(Config, 'NOMINATIM_USER_AGENT', 'h2_route_app_v1')
-        geolocator = Nominatim(user_agent=user_agent, timeout=10)
         query = city if "uk" in city.lower() else f"{city}, UK"
-        location = geolocator.geocode(query, exactly_one=True)
-        if location:
-            return location.latitude, location.longitude
+        response = http_client.get(NOMINATIM_SEARCH_URL, params={"q": query, "format": "json", "limit": 1},
+                                   headers={"User-Agent": user_agent}, timeout=10)
+        response.raise_for_status()
+        results = response.json()
+        if results:
+            return float(results[0]["lat"]), float(results[0]["lon"])
         else:
             print(f"Warning: Nominatim could not geocode city: {city}")
-            return None, None
+            raise GeocodeNotFound(city)
+    except GeocodeNotFound:
+        raise
     except Exception as e:
          print(f"Error during Nominatim geocoding for {city}: {e}")
          return None, None
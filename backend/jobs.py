@@ -0,0 +1,174 @@
+import contextvars
+import itertools
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Tuple
+from config import Config
+from task_graph import AbortRequest, error_body, is_rate_limited
+
+# In-process job queue for route requests made in job mode: a bounded priority queue in
+# front of a fixed pool of worker threads, and a result store that forgets finished jobs
+# JOB_RESULT_TTL seconds after they finish. No broker; jobs live and die with the process.
+
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind: str, fn: Callable[[], Dict[str, Any]], priority: int):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.fn = fn
+        self.priority = priority
+        self.status = QUEUED
+        self.result: Optional[Dict[str, Any]] = None
+        self.result_status: Optional[int] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.context = contextvars.copy_context()
+
+    def describe(self) -> Dict[str, Any]:
+        body = {"job_id": self.id, "kind": self.kind, "status": self.status, "created_at": self.created_at,
+                "started_at": self.started_at, "finished_at": self.finished_at}
+        if self.status in (DONE, FAILED):
+            body["result"] = self.result
+            body["result_status"] = self.result_status
+        return body
+
+
+def outcome(exc: BaseException) -> Tuple[Dict[str, Any], int]:
+    # The body and status the synchronous endpoint would have answered with.
+    if isinstance(exc, AbortRequest):
+        return error_body(exc), exc.status
+    if is_rate_limited(exc):
+        return error_body(exc), 429
+    return error_body(exc), 500
+
+
+class JobQueue:
+    def __init__(self, workers: int, max_queued: int, result_ttl: float):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self._queue: "queue.PriorityQueue[Tuple[int, int, Job]]" = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._counters = {"submitted": 0, "rejected": 0, DONE: 0, FAILED: 0, CANCELLED: 0}
+        self._waits = deque(maxlen=1000)
+        self._runs = deque(maxlen=1000)
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'job-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kind: str, fn: Callable[[], Dict[str, Any]], priority: int = PRIORITIES['normal']) -> Job:
+        self._ensure_started()
+        self._expire()
+        job = Job(kind, fn, priority)
+        with self._lock:
+            if sum(1 for queued in self._jobs.values() if queued.status == QUEUED) >= self.max_queued:
+                self._counters["rejected"] += 1
+                raise QueueFull(f"Job queue is full ({self.max_queued} queued)")
+            self._jobs[job.id] = job
+            self._counters["submitted"] += 1
+        # Lower priority value first, FIFO within a priority.
+        self._queue.put((priority, next(self._sequence), job))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._expire()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        # A queued job is skipped when a worker reaches it. A running one can't be
+        # interrupted mid-stage, so it finishes in the background and its result is dropped.
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in (QUEUED, RUNNING):
+                return job
+            job.status = CANCELLED
+            job.finished_at = time.time()
+            job.fn = None
+            self._counters[CANCELLED] += 1
+            return job
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def _work(self) -> None:
+        while True:
+            _, _, job = self._queue.get()
+            with self._lock:
+                if job.status != QUEUED:
+                    continue
+                fn = job.fn
+                job.status = RUNNING
+                job.started_at = time.time()
+                self._waits.append(job.started_at - job.created_at)
+            try:
+                result, status = job.context.run(fn), 200
+            except Exception as exc:
+                if not isinstance(exc, AbortRequest) and not is_rate_limited(exc):
+                    print(f"Error in {job.kind} job {job.id}: {exc}\n{traceback.format_exc()}")
+                result, status = outcome(exc)
+            with self._lock:
+                self._runs.append(time.time() - job.started_at)
+                if job.status == CANCELLED:
+                    continue
+                job.result, job.result_status = result, status
+                job.status = DONE if status == 200 else FAILED
+                job.finished_at = time.time()
+                job.fn = None
+                self._counters[job.status] += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            waits, runs = sorted(self._waits), sorted(self._runs)
+            statuses = [job.status for job in self._jobs.values()]
+            return {
+                "workers": self.workers,
+                "queue_length": statuses.count(QUEUED),
+                "running": statuses.count(RUNNING),
+                "stored": len(self._jobs),
+                **self._counters,
+                "wait_seconds": _summary(waits),
+                "run_seconds": _summary(runs),
+            }
+
+
+def _summary(values) -> Dict[str, Optional[float]]:
+    # Over the most recent 1000 jobs.
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "max": None}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 3),
+        "p50": round(values[len(values) // 2], 3),
+        "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+        "max": round(values[-1], 3),
+    }
+
+
+job_queue = JobQueue(Config.JOB_WORKERS, Config.JOB_QUEUE_MAX, Config.JOB_RESULT_TTL)
@@ -0,0 +1,47 @@
+from typing import Any, Callable, Dict
+from flask import Blueprint, request, jsonify, url_for
+from jobs import PRIORITIES, QueueFull, job_queue
+from response_format import compact_payload, json_response, wants_compact
+
+jobs_api_bp = Blueprint('jobs_api', __name__)
+
+
+def wants_job() -> bool:
+    # `mode=job` (query or form) or `Prefer: respond-async` turns a route request into a job.
+    return request.values.get('mode') == 'job' or 'respond-async' in request.headers.get('Prefer', '')
+
+
+def submit_route_job(kind: str, fn: Callable[[], Dict[str, Any]]):
+    priority = request.values.get('priority', 'normal')
+    if priority not in PRIORITIES:
+        return jsonify({"success": False, "error": f"Invalid priority: {priority} (expected one of {', '.join(PRIORITIES)})"}), 400
+    try:
+        job = job_queue.submit(kind, fn, PRIORITIES[priority])
+    except QueueFull as e:
+        return jsonify({"success": False, "error": str(e)}), 503, {"Retry-After": "5"}
+    location = url_for('jobs_api.job_api', job_id=job.id)
+    return jsonify({"success": True, "job_id": job.id, "status": job.status, "status_url": location}), 202, {"Location": location}
+
+
+@jobs_api_bp.route('/api/jobs/<job_id>', methods=['GET'])
+def job_api(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": f"Unknown or expired job: {job_id}"}), 404
+    body = dict({"success": True}, **job.describe())
+    if body.get("result") and wants_compact():
+        body["result"] = compact_payload(body["result"])
+    return json_response(body)
+
+
+@jobs_api_bp.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job_api(job_id):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": f"Unknown or expired job: {job_id}"}), 404
+    return jsonify({"success": True, "job_id": job.id, "status": job.status})
+
+
+@jobs_api_bp.route('/api/jobs/metrics', methods=['GET'])
+def job_metrics_api():
+    return jsonify(dict({"success": True}, **job_queue.metrics()))
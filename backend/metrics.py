@@ -0,0 +1,163 @@
+import bisect
+import contextlib
+import math
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+# Process-local metrics in the Prometheus text exposition format, served from /api/metrics.
+# Histograms and counters are recorded as requests run; collectors registered with
+# register_stats() turn the stats() dicts the caches, clients and registries already keep
+# into gauges at scrape time.
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+_NAME_UNSAFE = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def metric_name(*parts: str) -> str:
+    return '_'.join(_NAME_UNSAFE.sub('_', str(part)) for part in parts if part)
+
+
+def _label_text(names: Sequence[str], values: Sequence[Any]) -> str:
+    if not names:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels[name] for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ('le',)
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (math.inf,), counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_label_text(names, key + (_number(bound),))} {cumulative}")
+                lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_label_text(self.labels, key)} {cumulative}")
+        return lines
+
+
+stage_seconds = Histogram(
+    'viewport_stage_seconds', 'Time spent in one stage of a route request',
+    ('stage',))
+graph_stage_seconds = Histogram(
+    'viewport_graph_stage_seconds', 'Time spent in each task graph stage, by graph',
+    ('graph', 'stage'))
+request_seconds = Histogram(
+    'viewport_http_request_duration_seconds', 'Time until the response is returned (first byte for streams)',
+    ('endpoint', 'method'))
+requests_total = Counter(
+    'viewport_http_requests_total', 'HTTP requests by endpoint, method and status',
+    ('endpoint', 'method', 'status'))
+
+_instruments = [stage_seconds, graph_stage_seconds, request_seconds, requests_total]
+_collectors: List[Tuple[str, str, Callable[[], Dict[str, Any]]]] = []
+
+
+@contextlib.contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    # `with stage_timer('weather'):` or `@stage_timer('weather')`; failures are timed too.
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=stage)
+
+
+def register_stats(name: str, stats: Callable[[], Dict[str, Any]], label: str = '') -> None:
+    # stats() returns {stat: number} or, with `label`, {label value: {stat: number}}.
+    # Non-numeric values (paths, versions) are skipped.
+    _collectors.append((name, label, stats))
+
+
+def _collect(name: str, label: str, stats: Dict[str, Any]) -> List[str]:
+    series: Dict[str, List[str]] = {}
+
+    def add(stat: str, value: Any, label_value: Any = None) -> None:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return
+        full_name = metric_name('viewport', name, stat)
+        labels = _label_text((label,), (label_value,)) if label else ''
+        series.setdefault(full_name, []).append(f"{full_name}{labels} {_number(value)}")
+
+    if label:
+        for label_value, values in stats.items():
+            for stat, value in (values or {}).items():
+                add(stat, value, label_value)
+    else:
+        for stat, value in stats.items():
+            if isinstance(value, dict):
+                # Nested summaries such as {"wait_seconds": {"mean": ..., "p95": ...}}
+                for inner, inner_value in value.items():
+                    add(f"{stat}_{inner}", inner_value)
+            else:
+                add(stat, value)
+
+    lines = []
+    for full_name, samples in series.items():
+        lines.append(f"# TYPE {full_name} gauge")
+        lines.extend(samples)
+    return lines
+
+
+def render() -> str:
+    lines = []
+    for instrument in _instruments:
+        lines.extend(instrument.render())
+    for name, label, stats in _collectors:
+        try:
+            lines.extend(_collect(name, label, stats()))
+        except Exception as e:
+            print(f"Warning: Metrics collector '{name}' failed: {e}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,52 @@
+import time
+from flask import Blueprint, Response, g, request
+import metrics
+from fuel_prices import fuel_prices
+from geocode_cache import geocode_cache
+from http_client import http_client
+from jobs import job_queue
+from model_registry import model_registry
+from polyline_simplify import simplify_cache
+from rate_limit import rate_limiter
+from route_cache import route_cache
+from route_store import route_store
+from single_flight import geocode_flight, polyline_flight, route_flight
+from station_index import station_index
+from weather import forecast_cache
+
+metrics_api_bp = Blueprint('metrics_api', __name__)
+
+metrics.register_stats('route_cache', route_cache.stats)
+metrics.register_stats('geocode_cache', geocode_cache.stats, label='provider')
+metrics.register_stats('route_store', route_store.stats, label='kind')
+metrics.register_stats('simplify_cache', simplify_cache.stats)
+metrics.register_stats('forecast_cache', forecast_cache.stats)
+metrics.register_stats('station_index', station_index.stats, label='category')
+metrics.register_stats('http_client', http_client.stats.snapshot, label='provider')
+metrics.register_stats('rate_limiter', rate_limiter.stats, label='provider')
+metrics.register_stats('fuel_prices', fuel_prices.stats)
+metrics.register_stats('model', model_registry.stats, label='model')
+metrics.register_stats('jobs', job_queue.metrics)
+for flight in (geocode_flight, polyline_flight, route_flight):
+    metrics.register_stats(f'single_flight_{flight.name}', flight.stats)
+
+
+@metrics_api_bp.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@metrics_api_bp.after_app_request
+def record_request(response):
+    # Labelled by route pattern (e.g. /api/jobs/<job_id>) so job ids don't become series.
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    started = g.get('request_started')
+    if started is not None:
+        metrics.request_seconds.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+    metrics.requests_total.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+    return response
+
+
+@metrics_api_bp.route('/api/metrics', methods=['GET'])
+def metrics_api():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,276 @@
+import gc
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Union
+import joblib
+import numpy as np
+import pandas as pd
+from metrics import stage_timer
+
+
+def sanitize_feature_name(name: str) -> str:
+    # LightGBM stores feature names with spaces replaced by underscores.
+    return name.replace(' ', '_')
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def model_feature_names(estimator) -> Optional[List[str]]:
+    booster = getattr(estimator, 'booster_', None) or getattr(estimator, '_Booster', None)
+    if booster is not None and hasattr(booster, 'feature_name'):
+        return list(booster.feature_name())
+    names = getattr(estimator, 'feature_names_in_', None)
+    return list(names) if names is not None else None
+
+
+def validate_features(name: str, expected: Sequence[str], actual: Optional[Sequence[str]]) -> None:
+    # A different column count can only mean the wrong model file; names that differ are
+    # reported but tolerated because the models were trained on a few differently named columns.
+    if actual is None:
+        print(f"Warning: Model '{name}' does not expose feature names; skipping validation.")
+        return
+    if len(expected) != len(actual):
+        raise ValueError(f"Model '{name}' expects {len(actual)} features but the app builds {len(expected)}")
+    mismatched = [(i, e, a) for i, (e, a) in enumerate(zip(expected, actual)) if sanitize_feature_name(e) != a]
+    for index, expected_name, actual_name in mismatched:
+        print(f"Warning: Model '{name}' feature {index} is '{actual_name}', app sends '{expected_name}'")
+
+
+def compute_feature_importance(estimator, features: Sequence[str], top: int = 8) -> List[Dict[str, float]]:
+    if hasattr(estimator, 'feature_importances_'):
+        importances = estimator.feature_importances_
+        top_idx = [i for i in np.argsort(importances)[::-1][:top] if i < len(features)]
+        return [{"name": features[i], "value": float(importances[i])} for i in top_idx]
+    if hasattr(estimator, '_Booster') and hasattr(estimator._Booster, 'get_score'):
+        try:
+            fscore = estimator._Booster.get_score(importance_type='weight')
+            top_features = sorted(fscore.items(), key=lambda item: item[1], reverse=True)[:top]
+            return [{"name": name, "value": float(score)} for name, score in top_features]
+        except Exception as e:
+            print(f"Warning: Could not get feature importance from model booster: {e}")
+            return []
+    print("Warning: Model does not have 'feature_importances_' or recognized booster method for importance.")
+    return []
+
+
+def importance_version(tag: str, importance: List[Dict[str, float]]) -> str:
+    digest = hashlib.sha256(tag.encode('utf-8'))
+    digest.update(json.dumps(importance, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LoadedModel:
+    def __init__(self, name: str, path: str, features: Sequence[str]):
+        self.name = name
+        self.path = path
+        self.features = list(features)
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        self.estimator = joblib.load(path)
+        self.load_seconds = time.perf_counter() - start
+        rss_after = _rss_bytes()
+        self.rss_bytes = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        self.file_bytes = os.path.getsize(path)
+        self.file_sha256 = file_digest(path)
+        self.model_features = model_feature_names(self.estimator)
+        validate_features(name, self.features, self.model_features)
+        self.booster = getattr(self.estimator, 'booster_', None) or getattr(self.estimator, '_Booster', None)
+        self.columns = self._column_positions()
+        self._rows = threading.local()
+        # Static per model file, so computed once here and served as-is.
+        self.feature_importance = compute_feature_importance(self.estimator, self.features)
+        self.importance_version = importance_version(self.file_sha256, self.feature_importance)
+
+    def _column_positions(self) -> Dict[str, int]:
+        # Column of each app feature in the booster's own order; names the model spells
+        # differently (already reported by validate_features) keep their registered position.
+        if not self.model_features:
+            return {feature: i for i, feature in enumerate(self.features)}
+        booster_positions = {feature: i for i, feature in enumerate(self.model_features)}
+        return {feature: booster_positions.get(sanitize_feature_name(feature), i) for i, feature in enumerate(self.features)}
+
+    def fill_row(self, values: Mapping[str, float]) -> np.ndarray:
+        # Writes into a per-thread preallocated (1, n) row; valid until this thread's next call.
+        row = getattr(self._rows, 'row', None)
+        if row is None:
+            row = self._rows.row = np.zeros((1, len(self.features)), dtype=np.float64)
+        else:
+            row.fill(0.0)
+        columns = self.columns
+        for feature, value in values.items():
+            row[0, columns[feature]] = value
+        return row
+
+    def fill_matrix(self, rows: Sequence[Mapping[str, float]]) -> np.ndarray:
+        matrix = np.zeros((len(rows), len(self.features)), dtype=np.float64)
+        columns = self.columns
+        for i, values in enumerate(rows):
+            for feature, value in values.items():
+                matrix[i, columns[feature]] = value
+        return matrix
+
+    @stage_timer('predict')
+    def predict_matrix(self, matrix: np.ndarray) -> np.ndarray:
+        # Straight to the booster: no DataFrame, no sklearn input validation.
+        if self.booster is None:
+            return np.asarray(self.estimator.predict(matrix), dtype=np.float64)
+        return np.asarray(self.booster.predict(matrix), dtype=np.float64)
+
+    def predict_row(self, row: np.ndarray) -> float:
+        return float(self.predict_matrix(row)[0])
+
+    def predict_values(self, values: Mapping[str, float]) -> float:
+        return self.predict_row(self.fill_row(values))
+
+    def predict_many(self, rows: Sequence[Mapping[str, float]]) -> np.ndarray:
+        # One booster call for the whole batch.
+        if not rows:
+            return np.empty(0, dtype=np.float64)
+        return self.predict_matrix(self.fill_matrix(rows))
+
+    def predict(self, rows: Union[pd.DataFrame, np.ndarray]) -> np.ndarray:
+        if isinstance(rows, pd.DataFrame) and list(rows.columns) != self.features:
+            raise ValueError(f"Input columns for model '{self.name}' do not match the registered feature order")
+        try:
+            return np.asarray(self.estimator.predict(rows))
+        except AttributeError:
+            if hasattr(self.estimator, '_Booster'):
+                return np.asarray(self.estimator._Booster.predict(rows))
+            print(f"Error during prediction: Model object type is {type(self.estimator)}")
+            raise
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "path": self.path,
+            "features": len(self.features),
+            "load_seconds": round(self.load_seconds, 4),
+            "rss_bytes": self.rss_bytes,
+            "file_bytes": self.file_bytes,
+            "importance_version": self.importance_version,
+        }
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._specs: Dict[str, tuple] = {}
+        self._models: Dict[str, LoadedModel] = {}
+        self._static_importance: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        # The parent may have forked while another thread held the lock.
+        self._lock = threading.Lock()
+
+    def register(self, name: str, path: str, features: Sequence[str]) -> None:
+        self._specs[name] = (path, list(features))
+
+    def get(self, name: str) -> LoadedModel:
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            model = self._models.get(name)
+            if model is None:
+                path, features = self._specs[name]
+                model = LoadedModel(name, path, features)
+                self._models[name] = model
+                print(f"Loaded model '{name}' from {path} in {model.load_seconds:.3f}s")
+            return model
+
+    def register_static_importance(self, name: str, importance: List[Dict[str, float]]) -> None:
+        # For vehicle families costed without a trained model.
+        importance = sorted(importance, key=lambda item: item["value"], reverse=True)
+        self._static_importance[name] = (importance_version(name, importance), importance)
+
+    def feature_importance(self, name: str) -> tuple:
+        # (version, importance); the version changes whenever the importance does.
+        if name in self._static_importance:
+            return self._static_importance[name]
+        model = self.get(name)
+        return model.importance_version, model.feature_importance
+
+    def importance_fields(self, name: str, client_version: Optional[str] = None) -> Dict[str, object]:
+        # Response fields for a route result; the importance itself is left out when the
+        # client says it already holds this version.
+        version, importance = self.feature_importance(name)
+        if client_version == version:
+            return {"featureImportanceVersion": version}
+        return {"featureImportanceVersion": version, "featureImportance": importance}
+
+    def importance_names(self) -> List[str]:
+        return list(self._specs) + list(self._static_importance)
+
+    def predict(self, name: str, rows: Union[pd.DataFrame, np.ndarray]) -> np.ndarray:
+        return self.get(name).predict(rows)
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> None:
+        for name in (names if names is not None else list(self._specs)):
+            self.get(name)
+        # Move everything allocated so far out of the collector's reach so its bookkeeping
+        # doesn't touch (and un-share) the model pages in forked workers.
+        gc.freeze()
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        return {name: model.stats() for name, model in self._models.items()}
+
+
+model_registry = ModelRegistry()
+
+
+if __name__ == "__main__":
+    # Parity and speed of the array fast path against the DataFrame path, on random rows
+    # for every model file shipped with the app.
+    import random
+    from diesel_api import DIESEL_FEATURES
+    from hydrogen import HYDROGEN_FEATURES
+
+    rng = random.Random(7)
+    for name, path, features in (('fossil', 'Fossil_model.pkl', DIESEL_FEATURES), ('hydrogen', 'Hydrogen_model.pkl', HYDROGEN_FEATURES)):
+        model = LoadedModel(name, path, features)
+        one_hot = features[-3:] if name == 'hydrogen' else features[-10:]
+        samples = []
+        for _ in range(500):
+            values = {feature: 0.0 if feature in one_hot else rng.uniform(0, 300) for feature in features}
+            values[rng.choice(one_hot)] = 1.0
+            samples.append(values)
+
+        max_diff = 0.0
+        for values in samples:
+            frame = pd.DataFrame({feature: [value] for feature, value in values.items()})
+            expected = float(model.predict(frame)[0])
+            max_diff = max(max_diff, abs(expected - model.predict_values(values)))
+        assert max_diff < 1e-9, f"{name}: fast path differs by {max_diff}"
+        batch_diff = float(np.max(np.abs(model.predict_many(samples) - [model.predict_values(values) for values in samples])))
+        assert batch_diff < 1e-9, f"{name}: batch path differs by {batch_diff}"
+
+        values = samples[0]
+        runs = 2000
+        start = time.perf_counter()
+        for _ in range(runs):
+            model.predict(pd.DataFrame({feature: [value] for feature, value in values.items()}))
+        frame_us = (time.perf_counter() - start) / runs * 1e6
+        start = time.perf_counter()
+        for _ in range(runs):
+            model.predict_values(values)
+        fast_us = (time.perf_counter() - start) / runs * 1e6
+        print(f"{name}: parity OK over {len(samples)} rows (max diff {max_diff:.1e}); "
+              f"DataFrame path {frame_us:.0f}us, array path {fast_us:.0f}us ({frame_us / fast_us:.0f}x)")
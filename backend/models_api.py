@@ -0,0 +1,20 @@
+from flask import Blueprint, request, jsonify
+from model_registry import model_registry
+
+models_api_bp = Blueprint('models_api', __name__)
+
+# Route endpoints call their models by registry name; accept the fuel names too.
+MODEL_ALIASES = {'diesel': 'fossil'}
+
+
+@models_api_bp.route('/api/models/<name>/feature-importance', methods=['GET'])
+def feature_importance_api(name):
+    name = MODEL_ALIASES.get(name, name)
+    if name not in model_registry.importance_names():
+        return jsonify({"success": False, "error": f"Unknown model: {name}"}), 404
+    version, importance = model_registry.feature_importance(name)
+    if version in request.if_none_match:
+        return "", 304, {"ETag": f'"{version}"'}
+    response = jsonify({"success": True, "model": name, "version": version, "featureImportance": importance})
+    response.set_etag(version)
+    return response
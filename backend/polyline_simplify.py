@@ -0,0 +1,192 @@
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+from config import Config
+from route_geometry import MEAN_EARTH_RADIUS_KM, as_points
+
+# Web Mercator ground resolution at the equator for zoom 0, metres per 256px-tile pixel
+METRES_PER_PIXEL_Z0 = 2 * math.pi * MEAN_EARTH_RADIUS_KM * 1000 / 256
+MAX_ZOOM = 22
+
+
+def tolerance_for_zoom(zoom: float, latitude: float, pixels: float = Config.SIMPLIFY_PIXELS) -> float:
+    # Metres covered by `pixels` screen pixels at this zoom and latitude; detail below that
+    # can't be seen on the map.
+    return pixels * METRES_PER_PIXEL_Z0 * math.cos(math.radians(latitude)) / 2 ** zoom
+
+
+def _project_m(points: np.ndarray) -> np.ndarray:
+    # Equirectangular projection around the route's mean latitude, in metres.
+    radius_m = MEAN_EARTH_RADIUS_KM * 1000
+    lat = np.radians(points[:, 0])
+    lon = np.radians(points[:, 1])
+    return np.column_stack((lat * radius_m, lon * radius_m * math.cos(float(lat.mean()))))
+
+
+def douglas_peucker_mask(points, tolerance_m: float) -> np.ndarray:
+    # Boolean mask of the vertices to keep. Instead of recursing span by span, each pass
+    # measures every still-open point against the chord of the span it falls in and splits
+    # every span whose farthest point is out of tolerance at once; spans that are within
+    # tolerance drop out. The Python loop runs once per recursion depth.
+    points = as_points(points)
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    if n < 3 or tolerance_m <= 0:
+        keep[:] = True
+        return keep
+
+    xy = _project_m(points)
+    x, y = np.ascontiguousarray(xy[:, 0]), np.ascontiguousarray(xy[:, 1])
+    active = np.arange(1, n - 1)
+    while len(active):
+        kept = np.flatnonzero(keep)
+        span = np.searchsorted(kept, active)
+        left, right = kept[span - 1], kept[span]
+        ax, ay = x[left], y[left]
+        bx, by = x[right] - ax, y[right] - ay
+        rx, ry = x[active] - ax, y[active] - ay
+        denom = bx * bx + by * by
+        t = np.clip((rx * bx + ry * by) / np.where(denom > 0, denom, 1.0), 0.0, 1.0)
+        distances = np.hypot(rx - t * bx, ry - t * by)
+
+        # `active` is sorted, so each span's points are contiguous.
+        span_starts = np.flatnonzero(np.r_[True, span[1:] != span[:-1]])
+        span_sizes = np.diff(np.r_[span_starts, len(active)])
+        farthest = np.maximum.reduceat(distances, span_starts)
+        split_spans = farthest > tolerance_m
+        if not split_spans.any():
+            break
+        slots = np.where(distances == np.repeat(farthest, span_sizes), np.arange(len(active)), len(active))
+        splits = np.minimum.reduceat(slots, span_starts)[split_spans]
+        keep[active[splits]] = True
+        still_open = np.repeat(split_spans, span_sizes)
+        still_open[splits] = False
+        active = active[still_open]
+    return keep
+
+
+def simplify(points, tolerance_m: float) -> np.ndarray:
+    points = as_points(points)
+    return points[douglas_peucker_mask(points, tolerance_m)]
+
+
+class SimplifyCache:
+    # Keyed by a digest of the route's coordinates and the tolerance, so the same route at
+    # the same zoom is only simplified once however it was fetched.
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[bytes, float], list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def simplify(self, points, tolerance_m: float) -> list:
+        points = np.ascontiguousarray(as_points(points))
+        key = (hashlib.blake2b(points.tobytes(), digest_size=16).digest(), round(tolerance_m, 3))
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        result = simplify(points, tolerance_m).tolist()
+        with self._lock:
+            self._entries[key] = result
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+simplify_cache = SimplifyCache(Config.SIMPLIFY_CACHE_SIZE)
+
+
+def parse_simplify_params(form) -> Dict[str, Optional[float]]:
+    # `simplify` is a tolerance in metres; `zoom` is the map zoom level the route is shown at.
+    tolerance = form.get('simplify', type=float)
+    zoom = form.get('zoom', type=float)
+    return {
+        "simplify_m": tolerance if tolerance is not None and tolerance > 0 else None,
+        "zoom": min(max(zoom, 0.0), MAX_ZOOM) if zoom is not None else None,
+    }
+
+
+def simplify_route(params: Dict[str, Any], route_points) -> list:
+    # Route coordinates as sent to the client, simplified when the request asked for it.
+    tolerance, zoom = params.get("simplify_m"), params.get("zoom")
+    if (tolerance is None and zoom is None) or len(route_points) < 3:
+        return route_points
+    points = as_points(route_points)
+    if tolerance is None:
+        tolerance = tolerance_for_zoom(zoom, float(points[:, 0].mean()))
+    return simplify_cache.simplify(points, tolerance)
+
+
+if __name__ == "__main__":
+    # Parity against a recursive implementation, then payload size and JSON encode time of
+    # a long synthetic road-like route (London to the north-west, winding, GPS-level jitter)
+    # at a few zoom levels.
+    import json
+    import time
+
+    rng = np.random.default_rng(3)
+    n = 40000
+    s = np.linspace(0, 1, n)
+    lat = 51.5074 + 2.0 * s + 0.05 * np.sin(40 * s) + 0.01 * np.sin(400 * s)
+    lon = -0.1278 - 2.1 * s + 0.08 * np.cos(25 * s) + 0.005 * np.sin(900 * s)
+    route = (np.column_stack((lat, lon)) + rng.normal(0, 2e-5, (n, 2))).round(5).tolist()
+
+    def reference_mask(points, tolerance_m):
+        # Textbook recursive Douglas-Peucker on the same projection.
+        xy = _project_m(as_points(points))
+        keep = np.zeros(len(xy), dtype=bool)
+        keep[0] = keep[-1] = True
+
+        def recurse(start, end):
+            if end - start < 2:
+                return
+            a, ab = xy[start], xy[end] - xy[start]
+            rel = xy[start + 1:end] - a
+            denom = float(ab @ ab)
+            t = np.clip(rel @ ab / denom, 0, 1) if denom else np.zeros(len(rel))
+            distances = np.hypot(*(rel - t[:, None] * ab).T)
+            index = int(np.argmax(distances))
+            if distances[index] > tolerance_m:
+                keep[start + 1 + index] = True
+                recurse(start, start + 1 + index)
+                recurse(start + 1 + index, end)
+
+        recurse(0, len(xy) - 1)
+        return keep
+
+    for tolerance_m in (1.0, 25.0, 500.0):
+        assert np.array_equal(douglas_peucker_mask(route[:5000], tolerance_m), reference_mask(route[:5000], tolerance_m))
+    print("parity with recursive Douglas-Peucker OK")
+
+    start = time.perf_counter()
+    full_json = json.dumps(route)
+    full_ms = (time.perf_counter() - start) * 1000
+    print(f"full: {len(route)} points, {len(full_json) / 1024:.0f} KiB, encode {full_ms:.1f}ms")
+    for zoom in (6, 9, 12, 15):
+        params = {"simplify_m": None, "zoom": zoom}
+        start = time.perf_counter()
+        simplified = simplify_route(params, route)
+        simplify_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        payload = json.dumps(simplified)
+        encode_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        simplify_route(params, route)
+        cached_ms = (time.perf_counter() - start) * 1000
+        print(f"zoom {zoom:>2}: {len(simplified)} points, {len(payload) / 1024:.0f} KiB, "
+              f"simplify {simplify_ms:.1f}ms (cached {cached_ms:.1f}ms), encode {encode_ms:.2f}ms")
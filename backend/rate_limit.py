@@ -0,0 +1,131 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+import requests
+from requests.exceptions import HTTPError
+from config import Config
+
+# Hard ceilings from provider usage policies; configuration can lower these but never raise them.
+POLICY_LIMITS = {
+    'nominatim': (1.0, 1),
+}
+
+
+class RateLimitExceeded(HTTPError):
+    # Looks like a provider 429 so the route handlers report RATE_LIMIT_EXCEEDED as usual.
+    def __init__(self, provider: str, wait: float):
+        response = requests.Response()
+        response.status_code = 429
+        super().__init__(f"Client-side rate limit for {provider}: next slot in {wait:.2f}s", response=response)
+        self.provider = provider
+        self.wait = wait
+
+
+def parse_limit(value: str) -> Tuple[float, int]:
+    # "<requests per second>/<burst>", e.g. "5/10"
+    rate, _, burst = value.partition('/')
+    rate = float(rate)
+    burst = int(burst) if burst else max(1, int(rate))
+    if not rate > 0 or burst < 1:
+        raise ValueError(f"Rate limit {value!r} needs a positive rate and a burst of at least 1")
+    return rate, burst
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.acquired = 0
+        self.waited = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        # Takes a token, letting the balance go negative so later callers queue behind earlier
+        # ones. Returns how long the caller must sleep, or None if that exceeds max_wait.
+        with self._lock:
+            self._refill(time.monotonic())
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                self.rejected += 1
+                return None
+            self._tokens -= 1
+            self.acquired += 1
+            if wait > 0:
+                self.waited += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                self.queue_depth += 1
+                self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            return wait
+
+    def next_slot(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+    def release_waiter(self) -> None:
+        with self._lock:
+            self.queue_depth -= 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "rate": self.rate, "burst": self.burst,
+                "queue_depth": self.queue_depth, "max_queue_depth": self.max_queue_depth,
+                "acquired": self.acquired, "waited": self.waited, "rejected": self.rejected,
+                "total_wait_seconds": self.total_wait, "max_wait_seconds": self.max_wait,
+            }
+
+
+class RateLimiter:
+    def __init__(self, limits: Dict[str, str], max_wait: float):
+        self.max_wait = max_wait
+        self._buckets: Dict[str, TokenBucket] = {}
+        # Policy providers always get a bucket; an empty setting only disables the others.
+        for provider, (rate, burst) in POLICY_LIMITS.items():
+            self._buckets[provider] = TokenBucket(rate, burst)
+        for provider, value in limits.items():
+            if not value:
+                continue
+            rate, burst = parse_limit(value)
+            if provider in POLICY_LIMITS:
+                policy_rate, policy_burst = POLICY_LIMITS[provider]
+                rate, burst = min(rate, policy_rate), min(burst, policy_burst)
+            self._buckets[provider] = TokenBucket(rate, burst)
+
+    def acquire(self, provider: str, max_wait: Optional[float] = None) -> float:
+        bucket = self._buckets.get(provider)
+        if bucket is None:
+            return 0.0
+        wait = bucket.reserve(self.max_wait if max_wait is None else max_wait)
+        if wait is None:
+            raise RateLimitExceeded(provider, bucket.next_slot())
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            finally:
+                bucket.release_waiter()
+        return wait
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {provider: bucket.stats() for provider, bucket in self._buckets.items()}
+
+
+rate_limiter = RateLimiter({
+    'here': Config.RATE_LIMIT_HERE,
+    'mapbox': Config.RATE_LIMIT_MAPBOX,
+    'weatherapi': Config.RATE_LIMIT_WEATHERAPI,
+    'maps_co': Config.RATE_LIMIT_MAPS_CO,
+    'nominatim': Config.RATE_LIMIT_NOMINATIM,
+}, Config.RATE_LIMIT_MAX_WAIT)
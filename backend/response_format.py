@@ -0,0 +1,120 @@
+import gzip
+import json
+from typing import Any, Dict, Optional, Tuple
+from flask import Response, current_app, request
+from config import Config
+from flexpolyline import decode, encode
+from metrics import stage_timer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Opt-in compact route format: `?format=compact` or `Accept: application/vnd.viewport.compact+json`.
+# The route comes back as one flexible-polyline string instead of nested [lat, lon] arrays and
+# the stations as rows under a shared field list. Either format is gzip/brotli encoded when
+# the client accepts it and the body is over COMPRESS_MIN_BYTES.
+
+COMPACT_MEDIA_TYPE = 'application/vnd.viewport.compact+json'
+POLYLINE_PRECISION = 5
+
+
+def wants_compact() -> bool:
+    if request.args.get('format') == 'compact':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', COMPACT_MEDIA_TYPE]) == COMPACT_MEDIA_TYPE
+
+
+def compact_stations(stations: list) -> Tuple[list, list]:
+    # [{"name": ..., "coordinates": [lat, lon], ...}] -> (["lat", "lon", "name", ...], [[lat, lon, name, ...]])
+    extra = [key for key in stations[0] if key != 'coordinates'] if stations else ['name']
+    rows = [[station["coordinates"][0], station["coordinates"][1]] + [station.get(key) for key in extra]
+            for station in stations]
+    return ['lat', 'lon'] + extra, rows
+
+
+def compact_route(route: Dict[str, Any]) -> Dict[str, Any]:
+    compact = {key: value for key, value in route.items() if key not in ('coordinates', 'stations')}
+    compact["polyline"] = encode(route.get("coordinates") or [], precision=POLYLINE_PRECISION)
+    compact["stationFields"], compact["stations"] = compact_stations(route.get("stations") or [])
+    return compact
+
+
+def compact_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    if not isinstance(payload.get("route"), dict):
+        return payload
+    return dict(payload, route=compact_route(payload["route"]), format="compact")
+
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=Config.BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=Config.GZIP_LEVEL)
+    return body
+
+
+def negotiate_encoding(size: int) -> Optional[str]:
+    if size < Config.COMPRESS_MIN_BYTES:
+        return None
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(offered)
+
+
+def json_response(payload: Dict[str, Any], status: int = 200) -> Response:
+    # Drop-in for jsonify() on the route endpoints.
+    with stage_timer('serialize'):
+        compact = wants_compact()
+        if compact:
+            payload = compact_payload(payload)
+        body = current_app.json.dumps(payload).encode('utf-8')
+        encoding = negotiate_encoding(len(body))
+        body = compress(body, encoding)
+    response = Response(body, status=status,
+                        mimetype=COMPACT_MEDIA_TYPE if compact else 'application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    return response
+
+
+if __name__ == "__main__":
+    # Payload bytes and encode time of a long multi-stop route in each format and encoding.
+    import time
+    import numpy as np
+
+    rng = np.random.default_rng(3)
+    n = 40000
+    s = np.linspace(0, 1, n)
+    lat = 51.5074 + 2.0 * s + 0.05 * np.sin(40 * s) + 0.01 * np.sin(400 * s)
+    lon = -0.1278 - 2.1 * s + 0.08 * np.cos(25 * s) + 0.005 * np.sin(900 * s)
+    coordinates = (np.column_stack((lat, lon)) + rng.normal(0, 2e-5, (n, 2))).round(5).tolist()
+    stations = [{"name": f"Fuel Station {i+1}", "coordinates": coordinates[i * 8000], "fuel_price": 142.9 + i}
+                for i in range(1, 5)]
+    payload = {"success": True, "route": {"origin": "London", "destination": "Manchester", "coordinates": coordinates,
+                                          "stations": stations, "total_distance": 208.4},
+               "analytics": {"efficiency_prediction": 7.33, "total_final_cost": 213.5}}
+
+    def timed(fn, repeat=5):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = fn()
+        return result, (time.perf_counter() - start) * 1000 / repeat
+
+    def dumps(value):
+        return json.dumps(value, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+    decoded = np.asarray(decode(compact_route(payload["route"])["polyline"]))
+    assert np.abs(decoded - np.asarray(coordinates)).max() < 1e-5
+    print("compact polyline round trip OK")
+
+    for name, build in (("json", lambda: dumps(payload)), ("compact", lambda: dumps(compact_payload(payload)))):
+        body, encode_ms = timed(build)
+        print(f"{name:>7}: {len(body) / 1024:7.1f} KiB, encode {encode_ms:6.1f}ms")
+        for encoding, level in (('gzip', Config.GZIP_LEVEL), ('br', Config.BROTLI_QUALITY)):
+            if encoding == 'br' and brotli is None:
+                print(f"{'':>7}  br: brotli not installed")
+                continue
+            compressed, compress_ms = timed(lambda: compress(body, encoding))
+            print(f"{'':>7}  {encoding:>4}: {len(compressed) / 1024:7.1f} KiB, compress {compress_ms:6.1f}ms (level {level})")
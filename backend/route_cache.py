@@ -0,0 +1,116 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import numpy as np
+from config import Config
+from metrics import stage_timer
+from route_store import route_store
+from single_flight import polyline_flight
+
+RouteKey = Tuple[str, Tuple[float, float], Tuple[float, float]]
+
+
+def snap_point(point, precision: int) -> Tuple[float, float]:
+    if isinstance(point, str):
+        point = point.split(',')
+    return round(float(point[0]), precision), round(float(point[1]), precision)
+
+
+class RouteCache:
+    def __init__(self, max_bytes: int, ttl: float, precision: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.precision = precision
+        self._entries: "OrderedDict[RouteKey, Tuple[np.ndarray, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, mode: str, origin, destination) -> RouteKey:
+        return mode, snap_point(origin, self.precision), snap_point(destination, self.precision)
+
+    def get(self, mode: str, origin, destination) -> Optional[np.ndarray]:
+        key = self.key(mode, origin, destination)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, mode: str, origin, destination, route: np.ndarray) -> None:
+        route = np.ascontiguousarray(route, dtype=np.float64)
+        if route.nbytes > self.max_bytes:
+            return
+        route.setflags(write=False)
+        key = self.key(mode, origin, destination)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (route, time.time() + self.ttl)
+            self._bytes += route.nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key: RouteKey) -> None:
+        route, _ = self._entries.pop(key)
+        self._bytes -= route.nbytes
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+route_cache = RouteCache(Config.ROUTE_CACHE_MAX_BYTES, Config.ROUTE_CACHE_TTL, Config.ROUTE_CACHE_PRECISION)
+
+
+def cached_route(mode: str):
+    # Wraps a fetcher with the signature (origin, destination, api_key) -> Optional[np.ndarray].
+    # Memory misses fall back to routes persisted by the depot warm-up before calling HERE.
+    def decorator(func):
+        @functools.wraps(func)
+        @stage_timer('route')
+        def wrapper(origin, destination, *args, **kwargs):
+            try:
+                cached = route_cache.get(mode, origin, destination)
+            except (TypeError, ValueError, IndexError):
+                return func(origin, destination, *args, **kwargs)
+            if cached is not None:
+                route_store.record_polyline(mode, origin, destination, cached)
+                return cached
+
+            def fetch():
+                route = route_store.get_polyline(mode, origin, destination)
+                if route is None:
+                    route = func(origin, destination, *args, **kwargs)
+                if route is not None and len(route):
+                    route_cache.put(mode, origin, destination, route)
+                return route
+
+            # Concurrent misses for the same snapped pair share one HERE call. Recording stays
+            # outside so a warm-up that joins a live request's call still persists the route.
+            route = polyline_flight.do(route_cache.key(mode, origin, destination), fetch)
+            if route is not None and len(route):
+                route_store.record_polyline(mode, origin, destination, route)
+            return route
+        return wrapper
+    return decorator
@@ -0,0 +1,88 @@
+import numpy as np
+from typing import Optional, Sequence, Tuple
+
+# WGS84 ellipsoid, kilometres
+WGS84_A_KM = 6378.137
+WGS84_F = 1 / 298.257223563
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+MEAN_EARTH_RADIUS_KM = 6371.0088
+KM_TO_MILES = 0.621371
+
+
+def as_points(points) -> np.ndarray:
+    array = np.asarray(points, dtype=np.float64)
+    if array.ndim != 2 or array.shape[1] < 2:
+        raise ValueError("Expected an (N, 2) array of lat/lon points")
+    return array[:, :2]
+
+
+def segment_lengths_km(points) -> np.ndarray:
+    # Each segment is measured on the tangent plane at its mid-latitude, scaled by the WGS84
+    # meridional (M) and prime-vertical (N) radii of curvature. Against the Karney geodesic
+    # used by geopy the relative error grows with (length / R)^2; for segments under 20 km
+    # at UK latitudes it stays below 1e-5 (0.001%). HERE polylines have vertices tens to
+    # hundreds of metres apart, so route totals agree with geopy to within a few centimetres.
+    pts = np.radians(as_points(points))
+    if len(pts) < 2:
+        return np.zeros(0, dtype=np.float64)
+
+    lat1, lat2 = pts[:-1, 0], pts[1:, 0]
+    d_lat = lat2 - lat1
+    d_lon = (pts[1:, 1] - pts[:-1, 1] + np.pi) % (2 * np.pi) - np.pi
+    mid_lat = (lat1 + lat2) / 2
+
+    sin2 = np.sin(mid_lat) ** 2
+    w = np.sqrt(1 - WGS84_E2 * sin2)
+    meridional = WGS84_A_KM * (1 - WGS84_E2) / w ** 3
+    prime_vertical = WGS84_A_KM / w
+    return np.hypot(meridional * d_lat, prime_vertical * np.cos(mid_lat) * d_lon)
+
+
+def haversine_km(origin, destinations) -> np.ndarray:
+    # Great-circle distance on the mean sphere; up to ~0.5% off the ellipsoid, which is
+    # fine for ranking candidates (nearest depot, nearest station).
+    lat1, lon1 = np.radians(np.asarray(origin, dtype=np.float64)[:2])
+    dest = np.radians(np.atleast_2d(np.asarray(destinations, dtype=np.float64))[:, :2])
+    lat2, lon2 = dest[:, 0], dest[:, 1]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * MEAN_EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class RouteGeometry:
+    def __init__(self, points):
+        self.points = as_points(points)
+        self.segment_km = segment_lengths_km(self.points)
+        self.cumulative_km = np.zeros(len(self.points), dtype=np.float64)
+        if len(self.segment_km):
+            np.cumsum(self.segment_km, out=self.cumulative_km[1:])
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    @property
+    def total_km(self) -> float:
+        return float(self.cumulative_km[-1]) if len(self.cumulative_km) else 0.0
+
+    @property
+    def total_miles(self) -> float:
+        return self.total_km * KM_TO_MILES
+
+    def index_at_distance(self, km: float, start: int = 0) -> Optional[int]:
+        # First vertex at or beyond `km` along the route (measured from the start of the
+        # route), searching from `start`. None when the route is shorter than `km`.
+        index = int(np.searchsorted(self.cumulative_km, km, side='left'))
+        index = max(index, start)
+        return index if index < len(self.cumulative_km) else None
+
+    def distance_between(self, start: int, end: int) -> float:
+        return float(self.cumulative_km[end] - self.cumulative_km[start])
+
+    def point(self, index: int) -> Tuple[float, float]:
+        lat, lon = self.points[index]
+        return float(lat), float(lon)
+
+
+def nearest_index(origin: Sequence[float], candidates) -> Tuple[int, float]:
+    distances = haversine_km(origin, candidates)
+    index = int(np.argmin(distances))
+    return index, float(distances[index])
@@ -0,0 +1,161 @@
+import contextlib
+import contextvars
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+from config import Config
+from flexpolyline import decode, encode
+
+# Persistent store for the slow-changing parts of a route (HERE polylines, station stops,
+# the Mapbox city/highway split and weather sample points), filled by warmup.py. Live
+# requests only read it; writes happen inside `route_store.recording()`.
+
+_recording = contextvars.ContextVar('route_store_recording', default=False)
+
+POLYLINE_PRECISION = 6
+
+# Remembered in memory for pairs with nothing stored, so repeated misses skip SQLite.
+_MISSING = object()
+
+
+class RouteStore:
+    def __init__(self, db_path: Optional[str], precision: int, ttl: float,
+                 max_entries: int = 4096, miss_ttl: float = 300):
+        self.db_path = db_path
+        self.precision = precision
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Misses are only remembered briefly: a warm-up in another process can fill the pair.
+        self.miss_ttl = miss_ttl
+        self._memory: "OrderedDict[Tuple[str, str], Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._db_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        if not self._db_ready:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS route_store (
+                kind TEXT NOT NULL,
+                route_key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (kind, route_key)
+            )
+            ''')
+            conn.commit()
+            self._db_ready = True
+        return conn
+
+    def key(self, origin, destination) -> str:
+        # Points may be (lat, lon) pairs or "lat,lon" strings, as passed to the HERE fetchers.
+        parts = []
+        for point in (origin, destination):
+            if isinstance(point, str):
+                point = point.split(',')
+            parts.append(f"{round(float(point[0]), self.precision)},{round(float(point[1]), self.precision)}")
+        return ';'.join(parts)
+
+    def _remember(self, key: Tuple[str, str], value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (value, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _count(self, kind: str, counter: str) -> None:
+        with self._lock:
+            self._counters[kind][counter] += 1
+
+    @contextlib.contextmanager
+    def recording(self):
+        token = _recording.set(True)
+        try:
+            yield self
+        finally:
+            _recording.reset(token)
+
+    @property
+    def is_recording(self) -> bool:
+        return _recording.get()
+
+    def get(self, kind: str, origin, destination) -> Any:
+        # Decoded JSON value, or None when nothing current is stored for the pair.
+        if not self.db_path or self.is_recording:
+            return None
+        try:
+            key = (kind, self.key(origin, destination))
+        except (TypeError, ValueError, IndexError):
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+            else:
+                entry = None
+        if entry is not None:
+            if entry[0] is _MISSING:
+                self._count(kind, 'misses')
+                return None
+            self._count(kind, 'hits')
+            return entry[0]
+
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    'SELECT value, expires_at FROM route_store WHERE kind = ? AND route_key = ? AND expires_at > ?',
+                    (kind, key[1], now)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Warning: Route store read failed ({self.db_path}): {e}")
+            return None
+        if row is None:
+            self._remember(key, _MISSING, now + self.miss_ttl)
+            self._count(kind, 'misses')
+            return None
+        value = json.loads(row[0])
+        self._remember(key, value, row[1])
+        self._count(kind, 'hits')
+        return value
+
+    def put(self, kind: str, origin, destination, value: Any) -> None:
+        if not self.db_path:
+            return
+        key = (kind, self.key(origin, destination))
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        try:
+            with self._connect() as conn:
+                conn.execute('INSERT OR REPLACE INTO route_store VALUES (?, ?, ?, ?)',
+                             (kind, key[1], json.dumps(value), expires_at))
+                conn.commit()
+            self._count(kind, 'stores')
+        except sqlite3.Error as e:
+            print(f"Warning: Route store write failed ({self.db_path}): {e}")
+
+    def record(self, kind: str, origin, destination, value: Any) -> None:
+        # Only persists while a warm-up is recording; live traffic never grows the store.
+        if self.is_recording:
+            self.put(kind, origin, destination, value)
+
+    def get_polyline(self, mode: str, origin, destination) -> Optional[np.ndarray]:
+        encoded = self.get(f"polyline:{mode}", origin, destination)
+        return decode(encoded) if encoded else None
+
+    def record_polyline(self, mode: str, origin, destination, route: np.ndarray) -> None:
+        if self.is_recording:
+            self.put(f"polyline:{mode}", origin, destination, encode(route, precision=POLYLINE_PRECISION))
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {kind: dict(counters) for kind, counters in self._counters.items()}
+
+
+route_store = RouteStore(Config.ROUTE_STORE_PATH, Config.ROUTE_CACHE_PRECISION, Config.ROUTE_STORE_TTL,
+                         Config.ROUTE_STORE_MEMORY_SIZE, Config.ROUTE_STORE_MISS_TTL)
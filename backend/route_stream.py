@@ -0,0 +1,161 @@
+import json
+import traceback
+from collections import namedtuple
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from task_graph import AbortRequest, TaskGraph, error_body, is_rate_limited
+from polyline_simplify import simplify_route
+from metrics import stage_timer
+import diesel_api
+import electric_api
+import hydrogen_api
+
+route_stream_bp = Blueprint('route_stream', __name__)
+
+# Server-Sent Events variants of the route endpoints. The same stage graph runs, and each
+# event is sent as soon as the stages it needs have finished:
+#   endpoints   geocoded origin and destination
+#   route       the route polyline (hydrogen sends the direct route first, then the final one)
+#   stations    fuel / charging / hydrogen stops
+#   distance    Mapbox city/highway split
+#   conditions  weather along the route and traffic delay
+#   result      the full body /api/<kind>/route returns, with prediction and costs
+#   error       the endpoint's error body, instead of `result`, if the request fails
+
+# name: log label
+# parse(form) -> params
+# graph(params) -> TaskGraph
+# events: [(event, stage names it needs, fn(params, results) -> data)]
+# finish(params, results) -> response body
+StreamKind = namedtuple('StreamKind', 'name,parse,graph,events,finish')
+
+
+def distance_event(params: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
+    analysis = results['analysis']
+    return {
+        "city_distance": round(analysis.city_distance, 2),
+        "highway_distance": round(analysis.highway_distance, 2),
+        "total_distance": round(analysis.city_distance + analysis.highway_distance, 2),
+    }
+
+
+def conditions_event(params: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
+    average_temperature, snow_classification, rain_classification = results['weather']
+    return {
+        "average_temperature": round(average_temperature, 2),
+        "rain_classification": rain_classification,
+        "snow_classification": snow_classification,
+        "traffic_delay": round(results['analysis'].traffic_delay, 2),
+    }
+
+
+def endpoints_event(origin_coords, origin_name: str, destination_coords, destination_name: str) -> Dict[str, Any]:
+    return {
+        "origin": origin_name,
+        "origin_coordinates": origin_coords,
+        "destination": destination_name,
+        "destination_coordinates": destination_coords,
+    }
+
+
+def route_event(route_points: list, params: Dict[str, Any]) -> Dict[str, Any]:
+    return {"coordinates": simplify_route(params, route_points)}
+
+
+def build_hydrogen_stream_graph(params: Dict[str, Any]) -> TaskGraph:
+    # The direct route is only part of the answer when no refuelling stop is needed, but it
+    # is ready long before the prediction and gives the map something to draw.
+    graph = hydrogen_api.build_hydrogen_graph(params)
+    graph.add('direct_route', lambda origin, map_destination: hydrogen_api.direct_route(origin[0], map_destination) if map_destination else [],
+              deps=('origin', 'map_destination'))
+    return graph
+
+
+DIESEL_STREAM = StreamKind(
+    'diesel', diesel_api.parse_diesel_request, diesel_api.build_diesel_graph,
+    [
+        ('endpoints', ('origin', 'destination'),
+         lambda params, r: endpoints_event(r['origin'][0], r['origin'][2], r['destination'], params["destination_depot"])),
+        ('route', ('route',), lambda params, r: route_event(r['route'], params)),
+        ('stations', ('stations', 'fuel_pricing'),
+         lambda params, r: {"stations": diesel_api.fuel_station_points(r['stations'][1], r['fuel_pricing'][1]),
+                            "fuel_price": round(r['fuel_pricing'][0], 2)}),
+        ('distance', ('analysis',), distance_event),
+        ('conditions', ('analysis', 'weather'), conditions_event),
+    ],
+    diesel_api.build_diesel_response,
+)
+ELECTRIC_STREAM = StreamKind(
+    'electric', electric_api.parse_electric_request, electric_api.build_electric_graph,
+    [
+        ('endpoints', ('origin', 'destination'),
+         lambda params, r: endpoints_event(r['origin'][0], r['origin'][1], r['destination'], params["destination_depot"])),
+        ('route', ('route',), lambda params, r: route_event(r['route'], params)),
+        ('stations', ('stations',), lambda params, r: {"stations": electric_api.charging_station_points(r['stations'][1])}),
+        ('distance', ('analysis',), distance_event),
+        ('conditions', ('analysis', 'weather'), conditions_event),
+    ],
+    electric_api.build_electric_response,
+)
+HYDROGEN_STREAM = StreamKind(
+    'hydrogen', hydrogen_api.parse_hydrogen_request, build_hydrogen_stream_graph,
+    [
+        ('endpoints', ('origin', 'destination'),
+         lambda params, r: endpoints_event(r['origin'][0], r['origin'][2], r['destination'], params["destination_depot"])),
+        ('route', ('direct_route',), lambda params, r: dict(route_event(r['direct_route'], params), preliminary=True)),
+        ('distance', ('analysis',), distance_event),
+        ('conditions', ('analysis', 'weather'), conditions_event),
+        ('route', ('map_route',), lambda params, r: route_event(r['map_route'][0], params)),
+        ('stations', ('map_route',), lambda params, r: {"stations": r['map_route'][1]}),
+    ],
+    hydrogen_api.build_hydrogen_response,
+)
+
+
+def sse(event: str, data: Dict[str, Any]) -> str:
+    with stage_timer('serialize'):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_route(kind: StreamKind, params: Dict[str, Any]) -> Iterator[str]:
+    graph = kind.graph(params)
+    waiting: List[Tuple[str, tuple, Callable]] = list(kind.events)
+    try:
+        for _ in graph.iter_run():
+            ready = [event for event in waiting if all(stage in graph.results for stage in event[1])]
+            for event in ready:
+                waiting.remove(event)
+                yield sse(event[0], event[2](params, graph.results))
+        yield sse('result', kind.finish(params, graph.results))
+    except Exception as exc:
+        if not isinstance(exc, AbortRequest) and not is_rate_limited(exc):
+            print(f"Error in {kind.name} route stream: {exc}\n{traceback.format_exc()}")
+        yield sse('error', error_body(exc))
+
+
+def stream_response(kind: StreamKind):
+    # GET as well as POST so browsers can use EventSource with the fields as query parameters.
+    try:
+        params = kind.parse(request.values)
+    except AbortRequest as abort:
+        return jsonify({"success": False, "error": abort.message}), abort.status
+    response = Response(stream_with_context(stream_route(kind, params)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from holding events back until the response is complete.
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@route_stream_bp.route('/api/diesel/route/stream', methods=['GET', 'POST'])
+def diesel_route_stream_api():
+    return stream_response(DIESEL_STREAM)
+
+
+@route_stream_bp.route('/api/hydrogen/route/stream', methods=['GET', 'POST'])
+def hydrogen_route_stream_api():
+    return stream_response(HYDROGEN_STREAM)
+
+
+@route_stream_bp.route('/api/electric/route/stream', methods=['GET', 'POST'])
+def electric_route_stream_api():
+    return stream_response(ELECTRIC_STREAM)
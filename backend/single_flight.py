@@ -0,0 +1,71 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+from config import Config
+
+# Coalesces identical concurrent calls: the first caller for a key runs the function and
+# every caller that arrives with the same key while it is running waits for it and gets the
+# same result (or exception). Nothing is kept once the call returns; caching is left to the
+# caches in front of or behind it. Shared results must be treated as read-only.
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leading = call is None
+            if leading:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leading:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+geocode_flight = SingleFlight('geocode')
+polyline_flight = SingleFlight('polyline')
+route_flight = SingleFlight('route')
+
+
+def route_request_key(kind: str, params: Dict[str, Any], dispatch_window: str) -> Hashable:
+    # Requests that compute the same response: GPS origins snapped to the route cache grid,
+    # the dispatch time reduced to the window the models see, every other field as parsed.
+    if params["origin_lat"] is not None and params["origin_lon"] is not None:
+        origin = (round(params["origin_lat"], Config.ROUTE_CACHE_PRECISION), round(params["origin_lon"], Config.ROUTE_CACHE_PRECISION))
+    else:
+        origin = params["origin_depot_name"]
+    rest = tuple(sorted((name, value) for name, value in params.items()
+                        if name not in ('origin_lat', 'origin_lon', 'origin_depot_name', 'dispatch_time_str')))
+    return kind, origin, dispatch_window, rest
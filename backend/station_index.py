@@ -0,0 +1,254 @@
+import math
+import sqlite3
+import threading
+import time
+from collections import defaultdict, namedtuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from config import Config
+from route_geometry import MEAN_EARTH_RADIUS_KM, haversine_km
+
+Station = namedtuple('Station', 'station_id,category,lat,lng,title')
+
+KM_PER_DEGREE_LAT = 111.32
+# How often stale stations and discover queries are swept out of memory.
+EXPIRE_INTERVAL = 60
+
+
+def _haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * MEAN_EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class GridIndex:
+    def __init__(self, cell_deg: float = 0.1):
+        self.cell_deg = cell_deg
+        self._cells: Dict[Tuple[int, int], List[Tuple[float, float, object]]] = defaultdict(list)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    def add(self, lat: float, lng: float, item) -> None:
+        self._cells[self._cell(lat, lng)].append((lat, lng, item))
+        self._size += 1
+
+    def prune(self, keep: Callable[[object], bool]) -> int:
+        removed = 0
+        for cell, entries in list(self._cells.items()):
+            kept = [entry for entry in entries if keep(entry[2])]
+            removed += len(entries) - len(kept)
+            if kept:
+                self._cells[cell] = kept
+            else:
+                del self._cells[cell]
+        self._size -= removed
+        return removed
+
+    def within(self, point: Tuple[float, float], max_km: float) -> List[Tuple[float, object]]:
+        lat, lng = float(point[0]), float(point[1])
+        lat_cells = int(math.ceil(max_km / (KM_PER_DEGREE_LAT * self.cell_deg)))
+        cos_lat = max(math.cos(math.radians(min(abs(lat) + lat_cells * self.cell_deg, 89.0))), 1e-6)
+        lng_cells = int(math.ceil(max_km / (KM_PER_DEGREE_LAT * cos_lat * self.cell_deg)))
+        row, col = self._cell(lat, lng)
+
+        candidates = []
+        for r in range(row - lat_cells, row + lat_cells + 1):
+            for c in range(col - lng_cells, col + lng_cells + 1):
+                candidates.extend(self._cells.get((r, c), ()))
+        if not candidates:
+            return []
+
+        distances = haversine_km((lat, lng), [(c[0], c[1]) for c in candidates])
+        return sorted(
+            ((float(d), c[2]) for d, c in zip(distances, candidates) if d <= max_km),
+            key=lambda pair: pair[0]
+        )
+
+    def nearest(self, point: Tuple[float, float], max_km: float) -> Optional[Tuple[float, object]]:
+        # Walks outwards one ring of cells at a time and stops once no unvisited cell can hold
+        # anything closer than the best match, so a hit next door costs a handful of cells.
+        lat, lng = float(point[0]), float(point[1])
+        cell_km = KM_PER_DEGREE_LAT * self.cell_deg
+        max_rings = int(math.ceil(max_km / cell_km))
+        cos_lat = max(math.cos(math.radians(min(abs(lat) + max_rings * self.cell_deg, 89.0))), 1e-6)
+        ring_km = cell_km * cos_lat
+        max_rings = int(math.ceil(max_km / ring_km))
+        row, col = self._cell(lat, lng)
+
+        # Candidates are ranked by an equirectangular distance (exact enough at these ranges
+        # and far cheaper); only the winner gets a haversine.
+        cos_point = math.cos(math.radians(lat))
+        limit_sq = (max_km / KM_PER_DEGREE_LAT) ** 2 * 1.01
+        best_sq, best_item = limit_sq, None
+        for ring in range(max_rings + 1):
+            if best_item is not None and ((ring - 1) * ring_km / KM_PER_DEGREE_LAT) ** 2 > best_sq:
+                break
+            for r in range(row - ring, row + ring + 1):
+                edge = r == row - ring or r == row + ring
+                for c in (range(col - ring, col + ring + 1) if edge else (col - ring, col + ring)):
+                    for item_lat, item_lng, item in self._cells.get((r, c), ()):
+                        d_lat = item_lat - lat
+                        d_lng = (item_lng - lng) * cos_point
+                        distance_sq = d_lat * d_lat + d_lng * d_lng
+                        if distance_sq < best_sq:
+                            best_sq, best_item = distance_sq, (item_lat, item_lng, item)
+        if best_item is None:
+            return None
+        distance = _haversine(lat, lng, best_item[0], best_item[1])
+        best = (distance, best_item[2]) if distance <= max_km else None
+        return best
+
+
+class StationIndex:
+    def __init__(self, db_path: str, max_age: float = 0):
+        # Stations and discover queries older than max_age seconds no longer count as
+        # coverage, so the area gets searched again; 0 keeps them forever.
+        self.db_path = db_path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._stations: Dict[str, GridIndex] = defaultdict(GridIndex)
+        # Query items are (nearest_km, queried_at)
+        self._queries: Dict[str, GridIndex] = defaultdict(GridIndex)
+        self._updated_at: Dict[Tuple[str, str], float] = {}
+        self._next_expiry = 0.0
+        self._loaded = False
+
+    def _cutoff(self, now: float) -> float:
+        return now - self.max_age if self.max_age else 0.0
+
+    def _expire(self, now: float) -> None:
+        # Caller holds the lock.
+        if not self.max_age or now < self._next_expiry:
+            return
+        self._next_expiry = now + min(EXPIRE_INTERVAL, self.max_age)
+        cutoff = self._cutoff(now)
+        stale = {key for key, updated_at in self._updated_at.items() if updated_at < cutoff}
+        if stale:
+            for grid in self._stations.values():
+                grid.prune(lambda station: (station.category, station.station_id) not in stale)
+            for key in stale:
+                del self._updated_at[key]
+        for grid in self._queries.values():
+            grid.prune(lambda query: query[1] >= cutoff)
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                with sqlite3.connect(self.db_path) as conn:
+                    c = conn.cursor()
+                    c.execute('''
+                    CREATE TABLE IF NOT EXISTS stations (
+                        category TEXT NOT NULL,
+                        station_id TEXT NOT NULL,
+                        lat REAL NOT NULL,
+                        lng REAL NOT NULL,
+                        title TEXT,
+                        updated_at REAL NOT NULL,
+                        PRIMARY KEY (category, station_id)
+                    )
+                    ''')
+                    c.execute('''
+                    CREATE TABLE IF NOT EXISTS station_queries (
+                        category TEXT NOT NULL,
+                        lat REAL NOT NULL,
+                        lng REAL NOT NULL,
+                        nearest_km REAL,
+                        queried_at REAL NOT NULL
+                    )
+                    ''')
+                    cutoff = self._cutoff(time.time())
+                    c.execute('DELETE FROM stations WHERE updated_at < ?', (cutoff,))
+                    c.execute('DELETE FROM station_queries WHERE queried_at < ?', (cutoff,))
+                    conn.commit()
+                    for category, station_id, lat, lng, title, updated_at in c.execute(
+                            'SELECT category, station_id, lat, lng, title, updated_at FROM stations'):
+                        self._add_station(Station(station_id, category, lat, lng, title), updated_at)
+                    for category, lat, lng, nearest_km, queried_at in c.execute(
+                            'SELECT category, lat, lng, nearest_km, queried_at FROM station_queries'):
+                        self._queries[category].add(lat, lng, (nearest_km, queried_at))
+            except sqlite3.Error as e:
+                print(f"Warning: Station index unavailable at {self.db_path}, using memory only: {e}")
+            self._loaded = True
+
+    def _add_station(self, station: Station, updated_at: float) -> None:
+        # Seeing a known station again only refreshes its timestamp.
+        key = (station.category, station.station_id)
+        if key not in self._updated_at:
+            self._stations[station.category].add(station.lat, station.lng, station)
+        self._updated_at[key] = updated_at
+
+    def nearest_station(self, point: Tuple[float, float], category: str, max_km: float) -> Optional[Station]:
+        self._ensure_loaded()
+        with self._lock:
+            self._expire(time.time())
+            match = self._stations[category].nearest(point, max_km)
+        return match[1] if match else None
+
+    def lookup(self, point: Tuple[float, float], category: str, coverage_km: float) -> Tuple[bool, Optional[Station]]:
+        # (covered, station). Covered means either a known station lies within coverage_km,
+        # or a discover query was already made within coverage_km of this point; in the
+        # latter case the station that query found (if any) is returned. Entries older than
+        # max_age don't count.
+        self._ensure_loaded()
+        with self._lock:
+            self._expire(time.time())
+            match = self._stations[category].nearest(point, coverage_km)
+            if match:
+                return True, match[1]
+            query = self._queries[category].nearest(point, coverage_km)
+            if not query:
+                return False, None
+            query_km, (nearest_km, _) = query
+            if nearest_km is None:
+                return True, None
+            match = self._stations[category].nearest(point, query_km + nearest_km)
+            return True, match[1] if match else None
+
+    def add_discover_items(self, point: Tuple[float, float], category: str, items: Iterable[dict]) -> None:
+        self._ensure_loaded()
+        now = time.time()
+        rows = []
+        positions = []
+        with self._lock:
+            for item in items or []:
+                position = item.get('position') or {}
+                station_id = item.get('id')
+                if not station_id or position.get('lat') is None or position.get('lng') is None:
+                    continue
+                station = Station(station_id, category, float(position['lat']), float(position['lng']), item.get('title'))
+                positions.append((station.lat, station.lng))
+                self._add_station(station, now)
+                rows.append((category, station_id, station.lat, station.lng, station.title, now))
+
+            nearest_km = float(haversine_km(point, positions).min()) if positions else None
+            self._queries[category].add(float(point[0]), float(point[1]), (nearest_km, now))
+
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                c = conn.cursor()
+                c.executemany('INSERT OR REPLACE INTO stations VALUES (?, ?, ?, ?, ?, ?)', rows)
+                c.execute('INSERT INTO station_queries VALUES (?, ?, ?, ?, ?)',
+                          (category, float(point[0]), float(point[1]), nearest_km, now))
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"Warning: Could not persist discover results to {self.db_path}: {e}")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        self._ensure_loaded()
+        with self._lock:
+            return {
+                category: {"stations": len(self._stations[category]), "queries": len(self._queries[category])}
+                for category in set(self._stations) | set(self._queries)
+            }
+
+
+station_index = StationIndex(Config.STATION_DB_PATH, Config.STATION_MAX_AGE_DAYS * 24 * 60 * 60)
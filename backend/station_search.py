@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+from config import Config
+from route_geometry import RouteGeometry
+
+Coords = Tuple[float, float]
+
+MAX_ROUTE_STATIONS = 4
+
+_executor = ThreadPoolExecutor(max_workers=Config.STATION_SEARCH_WORKERS, thread_name_prefix='station-search')
+
+
+def sample_indices(geometry: RouteGeometry, first_km: float, interval_km: float) -> List[int]:
+    distances = [first_km]
+    if interval_km > 0:
+        distance = interval_km
+        while distance < geometry.total_km:
+            distances.append(distance)
+            distance += interval_km
+
+    indices = []
+    for distance in sorted(distances):
+        index = geometry.index_at_distance(distance, start=1)
+        if index is not None and index not in indices:
+            indices.append(index)
+    return indices
+
+
+def find_stations_along_route(
+    geometry: RouteGeometry,
+    lookup: Callable[[Coords], Optional[Coords]],
+    first_km: float,
+    interval_km: float
+) -> List[Coords]:
+    indices = sample_indices(geometry, first_km, interval_km)
+    futures = [_executor.submit(lookup, geometry.point(i)) for i in indices]
+
+    station_coords = []
+    try:
+        for index, future in zip(indices, futures):
+            coords = future.result()
+            if coords and coords not in station_coords:
+                station_coords.append(coords)
+                print(f"Found station near {geometry.point(index)} ({geometry.cumulative_km[index]:.1f} km)")
+    finally:
+        for future in futures:
+            future.cancel()
+    return station_coords
+
+
+def limit_stations(station_coords: List[Coords], max_stations: int = MAX_ROUTE_STATIONS) -> List[Coords]:
+    if len(station_coords) <= max_stations:
+        return station_coords
+    print(f"Limiting stations from {len(station_coords)} to {max_stations}")
+    if len(station_coords) > 2:
+        mid_indices = list(range(1, len(station_coords) - 1))
+        step = max(1, len(mid_indices) // 2)
+        kept_middle = [station_coords[mid_indices[i]] for i in range(0, len(mid_indices), step)][:max_stations - 2]
+        return [station_coords[0]] + kept_middle + [station_coords[-1]]
+    return [station_coords[0], station_coords[-1]]
@@ -0,0 +1,113 @@
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator
+from config import Config
+from metrics import graph_stage_seconds
+from requests.exceptions import HTTPError
+
+_executor = ThreadPoolExecutor(max_workers=Config.STAGE_WORKERS, thread_name_prefix='stage')
+
+
+class AbortRequest(Exception):
+    # Raised by a stage to end the request with a client-facing error instead of a 500.
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    return isinstance(exc, HTTPError) and exc.response is not None and exc.response.status_code == 429
+
+
+def error_body(exc: BaseException) -> Dict[str, Any]:
+    # The error body a route endpoint returns for a failed request.
+    if isinstance(exc, AbortRequest):
+        return {"success": False, "error": exc.message}
+    if is_rate_limited(exc):
+        return {"success": False, "error_type": "RATE_LIMIT_EXCEEDED", "message": "Too many API requests"}
+    return {"success": False, "error": f"An unexpected error occurred: {str(exc)}"}
+
+
+def _timed(fn: Callable, kwargs: Dict[str, Any]):
+    start = time.perf_counter()
+    result = fn(**kwargs)
+    return result, time.perf_counter() - start
+
+
+class TaskGraph:
+    # Stages declare the names of the stages they depend on; each stage function is called
+    # with those results as keyword arguments once they are all available. Independent
+    # stages run concurrently on the shared stage pool, inside a copy of the caller's
+    # context so flask.request / flask.g stay usable.
+    def __init__(self, name: str = 'graph'):
+        self.name = name
+        self._stages: Dict[str, Callable] = {}
+        self._deps: Dict[str, tuple] = {}
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, float] = {}
+
+    def add(self, name: str, fn: Callable, deps: Iterable[str] = ()) -> 'TaskGraph':
+        if name in self._stages:
+            raise ValueError(f"Duplicate stage '{name}' in {self.name}")
+        self._stages[name] = fn
+        self._deps[name] = tuple(deps)
+        return self
+
+    def run(self) -> Dict[str, Any]:
+        for _ in self.iter_run():
+            pass
+        return self.results
+
+    def iter_run(self) -> Iterator[str]:
+        # Same as run(), yielding each stage's name as soon as its result is in self.results.
+        for name, deps in self._deps.items():
+            missing = [dep for dep in deps if dep not in self._stages]
+            if missing:
+                raise ValueError(f"Stage '{name}' in {self.name} depends on unknown stages {missing}")
+
+        pending = dict(self._stages)
+        running = {}
+        errors = []
+        completed = []
+
+        while pending or running:
+            if not errors:
+                ready = [name for name in pending if all(dep in self.results for dep in self._deps[name])]
+                for name in ready:
+                    fn = pending.pop(name)
+                    kwargs = {dep: self.results[dep] for dep in self._deps[name]}
+                    ctx = contextvars.copy_context()
+                    running[_executor.submit(ctx.run, _timed, fn, kwargs)] = name
+                # Stages unblocked by the last completions are already running while the caller
+                # handles them.
+                yield from completed
+                completed.clear()
+
+            if not running:
+                if pending and not errors:
+                    raise ValueError(f"Stages {list(pending)} in {self.name} can never run (dependency cycle)")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    self.results[name], self.timings[name] = future.result()
+                except BaseException as exc:
+                    errors.append(exc)
+                    continue
+                graph_stage_seconds.observe(self.timings[name], graph=self.name, stage=name)
+                completed.append(name)
+
+            if errors:
+                # Stages already running finish in the background; nothing new is started.
+                pending.clear()
+                for future in running:
+                    future.cancel()
+                running.clear()
+
+        if errors:
+            raise next((exc for exc in errors if is_rate_limited(exc)), errors[0])
+        yield from completed
@@ -1,30 +1,36 @@
-import requests
+import http_client
 import re
 from typing import Tuple, List
 from datetime import datetime
+from collections import namedtuple
+from flask import g, has_app_context
 from config import Config
+from weather import get_forecast_days
+from geocode_cache import cached_geocode, GeocodeNotFound
+from route_store import route_store
+from metrics import stage_timer
 from requests.exceptions import HTTPError, RequestException
 
 GEOCODING_API_URL = "https://geocode.maps.co/search"
 MAPBOX_DIRECTIONS_API_URL = "https://api.mapbox.com/directions/v5/mapbox/driving-traffic/"
-WEATHER_API_URL = "http://api.weatherapi.com/v1/forecast.json"
 
 MAPBOX_ACCESS_TOKEN = Config.MAPBOX_TOKEN
 geocoding_api = Config.GEOCODING_API_KEY
 
 
+@cached_geocode('maps_co', empty=(None, None))
 def get_coordinates(place_name: str) -> Tuple[float, float]:
     params = {
         "q": f"{place_name}",
         "api_key": geocoding_api
     }
     try:
-        response = requests.get(GEOCODING_API_URL, params=params)
+        response = http_client.get(GEOCODING_API_URL, params=params)
         response.raise_for_status()
         data = response.json()
         if not data:
              print(f"Error: No data received from geocoding API for {place_name}")
-             return None, None
+             raise GeocodeNotFound(place_name)
         if isinstance(data, list) and data:
              max_importance_place = max(data, key=lambda place: place.get('importance', 0))
              coords = (float(max_importance_place['lat']), float(max_importance_place['lon']))
@@ -46,141 +52,150 @@ def get_coordinates(place_name: str) -> Tuple[float, float]:
         return None, None
 
 
-def calculate_distances(start_coords: Tuple[float, float], end_coords: Tuple[float, float]) -> Tuple[float, float]:
-    if start_coords is None or end_coords is None or start_coords[0] is None or start_coords[1] is None or end_coords[0] is None or end_coords[1] is None:
-        print("Error: Invalid start or end coordinates provided for distance calculation.")
-        return 0.0, 0.0
+RouteAnalysis = namedtuple('RouteAnalysis', 'city_distance,highway_distance,weather_coordinates,traffic_delay')
+
+EMPTY_ROUTE_ANALYSIS = RouteAnalysis(0.0, 0.0, [], 0.0)
+
 
+def _split_city_highway(route_data) -> Tuple[float, float]:
     city_distance_m = 0
     highway_distance_m = 0
     highway_pattern = re.compile(r'\b[ABM]\d+\b', re.IGNORECASE)
 
-    params = {
-        "access_token": MAPBOX_ACCESS_TOKEN,
-        "alternatives": "false",
-        "geometries": "geojson",
-        "language": "en",
-        "overview": "simplified",
-        "steps": "true",
-        "notifications": "none",
-    }
+    for route in route_data["routes"]:
+         if not route.get("legs"): continue
+         for leg in route["legs"]:
+             if not leg.get("steps"): continue
+             for step in leg["steps"]:
+                 if "maneuver" not in step or "instruction" not in step["maneuver"] or "distance" not in step:
+                     continue
 
-    start_lat, start_lon = start_coords
-    end_lat, end_lon = end_coords
-    url = f"{MAPBOX_DIRECTIONS_API_URL}{start_lon},{start_lat};{end_lon},{end_lat}"
+                 instruction = step["maneuver"]["instruction"]
+                 distance_m = step["distance"]
+                 name = step.get("name", "")
 
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        route_data = response.json()
+                 is_highway = False
+                 if highway_pattern.search(name) or highway_pattern.search(step.get('ref', '')):
+                     is_highway = True
+                 elif 'motorway' in instruction.lower():
+                     is_highway = True
+                 if is_highway:
+                     highway_distance_m += distance_m
+                 else:
+                     city_distance_m += distance_m
 
-        if not route_data.get("routes"):
-             print("Error: No routes found between the specified coordinates.")
-             return 0.0, 0.0
-
-        for route in route_data["routes"]:
-             if not route.get("legs"): continue
-             for leg in route["legs"]:
-                 if not leg.get("steps"): continue
-                 for step in leg["steps"]:
-                     if "maneuver" not in step or "instruction" not in step["maneuver"] or "distance" not in step:
-                         continue
-
-                     instruction = step["maneuver"]["instruction"]
-                     distance_m = step["distance"]
-                     name = step.get("name", "")
-
-                     is_highway = False
-                     if highway_pattern.search(name) or highway_pattern.search(step.get('ref', '')):
-                         is_highway = True
-                     elif 'motorway' in instruction.lower():
-                         is_highway = True
-                     if is_highway:
-                         highway_distance_m += distance_m
-                     else:
-                         city_distance_m += distance_m
-
-        m_to_mi = 0.000621371
-        city_distance_mi = city_distance_m * m_to_mi
-        highway_distance_mi = highway_distance_m * m_to_mi
-        return city_distance_mi, highway_distance_mi
-    except HTTPError as http_err:
-        if http_err.response is not None and http_err.response.status_code == 429:
-            raise
-        else:
-            print(f"Error calculating distances (HTTPError): {http_err}")
-            return 0.0, 0.0
-    except RequestException as e:
-        print(f"Error calculating distances (RequestException): {e}")
-        return 0.0, 0.0
-    except (KeyError, ValueError, TypeError) as e:
-        print(f"Error processing distance data: {e}")
-        return 0.0, 0.0
+    m_to_mi = 0.000621371
+    return city_distance_m * m_to_mi, highway_distance_m * m_to_mi
 
 
-def get_route_traffic_data(start_coords: Tuple[float, float], end_coords: Tuple[float, float]) -> Tuple[List[Tuple[float, float]], float]:
-    if start_coords is None or end_coords is None or start_coords[0] is None or start_coords[1] is None or end_coords[0] is None or end_coords[1] is None:
-        print("Error: Invalid coordinates for traffic data.")
-        return [], 0.0
+def _sample_weather_coordinates(route, target_points: int = 15) -> List[Tuple[float, float]]:
+    all_coords = route.get("geometry", {}).get("coordinates") or []
+    if not all_coords:
+        return []
+    num_coords = len(all_coords)
+    step = max(1, num_coords // target_points)
 
-    traffic_delay = 0
-    coordinates_list = []
+    sampled_indices = list(range(0, num_coords, step))
+    if sampled_indices[-1] != num_coords - 1:
+        sampled_indices.append(num_coords - 1)
+    return [(all_coords[i][1], all_coords[i][0]) for i in sampled_indices]
+
+
+def fetch_route_analysis(start_coords: Tuple[float, float], end_coords: Tuple[float, float]) -> RouteAnalysis:
+    if start_coords is None or end_coords is None or start_coords[0] is None or start_coords[1] is None or end_coords[0] is None or end_coords[1] is None:
+        print("Error: Invalid start or end coordinates provided for route analysis.")
+        return EMPTY_ROUTE_ANALYSIS
 
     params = {
         "access_token": MAPBOX_ACCESS_TOKEN,
+        "alternatives": "false",
         "geometries": "geojson",
+        "language": "en",
+        "overview": "full",
         "steps": "true",
-        "overview": "full"
+        "notifications": "none",
     }
+    # Warmed depot pairs have the split and weather points stored; only traffic is fetched live.
+    stored = route_store.get('analysis', start_coords, end_coords)
+    if stored is not None:
+        params.update(overview="false", steps="false")
 
     start_lat, start_lon = start_coords
     end_lat, end_lon = end_coords
     url = f"{MAPBOX_DIRECTIONS_API_URL}{start_lon},{start_lat};{end_lon},{end_lat}"
 
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-
-        if not data.get("routes") or not data["routes"][0].get("geometry") or not data["routes"][0]["geometry"].get("coordinates"):
-             print("Error: Route geometry not found in Mapbox response.")
-             return [], 0.0
-
-        all_coords = data["routes"][0]["geometry"]["coordinates"]
-        if not all_coords:
-             return [], 0.0
-        num_coords = len(all_coords)
-        target_points = 15
-        step = max(1, num_coords // target_points)
-
-        sampled_indices = list(range(0, num_coords, step))
-        if num_coords - 1 not in sampled_indices:
-            sampled_indices.append(num_coords - 1)
-
-        coordinates_list = [(coord[1], coord[0]) for i, coord in enumerate(all_coords) if i in sampled_indices]
+        # One Mapbox call returns both; it is timed as traffic since that is the part still
+        # fetched for warmed pairs.
+        with stage_timer('traffic'):
+            response = http_client.get(url, params=params, timeout=15)
+            response.raise_for_status()
+            route_data = response.json()
 
-        duration_typical = data['routes'][0].get('duration_typical')
-        actual_duration = data['routes'][0].get('duration')
+        if not route_data.get("routes"):
+             print("Error: No routes found between the specified coordinates.")
+             return EMPTY_ROUTE_ANALYSIS
 
+        route = route_data["routes"][0]
+        duration_typical = route.get('duration_typical')
+        actual_duration = route.get('duration')
         if duration_typical is not None and actual_duration is not None:
             traffic_delay = max(0, actual_duration - duration_typical) / 60
         else:
             traffic_delay = 0
 
-        return coordinates_list, traffic_delay
+        if stored is not None:
+            return RouteAnalysis(stored["city_distance"], stored["highway_distance"],
+                                 [tuple(point) for point in stored["weather_coordinates"]], traffic_delay)
+
+        with stage_timer('distance_split'):
+            city_distance_mi, highway_distance_mi = _split_city_highway(route_data)
+            coordinates_list = _sample_weather_coordinates(route)
+        if not coordinates_list:
+             print("Error: Route geometry not found in Mapbox response.")
+        else:
+             route_store.record('analysis', start_coords, end_coords, {
+                 "city_distance": city_distance_mi, "highway_distance": highway_distance_mi,
+                 "weather_coordinates": coordinates_list,
+             })
+
+        return RouteAnalysis(city_distance_mi, highway_distance_mi, coordinates_list, traffic_delay)
     except HTTPError as http_err:
         if http_err.response is not None and http_err.response.status_code == 429:
             raise
         else:
-            print(f"Error retrieving route traffic data (HTTPError): {http_err}")
-            return [], 0.0
+            print(f"Error retrieving route analysis (HTTPError): {http_err}")
+            return EMPTY_ROUTE_ANALYSIS
     except RequestException as e:
-        print(f"Error retrieving route traffic data (RequestException): {e}")
-        return [], 0.0
+        print(f"Error retrieving route analysis (RequestException): {e}")
+        return EMPTY_ROUTE_ANALYSIS
     except (KeyError, ValueError, IndexError, TypeError) as e:
-        print(f"Error processing route traffic data: {e}")
-        return [], 0.0
+        print(f"Error processing route analysis data: {e}")
+        return EMPTY_ROUTE_ANALYSIS
+
 
+def get_route_analysis(start_coords: Tuple[float, float], end_coords: Tuple[float, float]) -> RouteAnalysis:
+    # One Mapbox directions call per origin/destination for the lifetime of the request.
+    if not has_app_context():
+        return fetch_route_analysis(start_coords, end_coords)
+
+    memo = g.setdefault('route_analysis', {})
+    key = (tuple(start_coords or ()), tuple(end_coords or ()))
+    if key not in memo:
+        memo[key] = fetch_route_analysis(start_coords, end_coords)
+    return memo[key]
+
+
+def calculate_distances(start_coords: Tuple[float, float], end_coords: Tuple[float, float]) -> Tuple[float, float]:
+    analysis = get_route_analysis(start_coords, end_coords)
+    return analysis.city_distance, analysis.highway_distance
+
+
+def get_route_traffic_data(start_coords: Tuple[float, float], end_coords: Tuple[float, float]) -> Tuple[List[Tuple[float, float]], float]:
+    analysis = get_route_analysis(start_coords, end_coords)
+    return analysis.weather_coordinates, analysis.traffic_delay
+
+@stage_timer('weather')
 def get_weather_data(api_key: str, coordinates_list: List[Tuple[float, float]], target_date: str) -> Tuple[float, str, str]:
     if not api_key or not coordinates_list or not target_date:
         print("Error: Missing API key, coordinates, or target date for weather data.")
@@ -197,68 +212,40 @@ def get_weather_data(api_key: str, coordinates_list: List[Tuple[float, float]],
         print(f"Error: Invalid target date format: {target_date}. Use YYYY-MM-DD.")
         return 0.0, "Low", "Low"
 
+    valid_pairs = []
     for lat, lon in coordinates_list:
         if lat is None or lon is None:
              print("Warning: Skipping invalid coordinate pair (None) for weather check.")
              continue
+        valid_pairs.append((lat, lon))
 
-        params = {
-            "key": api_key,
-            "q": f"{lat},{lon}",
-            "days": 4,
-            "aqi": "no",
-            "alerts": "no"
-        }
-
-        try:
-            response = requests.get(WEATHER_API_URL, params=params)
-            response.raise_for_status()
-            weather_data = response.json()
-
-            if not weather_data.get('forecast', {}).get('forecastday'):
-                print(f"Warning: No forecast data found for {lat}, {lon}")
-                continue
-
-            forecast_days = weather_data['forecast']['forecastday']
-
-            found_date = False
-            for day in forecast_days:
-                 date_str = day.get('date')
-                 if not date_str: continue
-                 try:
-                     date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-                 except ValueError:
-                     continue
-
-                 if date_obj == target_date_obj:
-                     day_data = day.get('day', {})
-                     if not day_data: continue
-
-                     temperature = day_data.get('avgtemp_c', 0.0)
-                     snow_cm = day_data.get('totalsnow_cm', 0.0)
-                     rain_mm = day_data.get('totalprecip_mm', 0.0)
-                     visibility = day_data.get('avgvis_km', 0.0)
-
-                     if isinstance(temperature, (int, float)): temperature_sum += temperature
-                     if isinstance(snow_cm, (int, float)): snow_sum += snow_cm
-                     if isinstance(rain_mm, (int, float)): rain_sum += rain_mm
-                     if isinstance(visibility, (int, float)): visibility_sum += visibility
-
-                     valid_coordinates += 1
-                     found_date = True
-                     break
-        except HTTPError as http_err:
-            if http_err.response is not None and http_err.response.status_code == 429:
-                raise
-            else:
-                print(f"Error retrieving weather data for {lat}, {lon} (HTTPError): {http_err}")
-                continue
-        except RequestException as e:
-            print(f"Error retrieving weather data for {lat}, {lon} (RequestException): {e}")
-            continue
-        except (KeyError, ValueError, TypeError) as e:
-            print(f"Error processing weather data for {lat}, {lon}: {e}")
+    for forecast_days in get_forecast_days(api_key, valid_pairs):
+        if not forecast_days:
             continue
+        for day in forecast_days:
+             date_str = day.get('date')
+             if not date_str: continue
+             try:
+                 date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
+             except ValueError:
+                 continue
+
+             if date_obj == target_date_obj:
+                 day_data = day.get('day', {})
+                 if not day_data: continue
+
+                 temperature = day_data.get('avgtemp_c', 0.0)
+                 snow_cm = day_data.get('totalsnow_cm', 0.0)
+                 rain_mm = day_data.get('totalprecip_mm', 0.0)
+                 visibility = day_data.get('avgvis_km', 0.0)
+
+                 if isinstance(temperature, (int, float)): temperature_sum += temperature
+                 if isinstance(snow_cm, (int, float)): snow_sum += snow_cm
+                 if isinstance(rain_mm, (int, float)): rain_sum += rain_mm
+                 if isinstance(visibility, (int, float)): visibility_sum += visibility
+
+                 valid_coordinates += 1
+                 break
 
     if valid_coordinates > 0:
         average_temperature = temperature_sum / valid_coordinates
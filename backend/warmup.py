@@ -0,0 +1,104 @@
+import argparse
+import itertools
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+from config import Config
+from route_store import route_store
+from tracking import get_route_analysis
+import diesel_api
+import electric_api
+import hydrogen_api
+
+# Precomputes and persists the static part of every depot-to-depot route: HERE polylines
+# (direct and per leg), fuel and charging stops, the Mapbox city/highway split and the
+# weather sample points. Run `python warmup.py` after a deploy, or set WARMUP_ON_START.
+
+DEPOTS = list(diesel_api.origin_encoded)
+
+
+def depot_pairs(depots: Sequence[str] = DEPOTS) -> List[Tuple[str, str]]:
+    return list(itertools.permutations(depots, 2))
+
+
+def is_warm(origin: str, destination: str) -> bool:
+    origin_coords = diesel_api.geocode_depot(origin, "origin")
+    destination_coords = diesel_api.geocode_depot(destination, "destination")
+    return all(route_store.get(kind, origin_coords, destination_coords) is not None
+               for kind in ('stops:fuel', 'stops:charging', 'analysis'))
+
+
+def warm_pair(origin: str, destination: str) -> None:
+    with route_store.recording():
+        # Diesel and electric geocode depots through HERE.
+        origin_coords = diesel_api.geocode_depot(origin, "origin")
+        destination_coords = diesel_api.geocode_depot(destination, "destination")
+        diesel_stations = diesel_api.find_route_stations(origin_coords, destination_coords)
+        diesel_api.route_through_stations(origin_coords, destination_coords, *diesel_stations)
+        electric_stations = electric_api.find_route_stations(origin_coords, destination_coords)
+        electric_api.route_through_stations(origin_coords, destination_coords, *electric_stations)
+        get_route_analysis(origin_coords, destination_coords)
+
+        # Hydrogen geocodes through geocode.maps.co (analysis) and Nominatim (map route).
+        h2_origin = hydrogen_api.resolve_destination(origin)
+        h2_destination = hydrogen_api.resolve_destination(destination)
+        get_route_analysis(h2_origin, h2_destination)
+        map_destination = hydrogen_api.resolve_map_destination(destination)
+        if map_destination:
+            hydrogen_api.route_via_best_station(h2_origin, map_destination)
+            hydrogen_api.direct_route(h2_origin, map_destination)
+
+
+def warm_all(pairs: Optional[Sequence[Tuple[str, str]]] = None, force: bool = False,
+             workers: int = Config.WARMUP_WORKERS) -> Dict[str, list]:
+    pairs = list(pairs) if pairs is not None else depot_pairs()
+    summary = {"warmed": [], "skipped": [], "failed": []}
+    lock = threading.Lock()
+
+    def run(pair):
+        start = time.perf_counter()
+        try:
+            if not force and is_warm(*pair):
+                outcome = "skipped"
+            else:
+                warm_pair(*pair)
+                outcome = "warmed"
+        except Exception as e:
+            print(f"[WARMUP] {pair[0]} -> {pair[1]} failed: {e}\n{traceback.format_exc()}")
+            outcome = "failed"
+        print(f"[WARMUP] {pair[0]} -> {pair[1]}: {outcome} in {time.perf_counter() - start:.2f}s")
+        with lock:
+            summary[outcome].append(pair)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='warmup') as executor:
+        list(executor.map(run, pairs))
+    print(f"[WARMUP] {len(summary['warmed'])} warmed, {len(summary['skipped'])} already warm, "
+          f"{len(summary['failed'])} failed in {time.perf_counter() - start:.1f}s")
+    return summary
+
+
+def start_background() -> threading.Thread:
+    thread = threading.Thread(target=warm_all, name='warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def parse_pair(value: str) -> Tuple[str, str]:
+    origin, sep, destination = value.partition(':')
+    if not sep or origin not in DEPOTS or destination not in DEPOTS:
+        raise argparse.ArgumentTypeError(f"expected ORIGIN:DESTINATION with depots from {', '.join(DEPOTS)}")
+    return origin, destination
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute and persist static route data for every depot pair.")
+    parser.add_argument('--force', action='store_true', help="refetch pairs that are already stored")
+    parser.add_argument('--workers', type=int, default=Config.WARMUP_WORKERS, help="pairs warmed concurrently")
+    parser.add_argument('--pair', dest='pairs', action='append', type=parse_pair,
+                        help="ORIGIN:DESTINATION to warm (repeatable); default is all depot pairs")
+    args = parser.parse_args()
+    result = warm_all(args.pairs, force=args.force, workers=args.workers)
+    raise SystemExit(1 if result["failed"] else 0)
@@ -0,0 +1,113 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+import http_client
+from config import Config
+from requests.exceptions import HTTPError, RequestException
+
+WEATHER_API_URL = "http://api.weatherapi.com/v1/forecast.json"
+FORECAST_DAYS = 4
+
+Cell = Tuple[float, float]
+
+_executor = ThreadPoolExecutor(max_workers=Config.WEATHER_MAX_WORKERS, thread_name_prefix='weather')
+
+
+def snap_to_cell(lat: float, lon: float, cell_deg: float = Config.WEATHER_CELL_DEG) -> Cell:
+    # Centre of the grid cell containing the point; every point in the cell shares one forecast.
+    return (
+        round((math.floor(lat / cell_deg) + 0.5) * cell_deg, 6),
+        round((math.floor(lon / cell_deg) + 0.5) * cell_deg, 6),
+    )
+
+
+def next_refresh(now: float, period: float = Config.WEATHER_REFRESH_SECONDS) -> float:
+    # Forecasts are replaced on a fixed cadence, so entries expire at the next boundary
+    # rather than a fixed age after they were fetched.
+    return (math.floor(now / period) + 1) * period
+
+
+class ForecastCache:
+    def __init__(self):
+        self._entries: Dict[Cell, Tuple[list, float]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cell: Cell) -> Optional[list]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(cell)
+            if entry is None or entry[1] <= now:
+                self._entries.pop(cell, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def put(self, cell: Cell, forecast_days: list) -> None:
+        with self._lock:
+            self._entries[cell] = (forecast_days, next_refresh(time.time()))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "cells": len(self._entries)}
+
+
+forecast_cache = ForecastCache()
+
+
+def fetch_forecast_days(api_key: str, cell: Cell) -> Optional[list]:
+    lat, lon = cell
+    params = {
+        "key": api_key,
+        "q": f"{lat},{lon}",
+        "days": FORECAST_DAYS,
+        "aqi": "no",
+        "alerts": "no"
+    }
+    try:
+        response = http_client.get(WEATHER_API_URL, params=params, timeout=10)
+        response.raise_for_status()
+        weather_data = response.json()
+        forecast_days = weather_data.get('forecast', {}).get('forecastday')
+        if not forecast_days:
+            print(f"Warning: No forecast data found for {lat}, {lon}")
+            return None
+        forecast_cache.put(cell, forecast_days)
+        return forecast_days
+    except HTTPError as http_err:
+        if http_err.response is not None and http_err.response.status_code == 429:
+            raise
+        else:
+            print(f"Error retrieving weather data for {lat}, {lon} (HTTPError): {http_err}")
+            return None
+    except RequestException as e:
+        print(f"Error retrieving weather data for {lat}, {lon} (RequestException): {e}")
+        return None
+    except (KeyError, ValueError, TypeError, AttributeError) as e:
+        print(f"Error processing weather data for {lat}, {lon}: {e}")
+        return None
+
+
+def get_forecast_days(api_key: str, coordinates: Sequence[Tuple[float, float]]) -> List[Optional[list]]:
+    # Returns the 4-day forecast for each (lat, lon) in order; None where unavailable.
+    cells = [snap_to_cell(lat, lon) for lat, lon in coordinates]
+
+    forecasts: Dict[Cell, Optional[list]] = {}
+    for cell in cells:
+        if cell not in forecasts:
+            forecasts[cell] = forecast_cache.get(cell)
+
+    missing = [cell for cell, forecast in forecasts.items() if forecast is None]
+    futures = {cell: _executor.submit(fetch_forecast_days, api_key, cell) for cell in missing}
+    try:
+        for cell, future in futures.items():
+            forecasts[cell] = future.result()
+    finally:
+        for future in futures.values():
+            future.cancel()
+
+    return [forecasts[cell] for cell in cells]